@@ -1,141 +1,395 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, abort, g, has_request_context
 from flask_cors import CORS
 import os
-import base64
-import cv2
-import numpy as np
 import face_recognition
-import mysql.connector
-from mysql.connector import Error
-import bcrypt
 from datetime import datetime
 import logging
+import time
+import zipfile
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
+from database import DatabaseManager
+from face_gallery import FaceGallery
+from gallery_sync import GallerySync, record_changes
+from face_index import PQIndex, create_index, load_index
+from face_encoder import decode_data_url, detect_and_encode, warm_up, DETECTION_MAX_DIMENSION, MAX_IMAGE_DIMENSION
+from encoding_cache import EncodingCache, create_store
+from encoding_engine import EncodingEngine, EngineBusyError, EncodingTimeoutError
+from encoding_codec import encode_encoding, decode_encoding
+from batch_enrollment import BatchEnroller, MemoryImages, ZipImages, read_manifest
+from metrics import MetricsRegistry, server_timing
+from password_hasher import PasswordHasher
+from shard_index import ShardedIndex
+from warmup import WarmUp
+
 # Charger les variables d'environnement
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
 
-# Configuration de la base de données
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'user': os.getenv('DB_USER', 'root'),
-    'password': os.getenv('DB_PASSWORD', ''),
-    'database': os.getenv('DB_NAME', 'face_recognition_db'),
-    'charset': 'utf8mb4'
-}
+# Taille maximale d'une image envoyée à /api/register ou /api/login
+MAX_UPLOAD_SIZE_MB = float(os.getenv('MAX_UPLOAD_SIZE_MB', 10))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_SIZE_MB * 1024 * 1024)
+
+# Types de contenu acceptés pour une image envoyée en corps binaire brut
+RAW_IMAGE_TYPES = ('application/octet-stream', 'image/jpeg', 'image/png')
+
+# Seuil de distance pour accepter une correspondance faciale
+FACE_TOLERANCE = float(os.getenv('FACE_TOLERANCE', 0.6))
+
+# Index de recherche de la galerie : 'exact', 'ivf' (approximatif, pour les très grandes galeries),
+# 'sq8' ou 'pq' (encodages compressés en mémoire, décisions identiques à la recherche exacte),
+# 'sharded' (recherche exacte répartie entre plusieurs processus)
+FACE_INDEX = os.getenv('FACE_INDEX', 'exact').lower()
+FACE_INDEX_LISTS = int(os.getenv('FACE_INDEX_LISTS') or 0) or None
+FACE_INDEX_NPROBE = int(os.getenv('FACE_INDEX_NPROBE', 8))
+FACE_INDEX_PATH = os.getenv('FACE_INDEX_PATH', '')
+# Index compressés : candidats re-classés en float32 au minimum, sous-vecteurs de l'index PQ
+FACE_INDEX_RERANK = int(os.getenv('FACE_INDEX_RERANK', 32))
+FACE_INDEX_PQ_M = int(os.getenv('FACE_INDEX_PQ_M', 16))
+# Index réparti : processus de recherche par worker (0 = un par cœur) et répertoire de leurs segments
+FACE_INDEX_SHARDS = int(os.getenv('FACE_INDEX_SHARDS', 0)) or None
+FACE_INDEX_SHARD_DIR = os.getenv('FACE_INDEX_SHARD_DIR', '') or None
+# Taille minimale de galerie avant d'entraîner l'index IVF (en dessous, recherche exhaustive)
+FACE_INDEX_MIN_TRAIN = int(os.getenv('FACE_INDEX_MIN_TRAIN', 10000))
+
+# Cache des résultats d'encodage : none, memory, file (partagé entre processus) ou redis
+ENCODING_CACHE = os.getenv('ENCODING_CACHE', 'memory')
+ENCODING_CACHE_SIZE = int(os.getenv('ENCODING_CACHE_SIZE', 1024))
+ENCODING_CACHE_TTL = float(os.getenv('ENCODING_CACHE_TTL', 300))
+ENCODING_CACHE_PATH = os.getenv('ENCODING_CACHE_PATH', 'encoding_cache')
+ENCODING_CACHE_REDIS_URL = os.getenv('ENCODING_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+# Connexion par rafale : images par requête, distance d'arrêt anticipé, images encodées en parallèle
+LOGIN_MAX_FRAMES = int(os.getenv('LOGIN_MAX_FRAMES', 5))
+LOGIN_CONFIDENT_DISTANCE = float(os.getenv('LOGIN_CONFIDENT_DISTANCE', 0.45))
+LOGIN_BURST_PARALLEL = int(os.getenv('LOGIN_BURST_PARALLEL', 2))
+
+# Notation des utilisateurs à plusieurs échantillons : min (plus proche échantillon) ou centroid
+FACE_MATCH_MODE = os.getenv('FACE_MATCH_MODE', 'min').lower()
+# Nombre maximal d'échantillons de visage par utilisateur
+MAX_FACE_SAMPLES = int(os.getenv('MAX_FACE_SAMPLES', 10))
+
+# Fichier de galerie binaire projeté en mémoire au démarrage (vide = lecture de la base)
+GALLERY_FILE = os.getenv('GALLERY_FILE', '')
+
+# Synchronisation de la galerie entre workers : intervalle d'interrogation du journal (s, 0 = désactivée)
+GALLERY_SYNC_INTERVAL = float(os.getenv('GALLERY_SYNC_INTERVAL', 1))
+# Attente maximale d'un changement dont l'identifiant n'est pas encore validé (s)
+GALLERY_SYNC_GAP_TIMEOUT = float(os.getenv('GALLERY_SYNC_GAP_TIMEOUT', 60))
+
+# Type des composantes stockées en base (float32: 516 octets, float64: 1028 octets)
+ENCODING_STORAGE_DTYPE = os.getenv('ENCODING_STORAGE_DTYPE', 'float32')
+
+# Moteur d'encodage : nombre de processus (0 = encodage sur le thread de la requête)
+ENCODING_WORKERS = int(os.getenv('ENCODING_WORKERS') or os.cpu_count() or 1)
+ENCODING_QUEUE_SIZE = int(os.getenv('ENCODING_QUEUE_SIZE', 0)) or None
+ENCODING_TIMEOUT = float(os.getenv('ENCODING_TIMEOUT', 30))
+ENCODING_RETRY_AFTER = int(os.getenv('ENCODING_RETRY_AFTER', 1))
+
+# Nombre d'utilisateurs écrits par transaction lors des inscriptions en masse
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', 500))
+
+# Coût bcrypt (2^n itérations) ; un hachage d'un autre coût est recalculé à la vérification suivante
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+# Threads de hachage bcrypt et hachages en cours/en attente avant de répondre 503
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE') or 0) or None
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class DatabaseManager:
-    def __init__(self):
-        self.connection = None
-        self.connect()
-        self.create_tables()
-    
-    def connect(self):
-        """Établir la connexion à la base de données"""
-        try:
-            self.connection = mysql.connector.connect(**DB_CONFIG)
-            logger.info("Connexion à la base de données établie")
-        except Error as e:
-            logger.error(f"Erreur de connexion à la base de données: {e}")
-            raise
-    
-    def create_tables(self):
-        """Créer les tables nécessaires"""
+# Préchauffage en arrière-plan : le serveur répond (vivant) avant d'être prêt
+WARMUP_BACKGROUND = os.getenv('WARMUP_BACKGROUND', 'true').lower() == 'true'
+
+# Étapes du démarrage chronométrées, exposées par /api/health
+warmup = WarmUp()
+
+# Instance globale du gestionnaire de base de données
+with warmup.step('database'):
+    db_manager = DatabaseManager()
+
+def create_face_index():
+    """Créer l'index de la galerie, en reprenant les centroïdes IVF ou dictionnaires PQ enregistrés"""
+    if FACE_INDEX in ('ivf', 'pq') and FACE_INDEX_PATH and os.path.exists(FACE_INDEX_PATH):
+        index = load_index(FACE_INDEX_PATH)
+        if FACE_INDEX == 'ivf':
+            index.n_probe = FACE_INDEX_NPROBE
+        else:
+            index.rerank, index.radius = FACE_INDEX_RERANK, FACE_TOLERANCE
+        return index
+    if FACE_INDEX == 'ivf':
+        return create_index('ivf', n_lists=FACE_INDEX_LISTS, n_probe=FACE_INDEX_NPROBE)
+    if FACE_INDEX == 'pq':
+        return create_index('pq', m=FACE_INDEX_PQ_M, rerank=FACE_INDEX_RERANK, radius=FACE_TOLERANCE)
+    if FACE_INDEX == 'sq8':
+        return create_index('sq8', rerank=FACE_INDEX_RERANK, radius=FACE_TOLERANCE)
+    if FACE_INDEX == 'sharded':
+        return ShardedIndex(shards=FACE_INDEX_SHARDS, directory=FACE_INDEX_SHARD_DIR)
+    return create_index(FACE_INDEX)
+
+# Galerie des encodages chargée une seule fois au démarrage
+face_gallery = FaceGallery(create_face_index(), match_mode=FACE_MATCH_MODE)
+if FACE_INDEX in ('sq8', 'pq') and not GALLERY_FILE:
+    logger.warning(f"FACE_INDEX={FACE_INDEX} sans GALLERY_FILE : les vecteurs float32 restent en mémoire "
+                   "en plus des codes compressés")
+
+# Changements faits par les autres workers, appliqués par delta
+gallery_sync = GallerySync(
+    db_manager, face_gallery,
+    interval=GALLERY_SYNC_INTERVAL,
+    gap_timeout=GALLERY_SYNC_GAP_TIMEOUT
+)
+
+def gallery_stamp():
+    """Empreinte de la table des encodages, pour savoir si le fichier de galerie est à jour"""
+    with db_manager.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*), MAX(id) FROM face_encodings")
+        count, max_id = cursor.fetchone()
+    return {'count': int(count), 'max_id': int(max_id or 0)}
+
+def load_face_gallery():
+    """Charger tous les encodages dans la galerie en mémoire
+
+    Avec GALLERY_FILE, la galerie est projetée en mémoire depuis le fichier
+    binaire s'il correspond encore à la base, et réécrite sinon.
+    """
+    # Version lue avant le chargement : un changement concurrent sera réappliqué
+    version = gallery_sync.latest_version()
+    stamp = gallery_stamp() if GALLERY_FILE else None
+    if GALLERY_FILE and os.path.exists(GALLERY_FILE):
         try:
-            cursor = self.connection.cursor()
-            
-            # Table des utilisateurs
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    email VARCHAR(100) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Table des encodages faciaux
+            file_stamp = face_gallery.open(GALLERY_FILE)
+        except ValueError as e:
+            logger.warning(f"Fichier de galerie ignoré: {e}")
+            file_stamp = None
+        if file_stamp == stamp:
+            logger.info(f"Galerie faciale projetée depuis {GALLERY_FILE}: {len(face_gallery)} encodages")
+            stamp = None
+
+    if stamp is not None or not GALLERY_FILE:
+        with db_manager.cursor() as cursor:
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS face_encodings (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    user_id INT NOT NULL,
-                    face_encoding LONGTEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-                )
+                SELECT u.id, u.username, fe.face_encoding
+                FROM users u
+                JOIN face_encodings fe ON u.id = fe.user_id
             """)
-            
-            self.connection.commit()
-            logger.info("Tables créées avec succès")
-            
-        except Error as e:
-            logger.error(f"Erreur lors de la création des tables: {e}")
-            raise
-        finally:
-            if cursor:
-                cursor.close()
+            face_gallery.load(
+                (user_id, username, decode_encoding(stored_encoding))
+                for user_id, username, stored_encoding in cursor.fetchall()
+            )
+        logger.info(f"Galerie faciale chargée: {len(face_gallery)} encodages")
+        if GALLERY_FILE:
+            face_gallery.save(GALLERY_FILE, stamp=stamp)
+            logger.info(f"Fichier de galerie écrit: {GALLERY_FILE}")
+            if FACE_INDEX in ('sq8', 'pq'):
+                # Index compressé : les vecteurs float32 sont relus depuis le fichier, pas gardés en mémoire
+                face_gallery.open(GALLERY_FILE)
+    gallery_sync.reset(version)
     
-    def get_connection(self):
-        """Obtenir une connexion active"""
-        if not self.connection or not self.connection.is_connected():
-            self.connect()
-        return self.connection
+    index = face_gallery.index
+    if FACE_INDEX == 'ivf' and not index.is_trained and len(index) >= FACE_INDEX_MIN_TRAIN:
+        index.train()
+        logger.info(f"Index IVF entraîné: {index.n_lists} listes, n_probe={index.n_probe}")
+        if FACE_INDEX_PATH:
+            index.save(FACE_INDEX_PATH)
+    elif FACE_INDEX == 'pq' and not index.is_trained and len(index) >= PQIndex.n_centroids:
+        # Dictionnaires provisoires tant que la galerie compte moins de 256 encodages
+        index.train()
+        logger.info(f"Index PQ entraîné: {index.m} sous-vecteurs sur {len(index)} encodages")
+        if FACE_INDEX_PATH:
+            index.save(FACE_INDEX_PATH)
 
-# Instance globale du gestionnaire de base de données
-db_manager = DatabaseManager()
+# Processus d'encodage pré-chauffés, démarrés avant les threads de requêtes
+encoding_engine = EncodingEngine(
+    workers=ENCODING_WORKERS,
+    max_pending=ENCODING_QUEUE_SIZE,
+    job_timeout=ENCODING_TIMEOUT,
+    retry_after=ENCODING_RETRY_AFTER
+)
+# Hachage des mots de passe en parallèle de l'encodage des visages
+password_hasher = PasswordHasher(
+    rounds=BCRYPT_ROUNDS,
+    workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_QUEUE_SIZE,
+    retry_after=ENCODING_RETRY_AFTER
+)
+
+# Modèles chargés avant le fork des processus d'encodage : ceux-ci en héritent les pages.
+# Sous gunicorn, le maître exécute PRELOAD_STEPS et chaque worker WORKER_STEPS.
+PRELOAD_STEPS = [
+    ('gallery', load_face_gallery),
+    ('models', warm_up),
+]
+WORKER_STEPS = [
+    ('engine', encoding_engine.start),
+    ('sync', gallery_sync.start),
+]
+if FACE_INDEX == 'sharded':
+    # Processus de partition propres à chaque worker, démarrés avant son premier trafic
+    WORKER_STEPS.insert(1, ('shards', face_gallery.index.start))
+WARMUP_STEPS = PRELOAD_STEPS + WORKER_STEPS
+
+# Sous gunicorn (préchargement), chaque worker démarre son propre moteur après le fork
+if os.getenv('ENCODING_ENGINE_AUTOSTART', 'true').lower() == 'true':
+    if WARMUP_BACKGROUND:
+        warmup.start(WARMUP_STEPS)
+    else:
+        warmup.run(WARMUP_STEPS)
+
+def prepare_fork():
+    """Processus maître, avant le fork des workers : charger galerie et modèles, fermer les connexions
+
+    Les modèles dlib et la galerie sont alors partagés par copie sur écriture ;
+    une connexion ouverte ne doit pas être héritée par plusieurs processus.
+    """
+    for name, fn in PRELOAD_STEPS:
+        with warmup.step(name):
+            fn()
+    db_manager.pool.discard_idle()
+
+def init_worker_process():
+    """Worker, après le fork : démarrer ses processus d'encodage et la synchronisation de sa galerie
+
+    Le worker n'accepte de connexions qu'au retour de post_fork : le
+    préchauffage y est synchrone pour qu'un worker recyclé ne reçoive jamais
+    de requête à froid.
+    """
+    warmup.run(WORKER_STEPS)
+
+# Les réglages de détection font partie de la clé : ils changent le résultat
+encoding_cache = EncodingCache(
+    create_store(
+        ENCODING_CACHE,
+        max_entries=ENCODING_CACHE_SIZE,
+        ttl=ENCODING_CACHE_TTL,
+        path=ENCODING_CACHE_PATH,
+        redis_url=ENCODING_CACHE_REDIS_URL
+    ),
+    namespace=f"{DETECTION_MAX_DIMENSION}:{MAX_IMAGE_DIMENSION}"
+)
+
+# Métriques exposées par /api/metrics (propres à chaque processus)
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram('face_api_stage_seconds', "Durée des étapes du traitement des requêtes", ['stage'])
+REQUEST_SECONDS = metrics.histogram('face_api_request_seconds', "Durée totale des requêtes", ['endpoint'])
+REQUESTS_TOTAL = metrics.counter('face_api_requests_total', "Requêtes traitées", ['endpoint', 'status'])
+DETECTION_SCALE = metrics.histogram(
+    'face_api_detection_scale', "Échelle de la copie utilisée pour la détection",
+    buckets=(0.1, 0.2, 0.25, 0.33, 0.5, 0.75, 1.0)
+)
+metrics.gauge('face_api_gallery_size', "Encodages (ou centroïdes) dans la galerie", lambda: len(face_gallery))
+metrics.gauge('face_api_encoding_pending', "Encodages en cours ou en file", encoding_engine.pending)
+metrics.gauge('face_api_db_pool_in_use', "Connexions empruntées au pool", lambda: db_manager.pool.metrics()['in_use'])
+metrics.counter_function('face_api_encoding_cache_hits_total', "Images servies par le cache d'encodage", lambda: encoding_cache.hits)
+metrics.counter_function('face_api_encoding_cache_misses_total', "Images absentes du cache d'encodage", lambda: encoding_cache.misses)
+metrics.gauge('face_api_password_hash_pending', "Hachages bcrypt en cours ou en file", password_hasher.pending)
+metrics.gauge('face_api_gallery_version', "Dernier changement du journal appliqué à la galerie", lambda: gallery_sync.version)
+metrics.gauge('face_api_ready', "1 une fois le préchauffage terminé", lambda: int(warmup.ready))
+metrics.gauge('face_api_warmup_seconds', "Durée du préchauffage", lambda: round(warmup.duration(), 3) if warmup.ready else None)
+
+def record_stage(name, seconds):
+    """Ajouter la durée d'une étape à l'histogramme et au Server-Timing de la requête"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    if has_request_context():
+        g.setdefault('stage_timings', []).append((name, seconds))
+
+@contextmanager
+def timed_stage(name):
+    """Chronométrer un bloc comme étape de la requête courante"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+def record_encoding(details):
+    """Étapes mesurées dans le processus d'encodage (retirées des détails renvoyés au client)"""
+    for name, seconds in details.pop('timings', {}).items():
+        record_stage(name, seconds)
+    DETECTION_SCALE.observe(details['detection_scale'])
 
 class FaceRecognitionService:
     @staticmethod
     def encode_face_from_base64(base64_image):
         """Encoder un visage à partir d'une image base64"""
+        return FaceRecognitionService.encode_face_from_bytes(decode_data_url(base64_image))[0]
+    
+    @staticmethod
+    def encode_face_from_bytes(image_data):
+        """Encoder un visage à partir des octets bruts d'une image JPEG/PNG ; renvoie (encodage, détails)"""
+        key = None
+        if encoding_cache.enabled:
+            with timed_stage('cache'):
+                key = encoding_cache.key(image_data)
+                cached = encoding_cache.get(key)
+            if isinstance(cached, ValueError):
+                raise cached
+            if cached is not None:
+                return cached
+        
         try:
-            # Décoder l'image base64
-            image_data = base64.b64decode(base64_image.split(',')[1])
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            # Convertir BGR vers RGB
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Détecter les visages
-            face_locations = face_recognition.face_locations(rgb_image)
-            
-            if not face_locations:
-                raise ValueError("Aucun visage détecté dans l'image")
-            
-            if len(face_locations) > 1:
-                raise ValueError("Plusieurs visages détectés. Veuillez ne capturer qu'un seul visage.")
-            
-            # Encoder le visage
-            face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
-            
-            if not face_encodings:
-                raise ValueError("Impossible d'encoder le visage détecté")
-            
-            return face_encodings[0]
+            # Détection sur copie réduite et encodage dans un processus du moteur
+            with timed_stage('engine'):
+                result = encoding_engine.run(detect_and_encode, image_data)
             
+        except EngineBusyError:
+            raise
+        except ValueError as e:
+            if key is not None:
+                encoding_cache.put(key, e)
+            logger.error(f"Erreur lors de l'encodage du visage: {e}")
+            raise
         except Exception as e:
             logger.error(f"Erreur lors de l'encodage du visage: {e}")
             raise
+        
+        record_encoding(result[1])
+        if key is not None:
+            encoding_cache.put(key, result)
+        return result
+    
+    @staticmethod
+    def encode_faces_from_bytes(frames):
+        """Encoder une rafale d'images dans l'ordre ; produit (encodage, détails) ou l'exception de chaque image
+
+        Les images sans visage sont écartées dès la détection, avant tout encodage.
+        Les images déjà vues sont servies par le cache sans passer par le moteur.
+        """
+        with timed_stage('cache'):
+            keys = [encoding_cache.key(frame) for frame in frames] if encoding_cache.enabled else [None] * len(frames)
+            cached = [encoding_cache.get(key) if key else None for key in keys]
+        misses = [(frame,) for frame, hit in zip(frames, cached) if hit is None]
+        
+        results = encoding_engine.imap(
+            detect_and_encode, misses,
+            window=LOGIN_BURST_PARALLEL, check_capacity=True
+        )
+        try:
+            for key, hit in zip(keys, cached):
+                if hit is None:
+                    with timed_stage('engine'):
+                        hit = next(results)
+                    if not isinstance(hit, Exception):
+                        record_encoding(hit[1])
+                    if key is not None:
+                        encoding_cache.put(key, hit)
+                yield hit
+        finally:
+            results.close()
     
     @staticmethod
     def compare_faces(known_encoding, face_encoding, tolerance=0.6):
         """Comparer deux encodages faciaux"""
         try:
-            # Convertir les encodages en listes si nécessaire
-            if isinstance(known_encoding, str):
-                known_encoding = np.array(eval(known_encoding))
-            if isinstance(face_encoding, str):
-                face_encoding = np.array(eval(face_encoding))
+            # Décoder les encodages stockés si nécessaire
+            if isinstance(known_encoding, (str, bytes, bytearray)):
+                known_encoding = decode_encoding(known_encoding)
+            if isinstance(face_encoding, (str, bytes, bytearray)):
+                face_encoding = decode_encoding(face_encoding)
             
             # Comparer les visages
             matches = face_recognition.compare_faces([known_encoding], face_encoding, tolerance=tolerance)
@@ -145,144 +399,438 @@ class FaceRecognitionService:
             logger.error(f"Erreur lors de la comparaison des visages: {e}")
             return False
 
+def rehash_password(user_id, password):
+    """Remplacer le hachage d'un mot de passe par un hachage au coût configuré"""
+    with db_manager.cursor(commit=True) as cursor:
+        cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (password_hasher.hash(password), user_id))
+    logger.info(f"Mot de passe de l'utilisateur {user_id} rehaché (coût {password_hasher.rounds})")
+
+def rehash_password_if_needed(user_id, password, password_hash):
+    """Après une vérification réussie, rehacher en arrière-plan si le coût configuré a changé"""
+    if not password_hasher.needs_rehash(password_hash):
+        return
+    try:
+        password_hasher.submit(rehash_password, user_id, password).add_done_callback(log_rehash_failure)
+    except EngineBusyError:
+        # Le rehachage sera retenté à la prochaine vérification
+        pass
+
+def log_rehash_failure(future):
+    """Journaliser l'échec d'un rehachage en arrière-plan"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Échec du rehachage d'un mot de passe: {future.exception()}")
+
+def engine_unavailable_response(error):
+    """Réponse 503/504 lorsque le moteur d'encodage est saturé ou trop lent"""
+    if isinstance(error, EngineBusyError):
+        response = jsonify({'error': str(error)})
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response, 503
+    return jsonify({'error': 'Délai de reconnaissance dépassé, réessayez'}), 504
+
+def read_face_request():
+    """Champs et octets de l'image d'une requête JSON (data URL), multipart ou binaire brute"""
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('face_data')
+        return request.form, upload.read() if upload else None
+    
+    if request.mimetype in RAW_IMAGE_TYPES:
+        # Corps binaire lu directement depuis le flux, sans copie base64 intermédiaire
+        image_data = request.stream.read(MAX_UPLOAD_BYTES + 1)
+        if len(image_data) > MAX_UPLOAD_BYTES:
+            raise ValueError('Image trop volumineuse')
+        return {}, image_data or None
+    
+    data = request.get_json(silent=True) or {}
+    face_data = data.get('face_data')
+    return data, decode_data_url(face_data) if face_data else None
+
+def read_login_frames():
+    """Images d'une connexion : une seule, ou une rafale de LOGIN_MAX_FRAMES images au plus
+
+    Rafale en multipart (plusieurs fichiers face_data) ou en JSON (liste de data URL).
+    """
+    if request.mimetype == 'multipart/form-data':
+        frames = [upload.read() for upload in request.files.getlist('face_data')]
+    elif request.mimetype in RAW_IMAGE_TYPES:
+        frames = [read_face_request()[1]]
+    else:
+        data = request.get_json(silent=True) or {}
+        face_data = data.get('face_data')
+        face_data = face_data if isinstance(face_data, list) else [face_data]
+        frames = [decode_data_url(frame) for frame in face_data if frame]
+    
+    frames = [frame for frame in frames if frame]
+    if len(frames) > LOGIN_MAX_FRAMES:
+        raise ValueError(f'Au plus {LOGIN_MAX_FRAMES} images par connexion')
+    return frames
+
+@app.before_request
+def start_request_timer():
+    """Début du chronométrage de la requête"""
+    g.request_start = time.perf_counter()
+    g.stage_timings = []
+    # Étapes mesurées par le serveur ASGI avant l'application (réception du corps, attente d'une place)
+    for name, seconds in request.environ.get('face_api.stage_timings', ()):
+        record_stage(name, seconds)
+
+@app.after_request
+def record_request_metrics(response):
+    """Durée de la requête dans les métriques et détail des étapes dans l'en-tête Server-Timing"""
+    start = g.get('request_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    REQUESTS_TOTAL.inc(endpoint=endpoint, status=response.status_code)
+    
+    response.headers['Server-Timing'] = server_timing(g.get('stage_timings', []) + [('total', elapsed)])
+    # Rendre l'en-tête lisible par le frontend (autre origine)
+    response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+@app.before_request
+def limit_upload_size():
+    """Refuser avant lecture les images au-delà de MAX_UPLOAD_SIZE_MB"""
+    if request.endpoint in ('register', 'enroll_face', 'login') and (request.content_length or 0) > MAX_UPLOAD_BYTES:
+        abort(413)
+
+@app.before_request
+def require_warm_server():
+    """Refuser les requêtes de reconnaissance tant que le préchauffage n'est pas terminé"""
+    if request.endpoint in ('register', 'enroll_face', 'register_batch', 'login') and not warmup.ready:
+        response = jsonify({'error': 'Serveur en cours de démarrage, réessayez plus tard'})
+        response.headers['Retry-After'] = str(ENCODING_RETRY_AFTER)
+        return response, 503
+
+@app.errorhandler(413)
+def request_too_large(error):
+    """Corps de requête au-delà de MAX_UPLOAD_SIZE_MB"""
+    return jsonify({'error': 'Image trop volumineuse'}), 413
+
 # Routes API
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Vérification de l'état du serveur"""
+    """Vérification de l'état du serveur (503 tant que le préchauffage n'est pas terminé)"""
     try:
-        db_manager.get_connection()
-        return jsonify({
-            'status': 'healthy',
-            'message': 'Serveur opérationnel',
-            'database': 'connected'
-        }), 200
+        with db_manager.connection():
+            pass
     except Exception as e:
         return jsonify({
             'status': 'unhealthy',
             'message': str(e),
-            'database': 'disconnected'
+            'database': 'disconnected',
+            'warmup': warmup.status()
         }), 500
+    
+    ready = warmup.ready
+    return jsonify({
+        'status': 'healthy' if ready else 'starting',
+        'message': 'Serveur opérationnel' if ready else 'Préchauffage en cours',
+        'database': 'connected',
+        'database_pool': db_manager.pool.metrics(),
+        'gallery_size': len(face_gallery),
+        'encoding_cache': encoding_cache.stats(),
+        'gallery_sync': gallery_sync.status(),
+        'gallery_shards': face_gallery.index.status() if FACE_INDEX == 'sharded' else None,
+        'warmup': warmup.status()
+    }), 200 if ready else 503
+
+@app.route('/api/health/live', methods=['GET'])
+def liveness_check():
+    """Vivacité : le processus répond, même pendant le préchauffage"""
+    return jsonify({'status': 'alive'}), 200
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """Disponibilité : préchauffage terminé, le serveur peut recevoir du trafic"""
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métriques au format texte Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/register', methods=['POST'])
 def register():
     """Inscription d'un nouvel utilisateur"""
     try:
-        data = request.get_json()
+        try:
+            with timed_stage('read'):
+                data, image_data = read_face_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Validation des données
-        required_fields = ['username', 'email', 'password', 'face_data']
+        required_fields = ['username', 'email', 'password']
         for field in required_fields:
             if field not in data or not data[field]:
                 return jsonify({'error': f'Le champ {field} est requis'}), 400
+        if not image_data:
+            return jsonify({'error': 'Le champ face_data est requis'}), 400
         
         username = data['username'].strip()
         email = data['email'].strip()
         password = data['password']
-        face_data = data['face_data']
         
         # Validation de la longueur du mot de passe
         if len(password) < 6:
             return jsonify({'error': 'Le mot de passe doit contenir au moins 6 caractères'}), 400
         
+        # Hasher le mot de passe pendant l'encodage du visage
+        try:
+            password_hash_future = password_hasher.hash_async(password)
+        except EngineBusyError as e:
+            return engine_unavailable_response(e)
+        
         # Encoder le visage
         try:
-            face_encoding = FaceRecognitionService.encode_face_from_base64(face_data)
+            face_encoding, detection = FaceRecognitionService.encode_face_from_bytes(image_data)
         except ValueError as e:
+            password_hash_future.cancel()
             return jsonify({'error': str(e)}), 400
+        except (EngineBusyError, EncodingTimeoutError) as e:
+            password_hash_future.cancel()
+            return engine_unavailable_response(e)
         
-        # Hasher le mot de passe
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        # Attente du hachage au-delà de l'encodage
+        with timed_stage('bcrypt'):
+            password_hash = password_hash_future.result()
         
         # Insérer dans la base de données
-        connection = db_manager.get_connection()
-        cursor = connection.cursor()
-        
         try:
-            # Insérer l'utilisateur
-            cursor.execute("""
-                INSERT INTO users (username, email, password_hash)
-                VALUES (%s, %s, %s)
-            """, (username, email, password_hash.decode('utf-8')))
+            with timed_stage('db'), db_manager.cursor(commit=True) as cursor:
+                # Insérer l'utilisateur
+                cursor.execute("""
+                    INSERT INTO users (username, email, password_hash)
+                    VALUES (%s, %s, %s)
+                """, (username, email, password_hash))
+                
+                user_id = cursor.lastrowid
+                
+                # Insérer l'encodage facial
+                cursor.execute("""
+                    INSERT INTO face_encodings (user_id, face_encoding)
+                    VALUES (%s, %s)
+                """, (user_id, encode_encoding(face_encoding, ENCODING_STORAGE_DTYPE)))
+                record_changes(cursor, [user_id])
             
-            user_id = cursor.lastrowid
+        except db_manager.integrity_errors as e:
+            if "username" in str(e):
+                return jsonify({'error': 'Ce nom d\'utilisateur existe déjà'}), 409
+            elif "email" in str(e):
+                return jsonify({'error': 'Cet email existe déjà'}), 409
+            return jsonify({'error': 'Erreur lors de l\'inscription'}), 500
+        
+        # La galerie n'est modifiée que par le journal : pas de double ajout avec la synchronisation
+        with timed_stage('sync'):
+            gallery_sync.poll(drain=True)
+        
+        logger.info(f"Utilisateur {username} inscrit avec succès")
+        
+        return jsonify({
+            'message': 'Inscription réussie',
+            'user_id': user_id,
+            'username': username,
+            'detection': detection
+        }), 201
             
-            # Insérer l'encodage facial
+    except Exception as e:
+        logger.error(f"Erreur lors de l'inscription: {e}")
+        return jsonify({'error': 'Erreur interne du serveur'}), 500
+
+@app.route('/api/enroll', methods=['POST'])
+def enroll_face():
+    """Ajouter un échantillon de visage (éclairage, lunettes...) à un utilisateur existant"""
+    try:
+        try:
+            with timed_stage('read'):
+                data, image_data = read_face_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        for field in ('username', 'password'):
+            if field not in data or not data[field]:
+                return jsonify({'error': f'Le champ {field} est requis'}), 400
+        if not image_data:
+            return jsonify({'error': 'Le champ face_data est requis'}), 400
+        
+        username = data['username'].strip()
+        password = data['password']
+        
+        # L'ajout d'un échantillon est réservé au titulaire du compte
+        with timed_stage('db'), db_manager.cursor() as cursor:
+            cursor.execute("SELECT id, password_hash FROM users WHERE username = %s", (username,))
+            user = cursor.fetchone()
+        if user is None:
+            return jsonify({'error': 'Identifiants invalides'}), 401
+        user_id, password_hash = user
+        
+        # Vérification du mot de passe pendant l'encodage du visage
+        try:
+            password_check = password_hasher.verify_async(password, password_hash)
+        except EngineBusyError as e:
+            return engine_unavailable_response(e)
+        
+        limit_reached = face_gallery.samples(user_id) >= MAX_FACE_SAMPLES
+        encoded = None
+        if not limit_reached:
+            try:
+                encoded = FaceRecognitionService.encode_face_from_bytes(image_data)
+            except (ValueError, EngineBusyError, EncodingTimeoutError) as e:
+                encoded = e
+        
+        # Aucune autre réponse ne précède la vérification du mot de passe
+        with timed_stage('bcrypt'):
+            password_ok = password_check.result()
+        if not password_ok:
+            return jsonify({'error': 'Identifiants invalides'}), 401
+        rehash_password_if_needed(user_id, password, password_hash)
+        
+        if limit_reached:
+            return jsonify({'error': f'Nombre maximal d\'échantillons atteint ({MAX_FACE_SAMPLES})'}), 409
+        if isinstance(encoded, ValueError):
+            return jsonify({'error': str(encoded)}), 400
+        if isinstance(encoded, Exception):
+            return engine_unavailable_response(encoded)
+        face_encoding, detection = encoded
+        
+        # Refuser un visage qui serait reconnu comme celui d'un autre utilisateur
+        with timed_stage('match'):
+            match = face_gallery.best_match(face_encoding, tolerance=FACE_TOLERANCE)
+        if match is not None and match[0] != user_id:
+            return jsonify({'error': 'Ce visage correspond à un autre utilisateur'}), 409
+        
+        with timed_stage('db'), db_manager.cursor(commit=True) as cursor:
             cursor.execute("""
                 INSERT INTO face_encodings (user_id, face_encoding)
                 VALUES (%s, %s)
-            """, (user_id, str(face_encoding.tolist())))
-            
-            connection.commit()
-            
-            logger.info(f"Utilisateur {username} inscrit avec succès")
-            
-            return jsonify({
-                'message': 'Inscription réussie',
-                'user_id': user_id,
-                'username': username
-            }), 201
-            
-        except mysql.connector.IntegrityError as e:
-            if "Duplicate entry" in str(e):
-                if "username" in str(e):
-                    return jsonify({'error': 'Ce nom d\'utilisateur existe déjà'}), 409
-                elif "email" in str(e):
-                    return jsonify({'error': 'Cet email existe déjà'}), 409
-            return jsonify({'error': 'Erreur lors de l\'inscription'}), 500
-        finally:
-            cursor.close()
-            
+            """, (user_id, encode_encoding(face_encoding, ENCODING_STORAGE_DTYPE)))
+            record_changes(cursor, [user_id])
+        
+        with timed_stage('sync'):
+            gallery_sync.poll(drain=True)
+        samples = face_gallery.samples(user_id)
+        
+        logger.info(f"Échantillon ajouté pour l'utilisateur {username} ({samples} au total)")
+        return jsonify({
+            'message': 'Échantillon ajouté',
+            'user_id': user_id,
+            'username': username,
+            'samples': samples,
+            'detection': detection
+        }), 201
+        
     except Exception as e:
-        logger.error(f"Erreur lors de l'inscription: {e}")
+        logger.error(f"Erreur lors de l'ajout d'un échantillon: {e}")
         return jsonify({'error': 'Erreur interne du serveur'}), 500
 
-@app.route('/api/login', methods=['POST'])
-def login():
-    """Connexion par reconnaissance faciale"""
+@app.route('/api/register/batch', methods=['POST'])
+def register_batch():
+    """Inscription en masse : manifeste CSV + archive zip ou fichiers images (multipart)"""
     try:
-        data = request.get_json()
+        manifest = request.files.get('manifest')
+        if manifest is None:
+            return jsonify({'error': 'Le manifeste CSV (champ manifest) est requis'}), 400
         
-        if 'face_data' not in data or not data['face_data']:
-            return jsonify({'error': 'Les données faciales sont requises'}), 400
+        try:
+            entries = read_manifest(manifest.read())
+            if 'archive' in request.files:
+                images = ZipImages(request.files['archive'].stream)
+            else:
+                images = MemoryImages(
+                    (os.path.basename(image.filename), image.read())
+                    for image in request.files.getlist('images')
+                )
+        except (ValueError, zipfile.BadZipFile) as e:
+            return jsonify({'error': str(e)}), 400
+        
+        enroller = BatchEnroller(
+            db_manager, encoding_engine,
+            chunk_size=BATCH_CHUNK_SIZE,
+            storage_dtype=ENCODING_STORAGE_DTYPE,
+            bcrypt_rounds=BCRYPT_ROUNDS
+        )
+        report = enroller.enroll(entries, images)
+        try:
+            gallery_sync.poll(drain=True)
+        except Exception as e:
+            # Les utilisateurs créés sont en base : le rapport est renvoyé, la galerie suivra
+            logger.warning(f"Synchronisation de la galerie après l'inscription en masse impossible: {e}")
         
-        face_data = data['face_data']
+        logger.info(f"Inscription en masse: {report['created']}/{report['total']} utilisateurs")
+        return jsonify(report), 200
         
-        # Encoder le visage fourni
+    except Exception as e:
+        logger.error(f"Erreur lors de l'inscription en masse: {e}")
+        return jsonify({'error': 'Erreur interne du serveur'}), 500
+
+@app.route('/api/login', methods=['POST'])
+def login():
+    """Connexion par reconnaissance faciale (une image ou une rafale)"""
+    try:
         try:
-            face_encoding = FaceRecognitionService.encode_face_from_base64(face_data)
+            with timed_stage('read'):
+                frames = read_login_frames()
         except ValueError as e:
             return jsonify({'error': str(e)}), 400
         
-        # Récupérer tous les utilisateurs et leurs encodages
-        connection = db_manager.get_connection()
-        cursor = connection.cursor()
+        if not frames:
+            return jsonify({'error': 'Les données faciales sont requises'}), 400
+        
+        if not len(face_gallery):
+            return jsonify({'error': 'Aucun utilisateur enregistré'}), 404
         
+        # Images traitées dans l'ordre ; arrêt dès une correspondance sûre
+        best = None
+        frame_error = None
+        faces_found = 0
+        processed = 0
+        results = FaceRecognitionService.encode_faces_from_bytes(frames)
         try:
-            cursor.execute("""
-                SELECT u.id, u.username, fe.face_encoding
-                FROM users u
-                JOIN face_encodings fe ON u.id = fe.user_id
-            """)
-            
-            users = cursor.fetchall()
-            
-            if not users:
-                return jsonify({'error': 'Aucun utilisateur enregistré'}), 404
-            
-            # Comparer avec tous les utilisateurs
-            for user_id, username, stored_encoding in users:
-                if FaceRecognitionService.compare_faces(stored_encoding, face_encoding):
-                    logger.info(f"Connexion réussie pour l'utilisateur {username}")
-                    return jsonify({
-                        'message': 'Connexion réussie',
-                        'user_id': user_id,
-                        'username': username
-                    }), 200
-            
-            return jsonify({'error': 'Visage non reconnu'}), 401
-            
+            for result in results:
+                processed += 1
+                if isinstance(result, (ValueError, EncodingTimeoutError)):
+                    frame_error = result
+                    continue
+                if isinstance(result, Exception):
+                    raise result
+                
+                face_encoding, detection = result
+                faces_found += 1
+                # Recherche vectorisée de la meilleure correspondance dans la galerie
+                with timed_stage('match'):
+                    match = face_gallery.best_match(face_encoding, tolerance=FACE_TOLERANCE)
+                if match is not None and (best is None or match[2] < best[0][2]):
+                    best = match, detection
+                if match is not None and match[2] <= LOGIN_CONFIDENT_DISTANCE:
+                    break
+        except EngineBusyError as e:
+            return engine_unavailable_response(e)
         finally:
-            cursor.close()
+            results.close()
+        
+        if best is None:
+            if faces_found:
+                return jsonify({'error': 'Visage non reconnu'}), 401
+            # Aucune image exploitable : l'erreur de la dernière image est renvoyée
+            if isinstance(frame_error, EncodingTimeoutError):
+                return engine_unavailable_response(frame_error)
+            return jsonify({'error': str(frame_error)}), 400
+        
+        (user_id, username, distance), detection = best
+        logger.info(f"Connexion réussie pour l'utilisateur {username} (distance {distance:.3f}, image {processed}/{len(frames)})")
+        return jsonify({
+            'message': 'Connexion réussie',
+            'user_id': user_id,
+            'username': username,
+            'distance': round(distance, 4),
+            'detection': detection,
+            'frames': len(frames),
+            'frames_processed': processed
+        }), 200
             
     except Exception as e:
         logger.error(f"Erreur lors de la connexion: {e}")
@@ -292,28 +840,25 @@ def login():
 def get_users():
     """Récupérer la liste des utilisateurs (pour debug)"""
     try:
-        connection = db_manager.get_connection()
-        cursor = connection.cursor(dictionary=True)
-        
-        cursor.execute("""
-            SELECT id, username, email, created_at
-            FROM users
-            ORDER BY created_at DESC
-        """)
-        
-        users = cursor.fetchall()
+        with db_manager.cursor(dictionary=True) as cursor:
+            cursor.execute("""
+                SELECT id, username, email, created_at
+                FROM users
+                ORDER BY created_at DESC
+            """)
+            
+            users = cursor.fetchall()
         
         # Convertir les dates en string pour la sérialisation JSON
         for user in users:
-            user['created_at'] = user['created_at'].isoformat()
+            if isinstance(user['created_at'], datetime):
+                user['created_at'] = user['created_at'].isoformat()
         
         return jsonify({'users': users}), 200
         
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des utilisateurs: {e}")
         return jsonify({'error': 'Erreur interne du serveur'}), 500
-    finally:
-        cursor.close()
 
 if __name__ == '__main__':
     # Configuration du serveur
@@ -0,0 +1,227 @@
+"""
+Serveur asynchrone (ASGI) de l'API, pour de nombreux clients lents
+
+Avec le serveur WSGI, un client qui envoie lentement une grande image base64
+occupe un thread de worker pendant tout l'envoi. Ici, le corps de la requête
+est lu par la boucle asyncio (une coroutine par connexion, en attente sans
+coût), puis la requête complète est traitée par l'application Flask dans un
+pool de threads : mêmes routes, mêmes réponses, mêmes métriques.
+
+Le traitement (base de données, bcrypt, encodage, recherche) est borné par un
+sémaphore de ASYNC_MAX_CONCURRENCY places ; une requête qui attend une place
+plus de ASYNC_QUEUE_TIMEOUT secondes reçoit 503 et Retry-After, comme lorsque
+le moteur d'encodage est saturé. Les sondes de santé ne prennent pas de place.
+
+    uvicorn asgi:application --port 5000
+    python3 start_server.py --async
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app as api
+from encoding_engine import EngineBusyError
+
+logger = logging.getLogger(__name__)
+
+# Requêtes traitées simultanément (threads) et attente maximale d'une place (s)
+ASYNC_MAX_CONCURRENCY = int(os.getenv('ASYNC_MAX_CONCURRENCY', 16))
+ASYNC_QUEUE_TIMEOUT = float(os.getenv('ASYNC_QUEUE_TIMEOUT', 5))
+# Corps gardés en mémoire jusqu'à cette taille, au-delà dans un fichier temporaire
+ASYNC_SPOOL_BYTES = int(os.getenv('ASYNC_SPOOL_KB', 1024)) * 1024
+
+# Chemins dont le corps est limité à MAX_UPLOAD_SIZE_MB (comme limit_upload_size)
+LIMITED_PATHS = ('/api/register', '/api/enroll', '/api/login')
+# Sondes servies hors sémaphore : un serveur saturé reste observable
+PROBE_PATHS = ('/api/health', '/api/health/live', '/api/health/ready', '/api/metrics')
+
+_executor = ThreadPoolExecutor(max_workers=ASYNC_MAX_CONCURRENCY, thread_name_prefix='asgi')
+_semaphore = None
+_waiting = 0
+_in_flight = 0
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class _ClientDisconnected(Exception):
+    pass
+
+
+def _slots():
+    """Sémaphore créé dans la boucle du serveur"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+    return _semaphore
+
+
+api.metrics.gauge('face_api_async_in_flight', "Requêtes en cours de traitement (serveur ASGI)", lambda: _in_flight)
+api.metrics.gauge('face_api_async_waiting', "Requêtes en attente d'une place (serveur ASGI)", lambda: _waiting)
+
+
+async def _read_body(receive, limit):
+    """Lire le corps sans bloquer la boucle ; fichier temporaire rembobiné et taille"""
+    body = tempfile.SpooledTemporaryFile(max_size=ASYNC_SPOOL_BYTES)
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            raise _ClientDisconnected()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit is not None and size > limit:
+            body.close()
+            raise _BodyTooLarge()
+        body.write(chunk)
+        more_body = message.get('more_body', False)
+    body.seek(0)
+    return body, size
+
+
+def _environ(scope, body, size, timings):
+    """Environnement WSGI de la requête, corps déjà reçu"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(size),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        # Étapes mesurées avant Flask, ajoutées au Server-Timing par start_request_timer
+        'face_api.stage_timings': timings,
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1').lower(), value.decode('latin-1')
+        if name == 'content-length':
+            continue
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_flask(environ):
+    """Exécuter l'application Flask (dans un thread du pool) ; renvoie statut, en-têtes et corps"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    result = api.app(environ, start_response)
+    try:
+        content = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+        environ['wsgi.input'].close()
+    return response['status'], response['headers'], content
+
+
+def _json_error(status, message, headers=()):
+    content = api.app.json.dumps({'error': message}).encode('utf-8') + b'\n'
+    return status, [('Content-Type', 'application/json'), *headers], content
+
+
+async def _send_response(send, status, headers, content):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': content})
+
+
+async def _handle_http(scope, receive, send):
+    start = time.perf_counter()
+    path = scope['path']
+    limit = api.MAX_UPLOAD_BYTES if path in LIMITED_PATHS else None
+    content_length = next((value for name, value in scope.get('headers', []) if name.lower() == b'content-length'), b'')
+
+    # Refus avant lecture, comme limit_upload_size ; un corps sans longueur est borné pendant la lecture
+    if limit is not None and content_length.isdigit() and int(content_length) > limit:
+        return await _send_response(send, *_json_error(413, 'Image trop volumineuse'))
+    try:
+        body, size = await _read_body(receive, limit)
+    except _BodyTooLarge:
+        return await _send_response(send, *_json_error(413, 'Image trop volumineuse'))
+    except _ClientDisconnected:
+        return
+    timings = [('upload', time.perf_counter() - start)]
+
+    loop = asyncio.get_running_loop()
+    environ = _environ(scope, body, size, timings)
+    if path in PROBE_PATHS:
+        return await _send_response(send, *await loop.run_in_executor(None, _call_flask, environ))
+
+    global _waiting, _in_flight
+    queued = time.perf_counter()
+    _waiting += 1
+    try:
+        await asyncio.wait_for(_slots().acquire(), ASYNC_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        body.close()
+        error = EngineBusyError(api.ENCODING_RETRY_AFTER)
+        return await _send_response(send, *_json_error(503, str(error), [('Retry-After', error.retry_after)]))
+    finally:
+        _waiting -= 1
+    _in_flight += 1
+    try:
+        timings.append(('queue', time.perf_counter() - queued))
+        response = await loop.run_in_executor(_executor, _call_flask, environ)
+    finally:
+        _in_flight -= 1
+        _slots().release()
+    await _send_response(send, *response)
+
+
+def _shutdown():
+    """Arrêter les threads et processus de l'application"""
+    api.gallery_sync.stop()
+    api.encoding_engine.shutdown()
+    api.password_hasher.shutdown()
+    _executor.shutdown(wait=True)
+
+
+async def _handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Le préchauffage est lancé à l'import de l'application ; /api/health/ready en rend compte
+            _slots()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.get_running_loop().run_in_executor(None, _shutdown)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """Point d'entrée ASGI"""
+    if scope['type'] == 'http':
+        await _handle_http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await _handle_lifespan(receive, send)
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Inscription en masse d'utilisateurs à partir d'un manifeste CSV et d'un dossier ou d'une archive d'images
+
+Le manifeste contient les colonnes username, email, image et, optionnellement,
+password (un mot de passe aléatoire est généré s'il est absent : le compte
+reste utilisable par reconnaissance faciale).
+"""
+
+import argparse
+import csv
+import io
+import logging
+import os
+import secrets
+import time
+import zipfile
+
+import bcrypt
+
+from encoding_codec import encode_encoding
+from gallery_sync import record_changes
+from face_encoder import encode_face_image
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ('username', 'email', 'image')
+
+
+class DirectoryImages:
+    """Images lues depuis un dossier local"""
+
+    def __init__(self, path):
+        self.root = os.path.realpath(path)
+
+    def _path(self, name):
+        path = os.path.realpath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep):
+            return None
+        return path
+
+    def __contains__(self, name):
+        path = self._path(name)
+        return path is not None and os.path.isfile(path)
+
+    def read(self, name):
+        with open(self._path(name), 'rb') as f:
+            return f.read()
+
+
+class ZipImages:
+    """Images lues depuis une archive zip (chemin ou fichier ouvert)"""
+
+    def __init__(self, archive):
+        self._zip = zipfile.ZipFile(archive)
+        self._members = {}
+        for member in self._zip.namelist():
+            if member.endswith('/'):
+                continue
+            self._members[member] = member
+            # Les images peuvent être référencées par leur seul nom de fichier
+            self._members.setdefault(os.path.basename(member), member)
+
+    def __contains__(self, name):
+        return name in self._members
+
+    def read(self, name):
+        return self._zip.read(self._members[name])
+
+
+class MemoryImages:
+    """Images déjà en mémoire, indexées par nom de fichier"""
+
+    def __init__(self, images):
+        self._images = dict(images)
+
+    def __contains__(self, name):
+        return name in self._images
+
+    def read(self, name):
+        return self._images[name]
+
+
+def open_image_source(path):
+    """Ouvrir un dossier ou une archive zip d'images"""
+    if os.path.isdir(path):
+        return DirectoryImages(path)
+    if zipfile.is_zipfile(path):
+        return ZipImages(path)
+    raise ValueError(f"Source d'images invalide: {path} (dossier ou archive zip attendu)")
+
+
+def read_manifest(stream):
+    """Lire le manifeste CSV en une liste d'entrées numérotées"""
+    if isinstance(stream, bytes):
+        stream = io.StringIO(stream.decode('utf-8-sig'))
+    reader = csv.DictReader(stream)
+    columns = [column.strip().lower() for column in reader.fieldnames or []]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Colonnes manquantes dans le manifeste: {', '.join(missing)}")
+
+    entries = []
+    # La ligne 1 est l'en-tête
+    for row_number, row in enumerate(reader, start=2):
+        row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+        row['row'] = row_number
+        entries.append(row)
+    return entries
+
+
+def prepare_enrollment(image_data, password, bcrypt_rounds):
+    """Travail exécuté dans un processus : encodage du visage et hachage du mot de passe"""
+    face_encoding = encode_face_image(image_data)
+    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(bcrypt_rounds))
+    return face_encoding, password_hash.decode('utf-8')
+
+
+def _placeholders(row_count, column_count):
+    row = '(' + ', '.join(['%s'] * column_count) + ')'
+    return ', '.join([row] * row_count)
+
+
+class BatchEnroller:
+    """Encode les visages en parallèle et écrit les utilisateurs par lots transactionnels"""
+
+    def __init__(self, db_manager, engine, chunk_size=500, storage_dtype='float32',
+                 bcrypt_rounds=12):
+        self.db_manager = db_manager
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.storage_dtype = storage_dtype
+        self.bcrypt_rounds = bcrypt_rounds
+
+    def _existing_identities(self, entries):
+        """Noms d'utilisateur et emails déjà présents en base"""
+        usernames, emails = set(), set()
+        with self.db_manager.cursor() as cursor:
+            for start in range(0, len(entries), self.chunk_size):
+                chunk = entries[start:start + self.chunk_size]
+                names = [entry['username'] for entry in chunk]
+                mails = [entry['email'] for entry in chunk]
+                cursor.execute(f"""
+                    SELECT username, email FROM users
+                    WHERE username IN ({', '.join(['%s'] * len(names))})
+                       OR email IN ({', '.join(['%s'] * len(mails))})
+                """, names + mails)
+                for username, email in cursor.fetchall():
+                    usernames.add(username)
+                    emails.add(email)
+        return usernames, emails
+
+    def _validate(self, entries, images, results):
+        """Écarter les lignes invalides, en double ou dont l'image est absente"""
+        valid = []
+        seen_usernames, seen_emails = set(), set()
+        for entry in entries:
+            error = None
+            password = entry.get('password', '')
+            if not entry.get('username') or not entry.get('email') or not entry.get('image'):
+                error = "Les champs username, email et image sont requis"
+            elif password and len(password) < 6:
+                error = "Le mot de passe doit contenir au moins 6 caractères"
+            elif entry['username'] in seen_usernames:
+                error = "Nom d'utilisateur en double dans le manifeste"
+            elif entry['email'] in seen_emails:
+                error = "Email en double dans le manifeste"
+            elif entry['image'] not in images:
+                error = f"Image introuvable: {entry['image']}"
+
+            if error:
+                results.append({'row': entry['row'], 'username': entry.get('username'),
+                                 'status': 'error', 'error': error})
+                continue
+            seen_usernames.add(entry['username'])
+            seen_emails.add(entry['email'])
+            valid.append(entry)
+
+        if not valid:
+            return valid
+
+        existing_usernames, existing_emails = self._existing_identities(valid)
+        remaining = []
+        for entry in valid:
+            if entry['username'] in existing_usernames:
+                error = "Ce nom d'utilisateur existe déjà"
+            elif entry['email'] in existing_emails:
+                error = "Cet email existe déjà"
+            else:
+                remaining.append(entry)
+                continue
+            results.append({'row': entry['row'], 'username': entry['username'],
+                            'status': 'error', 'error': error})
+        return remaining
+
+    def _insert_chunk(self, cursor, chunk):
+        """Insérer un lot avec deux INSERT multi-lignes ; renvoie les user_id par nom"""
+        cursor.execute(
+            "INSERT INTO users (username, email, password_hash) VALUES " + _placeholders(len(chunk), 3),
+            [value for entry, _, password_hash in chunk
+             for value in (entry['username'], entry['email'], password_hash)]
+        )
+
+        usernames = [entry['username'] for entry, _, _ in chunk]
+        cursor.execute(
+            f"SELECT id, username FROM users WHERE username IN ({', '.join(['%s'] * len(usernames))})",
+            usernames
+        )
+        user_ids = {username: user_id for user_id, username in cursor.fetchall()}
+
+        cursor.execute(
+            "INSERT INTO face_encodings (user_id, face_encoding) VALUES " + _placeholders(len(chunk), 2),
+            [value for entry, face_encoding, _ in chunk
+             for value in (user_ids[entry['username']], encode_encoding(face_encoding, self.storage_dtype))]
+        )
+        record_changes(cursor, user_ids.values())
+        return user_ids
+
+    def _write_chunk(self, chunk, results):
+        """Écrire un lot dans une transaction, ligne par ligne en cas de conflit concurrent
+
+        Toute autre erreur de base (connexion perdue, attente de verrou, pool saturé)
+        marque les lignes du lot en erreur sans interrompre l'import : les lots déjà
+        validés restent dans le rapport et les suivants sont tentés.
+        """
+        try:
+            with self.db_manager.cursor(commit=True) as cursor:
+                user_ids = self._insert_chunk(cursor, chunk)
+        except self.db_manager.integrity_errors:
+            user_ids = {}
+            for item in chunk:
+                entry = item[0]
+                try:
+                    with self.db_manager.cursor(commit=True) as cursor:
+                        user_ids.update(self._insert_chunk(cursor, [item]))
+                except self.db_manager.integrity_errors as e:
+                    results.append({'row': entry['row'], 'username': entry['username'],
+                                    'status': 'error', 'error': f"Conflit lors de l'insertion: {e}"})
+                except self.db_manager.database_errors as e:
+                    logger.error(f"Ligne {entry['row']} non écrite: {e}")
+                    results.append({'row': entry['row'], 'username': entry['username'],
+                                    'status': 'error', 'error': f"Erreur de base de données: {e}"})
+        except self.db_manager.database_errors as e:
+            logger.error(f"Lot de {len(chunk)} utilisateurs non écrit: {e}")
+            user_ids = {}
+            for entry, _, _ in chunk:
+                results.append({'row': entry['row'], 'username': entry['username'],
+                                'status': 'error', 'error': f"Erreur de base de données: {e}"})
+
+        for entry, _, _ in chunk:
+            user_id = user_ids.get(entry['username'])
+            if user_id is None:
+                continue
+            results.append({'row': entry['row'], 'username': entry['username'],
+                            'status': 'created', 'user_id': user_id})
+
+    def enroll(self, entries, images):
+        """Inscrire toutes les entrées du manifeste et renvoyer le rapport par ligne"""
+        start = time.perf_counter()
+        results = []
+        valid = self._validate(entries, images, results)
+
+        passwords = [entry.get('password') or secrets.token_urlsafe(16) for entry in valid]
+        jobs = (
+            (images.read(entry['image']), password, self.bcrypt_rounds)
+            for entry, password in zip(valid, passwords)
+        )
+
+        chunk = []
+        for entry, outcome in zip(valid, self.engine.imap(prepare_enrollment, jobs)):
+            if isinstance(outcome, Exception):
+                error = str(outcome) if isinstance(outcome, ValueError) else "Erreur lors de l'encodage"
+                if not isinstance(outcome, ValueError):
+                    logger.error(f"Ligne {entry['row']}: {outcome}")
+                results.append({'row': entry['row'], 'username': entry['username'],
+                                'status': 'error', 'error': error})
+                continue
+
+            face_encoding, password_hash = outcome
+            chunk.append((entry, face_encoding, password_hash))
+            if len(chunk) >= self.chunk_size:
+                self._write_chunk(chunk, results)
+                chunk = []
+
+        if chunk:
+            self._write_chunk(chunk, results)
+
+        results.sort(key=lambda result: result['row'])
+        created = sum(1 for result in results if result['status'] == 'created')
+        return {
+            'total': len(entries),
+            'created': created,
+            'failed': len(results) - created,
+            'duration_s': round(time.perf_counter() - start, 3),
+            'results': results
+        }
+
+
+def write_report(report, path):
+    """Écrire le rapport par ligne au format CSV"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['row', 'username', 'status', 'user_id', 'error'])
+        writer.writeheader()
+        for result in report['results']:
+            writer.writerow(result)
+
+
+def main():
+    """Fonction principale"""
+    from database import DatabaseManager
+    from encoding_engine import EncodingEngine
+
+    parser = argparse.ArgumentParser(description="Inscription en masse d'utilisateurs")
+    parser.add_argument('manifest', help="Fichier CSV (username, email, image[, password])")
+    parser.add_argument('images', help="Dossier ou archive zip contenant les images")
+    parser.add_argument('--chunk-size', type=int, default=500, help="Utilisateurs écrits par transaction")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processus d'encodage")
+    parser.add_argument('--bcrypt-rounds', type=int, default=int(os.getenv('BCRYPT_ROUNDS', 12)),
+                        help="Coût bcrypt des mots de passe (défaut BCRYPT_ROUNDS)")
+    parser.add_argument('--report', help="Fichier CSV du rapport par ligne")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    print("📥 Import en masse des utilisateurs")
+    print("=" * 50)
+
+    try:
+        with open(args.manifest, encoding='utf-8-sig', newline='') as f:
+            entries = read_manifest(f)
+        images = open_image_source(args.images)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+
+    engine = EncodingEngine(workers=args.workers)
+    try:
+        engine.start()
+        enroller = BatchEnroller(
+            DatabaseManager(), engine,
+            chunk_size=args.chunk_size,
+            storage_dtype=os.getenv('ENCODING_STORAGE_DTYPE', 'float32'),
+            bcrypt_rounds=args.bcrypt_rounds
+        )
+        report = enroller.enroll(entries, images)
+    finally:
+        engine.shutdown()
+
+    for result in report['results']:
+        if result['status'] != 'created':
+            print(f"⚠️ Ligne {result['row']} ({result['username']}): {result['error']}")
+
+    if args.report:
+        write_report(report, args.report)
+        print(f"📄 Rapport écrit dans {args.report}")
+
+    print(f"\n✅ {report['created']}/{report['total']} utilisateurs inscrits "
+          f"en {report['duration_s']}s ({report['failed']} échecs)")
+    return 0 if not report['failed'] else 2
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+Banc d'essai reproductible des performances du backend
+
+Quatre mesures, écrites en JSON pour comparer deux commits :
+- encode : latence de detect_and_encode sur les images d'exemple
+- match : latence de recherche et mémoire de l'index selon la taille de la
+  galerie (vecteurs aléatoires), comparées au parcours linéaire de
+  face_recognition, et concordance des décisions autour du seuil
+- login : débit et latence de /api/login de bout en bout (client de test
+  Flask, base SQLite temporaire peuplée d'utilisateurs synthétiques)
+- sync : délai avant qu'un utilisateur inscrit par un worker puisse se
+  connecter par chacun des autres (processus partageant une base SQLite)
+
+    python3 benchmark.py --sizes 1000 10000 100000 --output bench.json
+    python3 benchmark.py --compare avant.json apres.json
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from face_index import ENCODING_DIM, create_index, synthetic_gallery
+
+DEFAULT_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'trash-waste-face-recognition', 'Images')
+
+
+def latency_stats(samples):
+    """Statistiques de latence (ms) d'une liste de durées en secondes"""
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    if not len(ms):
+        return {'count': 0}
+    return {
+        'count': int(len(ms)),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'min_ms': round(float(ms.min()), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+
+
+def load_sample_images(directory):
+    """Images d'exemple : liste de (nom, octets)"""
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(('.png', '.jpg', '.jpeg')):
+            with open(os.path.join(directory, name), 'rb') as f:
+                images.append((name, f.read()))
+    if not images:
+        raise ValueError(f"Aucune image d'exemple dans {directory}")
+    return images
+
+
+def bench_encode(images, repeats=5):
+    """Latence de detect_and_encode par image (dans le processus courant)"""
+    from face_encoder import detect_and_encode, warm_up
+
+    warm_up()
+    results = []
+    for name, image_data in images:
+        samples = []
+        outcome = 'ok'
+        for _ in range(repeats):
+            start = time.perf_counter()
+            try:
+                _, details = detect_and_encode(image_data)
+            except ValueError as e:
+                outcome = str(e)
+                details = None
+            samples.append(time.perf_counter() - start)
+        results.append({'image': name, 'outcome': outcome, 'details': details, **latency_stats(samples)})
+    return results
+
+
+def _decision_queries(gallery, n_queries, tolerance, seed):
+    """Requêtes de validation dont la distance au plus proche encadre le seuil de décision"""
+    rng = np.random.default_rng(seed + 1)
+    targets = rng.choice(len(gallery), n_queries, replace=False)
+    # Bruit gaussien de norme attendue entre 0,8 et 1,2 fois le seuil
+    scales = rng.uniform(0.8, 1.2, n_queries) * tolerance / np.sqrt(ENCODING_DIM)
+    noise = rng.normal(0.0, 1.0, (n_queries, ENCODING_DIM)) * scales[:, None]
+    return (gallery[targets] + noise).astype(np.float32)
+
+
+def bench_match(sizes, n_queries=200, index_kinds=('exact',), legacy_max=20000, tolerance=0.6, shards=None, seed=0):
+    """Latence d'une recherche et mémoire de l'index selon la taille de la galerie et le type d'index
+
+    Pour chaque index, `decisions` est la proportion de requêtes de validation
+    (autour du seuil) dont la décision (utilisateur reconnu ou refus) est celle
+    de face_recognition.compare_faces, ou de la recherche exacte au-delà de
+    `legacy_max`. Les index compressés chargent la galerie depuis un fichier
+    projeté en mémoire, comme le serveur avec GALLERY_FILE : `memory_mb` compte
+    la mémoire propre de l'index, `mapped_mb` la taille du fichier projeté, lu
+    à la demande pour le re-classement. L'index 'sharded' répartit la galerie
+    entre `shards` processus.
+    """
+    import face_recognition
+    from face_gallery import FaceGallery
+    from face_index import ExactIndex
+    from gallery_file import write_gallery
+    from shard_index import ShardedIndex
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='face-bench-') as directory:
+        for size in sizes:
+            gallery, queries = synthetic_gallery(size, n_queries=n_queries, seed=seed)
+            ids = np.arange(size)
+            validation = _decision_queries(gallery, n_queries, tolerance, seed)
+            if size <= legacy_max:
+                known = list(gallery.astype(np.float64))
+                expected = []
+                for query in validation:
+                    matches = face_recognition.compare_faces(known, query, tolerance)
+                    distances = face_recognition.face_distance(known, query)
+                    expected.append(int(np.argmin(distances)) if any(matches) else None)
+            else:
+                reference = ExactIndex()
+                reference.reset(ids, gallery)
+                expected = [int(found[0]) if distances[0] <= tolerance else None
+                            for distances, found in (reference.search(query) for query in validation)]
+
+            gallery_path = os.path.join(directory, f'gallery-{size}.fgal')
+            for kind in index_kinds:
+                if kind == 'sharded':
+                    index = ShardedIndex(shards=shards, directory=directory)
+                elif kind in ('sq8', 'pq'):
+                    index = create_index(kind, radius=tolerance)
+                else:
+                    index = create_index(kind)
+                face_gallery = FaceGallery(index)
+                if kind in ('sq8', 'pq'):
+                    if not os.path.exists(gallery_path):
+                        write_gallery(gallery_path, gallery, ids=ids, meta={'match_mode': 'min'})
+                    face_gallery.open(gallery_path)
+                else:
+                    face_gallery.load_arrays(ids, gallery, {})
+                if kind == 'ivf':
+                    face_gallery.index.train()
+                elif kind == 'sharded':
+                    face_gallery.index.start()
+
+                samples = []
+                for query in queries:
+                    start = time.perf_counter()
+                    face_gallery.search(query, k=1)
+                    samples.append(time.perf_counter() - start)
+                agree = 0
+                for query, decision in zip(validation, expected):
+                    match = face_gallery.best_match(query, tolerance)
+                    agree += (match[0] if match else None) == decision
+                results.append({
+                    'size': size, 'index': kind, **latency_stats(samples),
+                    'memory_mb': round(face_gallery.index.memory_bytes() / 2**20, 1),
+                    'decisions': round(agree / len(validation), 4),
+                })
+                if kind in ('sq8', 'pq'):
+                    results[-1]['mapped_mb'] = round(os.path.getsize(gallery_path) / 2**20, 1)
+                if kind == 'sharded':
+                    face_gallery.index.stop()
+
+            # Référence : comparaison linéaire de l'ancienne implémentation (liste d'encodages)
+            if size <= legacy_max:
+                samples = []
+                for query in queries[:min(n_queries, 50)]:
+                    start = time.perf_counter()
+                    face_recognition.compare_faces(known, query)
+                    samples.append(time.perf_counter() - start)
+                results.append({'size': size, 'index': 'compare_faces', **latency_stats(samples)})
+    return results
+
+
+def _import_app(workers, cache):
+    """Importer l'application sur une base SQLite temporaire (configuration lue à l'import)"""
+    if 'app' in sys.modules:
+        return sys.modules['app']
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='face-bench-'), 'bench.db')
+    os.environ['GALLERY_FILE'] = ''
+    os.environ['ENCODING_CACHE'] = cache
+    if workers is not None:
+        os.environ['ENCODING_WORKERS'] = str(workers)
+    import app
+    if not app.warmup.wait():
+        raise RuntimeError(f"Préchauffage du serveur en échec: {app.warmup.error}")
+    return app
+
+
+def _populate(app_module, size, seed):
+    """Remplacer les utilisateurs par `size` utilisateurs synthétiques"""
+    import bcrypt
+    from encoding_codec import encode_encoding
+
+    # Un seul hachage bcrypt (coût minimal) partagé par les utilisateurs synthétiques
+    password_hash = bcrypt.hashpw(b'benchmark', bcrypt.gensalt(4)).decode('utf-8')
+    gallery, _ = synthetic_gallery(max(size, 1), n_queries=1, seed=seed)
+    with app_module.db_manager.cursor(commit=True) as cursor:
+        cursor.execute("DELETE FROM face_encodings")
+        cursor.execute("DELETE FROM users")
+        cursor.executemany(
+            "INSERT INTO users (id, username, email, password_hash) VALUES (%s, %s, %s, %s)",
+            [(i + 1, f'bench{i}', f'bench{i}@example.com', password_hash) for i in range(size)]
+        )
+        cursor.executemany(
+            "INSERT INTO face_encodings (user_id, face_encoding) VALUES (%s, %s)",
+            [(i + 1, encode_encoding(gallery[i])) for i in range(size)]
+        )
+
+
+def bench_login(sizes, images, n_requests=50, concurrency=1, workers=None, cache='none', seed=0):
+    """Débit et latence de /api/login de bout en bout pour chaque taille de galerie"""
+    app_module = _import_app(workers, cache)
+    results = []
+    for size in sizes:
+        _populate(app_module, size, seed)
+        client = app_module.app.test_client()
+
+        # Les images d'exemple sont inscrites pour que les connexions aboutissent
+        register_samples = []
+        for i, (name, image_data) in enumerate(images):
+            start = time.perf_counter()
+            client.post('/api/register', data={
+                'username': f'sample{i}', 'email': f'sample{i}@example.com', 'password': 'benchmark',
+                'face_data': (io.BytesIO(image_data), name),
+            }, content_type='multipart/form-data')
+            register_samples.append(time.perf_counter() - start)
+        app_module.load_face_gallery()
+
+        samples = []
+        statuses = {}
+        lock = threading.Lock()
+
+        def run(worker_id):
+            worker_client = app_module.app.test_client()
+            for n in range(worker_id, n_requests, concurrency):
+                name, image_data = images[n % len(images)]
+                start = time.perf_counter()
+                response = worker_client.post('/api/login', data=image_data, content_type='application/octet-stream')
+                elapsed = time.perf_counter() - start
+                with lock:
+                    samples.append(elapsed)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+
+        results.append({
+            'size': size,
+            'gallery_size': len(app_module.face_gallery),
+            'concurrency': concurrency,
+            'requests': n_requests,
+            'requests_per_s': round(n_requests / duration, 2),
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+            'register': latency_stats(register_samples),
+            **latency_stats(samples),
+        })
+    return results
+
+
+def _sync_worker(conn, db_path, interval):
+    """Processus du scénario sync : une instance de l'application, pilotée par un tube"""
+    os.environ.update({
+        'DB_BACKEND': 'sqlite',
+        'SQLITE_PATH': db_path,
+        'GALLERY_FILE': '',
+        'ENCODING_CACHE': 'none',
+        'ENCODING_WORKERS': '0',
+        'GALLERY_SYNC_INTERVAL': str(interval),
+        'BCRYPT_ROUNDS': '4',
+    })
+    import app
+    app.warmup.wait()
+    client = app.app.test_client()
+    conn.send('ready')
+    for action, payload in iter(conn.recv, None):
+        if action == 'register':
+            username, name, image_data = payload
+            response = client.post('/api/register', data={
+                'username': username, 'email': f'{username}@example.com', 'password': 'benchmark',
+                'face_data': (io.BytesIO(image_data), name),
+            }, content_type='multipart/form-data')
+        else:
+            response = client.post('/api/login', data=payload, content_type='application/octet-stream')
+        conn.send((response.status_code, (response.get_json() or {}).get('username')))
+
+
+def bench_sync(images, n_workers=3, interval=1.0, timeout=10.0):
+    """Délai de propagation d'une inscription d'un worker à chacun des autres"""
+    context = multiprocessing.get_context('spawn')
+    db_path = os.path.join(tempfile.mkdtemp(prefix='face-bench-sync-'), 'sync.db')
+    pipes, processes = [], []
+    for _ in range(n_workers):
+        parent, child = context.Pipe()
+        process = context.Process(target=_sync_worker, args=(child, db_path, interval), daemon=True)
+        process.start()
+        pipes.append(parent)
+        processes.append(process)
+
+    delays = []
+    missed = 0
+    registered = 0
+    try:
+        for pipe in pipes:
+            pipe.recv()
+        for i, (name, image_data) in enumerate(images):
+            # Inscriptions réparties entre les workers, connexion tentée par tous les autres
+            writer = i % n_workers
+            username = f'sync{i}'
+            pipes[writer].send(('register', (username, name, image_data)))
+            status, _ = pipes[writer].recv()
+            start = time.perf_counter()
+            if status != 201:
+                continue
+            registered += 1
+            for reader, pipe in enumerate(pipes):
+                if reader == writer:
+                    continue
+                while True:
+                    pipe.send(('login', image_data))
+                    status, matched = pipe.recv()
+                    elapsed = time.perf_counter() - start
+                    if status == 200 and matched == username:
+                        delays.append(elapsed)
+                        break
+                    if elapsed > timeout:
+                        missed += 1
+                        break
+                    time.sleep(0.02)
+    finally:
+        for pipe in pipes:
+            pipe.send(None)
+        for process in processes:
+            process.join(timeout=10)
+
+    return [{
+        'workers': n_workers,
+        'interval_s': interval,
+        'users': registered,
+        'missed': missed,
+        **latency_stats(delays),
+    }]
+
+
+def run_metadata(args):
+    """Contexte de la mesure (commit, machine, versions, paramètres)"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'encoding_dim': ENCODING_DIM,
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+    }
+
+
+def _flatten(results):
+    """Mesures comparables {chemin: valeur} (latences et débits)"""
+    flat = {}
+    for section in ('encode', 'match', 'login', 'sync'):
+        for entry in results.get(section, []):
+            label = '/'.join(str(entry[key]) for key in ('image', 'index', 'size', 'concurrency', 'workers') if key in entry)
+            for key, value in entry.items():
+                if key.endswith('_ms') or key.endswith('_per_s'):
+                    flat[f'{section}/{label}/{key}'] = value
+    return flat
+
+
+def compare(before_path, after_path):
+    """Afficher l'évolution de chaque mesure entre deux fichiers de résultats"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    old, new = _flatten(before), _flatten(after)
+
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    for key in sorted(old.keys() & new.keys()):
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100
+        # Un débit qui baisse ou une latence qui monte est une régression
+        worse = change < 0 if key.endswith('_per_s') else change > 0
+        flag = ' !' if worse and abs(change) >= 10 else ''
+        print(f"{key:<60} {old[key]:>10} {new[key]:>10} {change:>+7.1f}%{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai : encodage, recherche et connexion de bout en bout")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="Tailles de galerie")
+    parser.add_argument('--login-sizes', type=int, nargs='+', default=None, help="Tailles pour la connexion (défaut --sizes)")
+    parser.add_argument('--images', default=DEFAULT_IMAGES, help="Répertoire des images d'exemple")
+    parser.add_argument('--repeats', type=int, default=5, help="Encodages par image")
+    parser.add_argument('--queries', type=int, default=200, help="Recherches par taille de galerie")
+    parser.add_argument('--index', nargs='+', default=['exact'], choices=['exact', 'ivf', 'sq8', 'pq', 'sharded'])
+    parser.add_argument('--shards', type=int, default=None, help="Processus de l'index 'sharded' (défaut un par cœur)")
+    parser.add_argument('--requests', type=int, default=50, help="Connexions par taille de galerie")
+    parser.add_argument('--concurrency', type=int, default=1, help="Clients simultanés")
+    parser.add_argument('--workers', type=int, default=None, help="ENCODING_WORKERS du serveur mesuré")
+    parser.add_argument('--cache', default='none', help="ENCODING_CACHE du serveur mesuré")
+    parser.add_argument('--sync-workers', type=int, default=3, help="Processus du scénario sync")
+    parser.add_argument('--sync-interval', type=float, default=1.0, help="GALLERY_SYNC_INTERVAL du scénario sync")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip', nargs='*', default=[], choices=['encode', 'match', 'login', 'sync'])
+    parser.add_argument('--output', help="Fichier JSON des résultats")
+    parser.add_argument('--compare', nargs=2, metavar=('AVANT', 'APRES'), help="Comparer deux fichiers de résultats")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    images = load_sample_images(args.images)
+    results = {'meta': run_metadata(args)}
+    if 'encode' not in args.skip:
+        print("Encodage...", flush=True)
+        results['encode'] = bench_encode(images, args.repeats)
+    if 'match' not in args.skip:
+        print("Recherche...", flush=True)
+        results['match'] = bench_match(args.sizes, args.queries, args.index, shards=args.shards, seed=args.seed)
+    if 'login' not in args.skip:
+        print("Connexion de bout en bout...", flush=True)
+        results['login'] = bench_login(
+            args.login_sizes or args.sizes, images, args.requests, args.concurrency,
+            workers=args.workers, cache=args.cache, seed=args.seed
+        )
+        sys.modules['app'].encoding_engine.shutdown()
+    if 'sync' not in args.skip:
+        print("Synchronisation entre workers...", flush=True)
+        results['sync'] = bench_sync(images, args.sync_workers, args.sync_interval)
+
+    for section in ('encode', 'match', 'login', 'sync'):
+        for entry in results.get(section, []):
+            label = ' '.join(f"{key}={entry[key]}" for key in ('image', 'index', 'size', 'workers') if key in entry)
+            extra = f" {entry['requests_per_s']} req/s" if 'requests_per_s' in entry else ''
+            if 'memory_mb' in entry:
+                extra += f" {entry['memory_mb']} Mo, décisions {entry['decisions']:.2%}"
+            if 'mapped_mb' in entry:
+                extra += f" (+ {entry['mapped_mb']} Mo projetés)"
+            print(f"{section:<7} {label:<40} p50 {entry.get('p50_ms')} ms  p95 {entry.get('p95_ms')} ms{extra}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Accès à la base de données : configuration, pool de connexions et schéma
+"""
+
+import os
+import logging
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+from dotenv import load_dotenv
+
+import sqlite_backend
+from db_pool import ConnectionPool, PoolTimeoutError
+from sqlite_backend import sqlite_connector
+
+# Charger les variables d'environnement
+load_dotenv()
+
+# Configuration de la base de données
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'user': os.getenv('DB_USER', 'root'),
+    'password': os.getenv('DB_PASSWORD', ''),
+    'database': os.getenv('DB_NAME', 'face_recognition_db'),
+    'charset': 'utf8mb4'
+}
+
+# Backend de base de données : 'mysql' en production, 'sqlite' pour les tests locaux
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'face_recognition.db')
+
+# Pool de connexions
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+
+logger = logging.getLogger(__name__)
+
+class DatabaseManager:
+    def __init__(self, backend=None, sqlite_path=None, pool_size=None):
+        self.backend = backend or DB_BACKEND
+        
+        if self.backend == 'sqlite':
+            connect = sqlite_connector(sqlite_path or SQLITE_PATH)
+            self.integrity_errors = (sqlite_backend.IntegrityError,)
+            self.database_errors = (sqlite_backend.Error, PoolTimeoutError)
+        elif self.backend == 'mysql':
+            connect = self.connect_mysql
+            self.integrity_errors = (mysql.connector.IntegrityError,)
+            self.database_errors = (Error, PoolTimeoutError)
+        else:
+            raise ValueError(f"Backend de base de données inconnu: {self.backend}")
+        
+        self.pool = ConnectionPool(connect, size=pool_size or DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
+        self.create_tables()
+    
+    @staticmethod
+    def connect_mysql():
+        """Établir une connexion MySQL pour le pool"""
+        try:
+            connection = mysql.connector.connect(**DB_CONFIG)
+            logger.info("Connexion à la base de données établie")
+            return connection
+        except Error as e:
+            logger.error(f"Erreur de connexion à la base de données: {e}")
+            raise
+    
+    def connection(self):
+        """Emprunter une connexion au pool pour la durée d'un bloc `with`"""
+        return self.pool.connection()
+    
+    @contextmanager
+    def cursor(self, dictionary=False, commit=False):
+        """Curseur sur une connexion empruntée, fermé et rendu en fin de bloc"""
+        with self.pool.connection() as connection:
+            cursor = connection.cursor(dictionary=dictionary)
+            try:
+                yield cursor
+                if commit:
+                    connection.commit()
+            finally:
+                cursor.close()
+    
+    def create_tables(self):
+        """Créer les tables nécessaires"""
+        try:
+            with self.cursor(commit=True) as cursor:
+                if self.backend == 'sqlite':
+                    for statement in sqlite_backend.CREATE_TABLES:
+                        cursor.execute(statement)
+                    logger.info("Tables créées avec succès")
+                    return
+                
+                # Table des utilisateurs
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS users (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        username VARCHAR(50) UNIQUE NOT NULL,
+                        email VARCHAR(100) UNIQUE NOT NULL,
+                        password_hash VARCHAR(255) NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # Table des encodages faciaux
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS face_encodings (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        user_id INT NOT NULL,
+                        face_encoding BLOB NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                    )
+                """)
+                
+                # Journal des changements d'encodages (synchronisation des galeries entre workers)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS face_encoding_changes (
+                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                        user_id INT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                logger.info("Tables créées avec succès")
+                
+                # Signaler une base encore au format texte (avant migration)
+                cursor.execute("""
+                    SELECT DATA_TYPE FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE()
+                      AND TABLE_NAME = 'face_encodings'
+                      AND COLUMN_NAME = 'face_encoding'
+                """)
+                column = cursor.fetchone()
+                if column and column[0].lower().endswith('text'):
+                    logger.warning("Encodages faciaux au format texte: exécutez migrate_encodings.py")
+            
+        except Exception as e:
+            logger.error(f"Erreur lors de la création des tables: {e}")
+            raise
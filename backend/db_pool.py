@@ -0,0 +1,189 @@
+"""
+Pool de connexions à la base de données
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """Aucune connexion disponible avant l'expiration du délai d'attente"""
+
+
+def ping_connection(connection):
+    """Vérifier qu'une connexion est encore utilisable"""
+    if hasattr(connection, 'is_connected'):
+        return connection.is_connected()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        return True
+    finally:
+        cursor.close()
+
+
+class ConnectionPool:
+    """Pool borné de connexions, créées à la demande et vérifiées à l'emprunt"""
+
+    def __init__(self, connect, size=5, timeout=10.0, health_check=ping_connection):
+        if size < 1:
+            raise ValueError("La taille du pool doit être au moins 1")
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self._health_check = health_check
+        self._cond = threading.Condition()
+        self._idle = []
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        # Métriques cumulées
+        self._checkouts = 0
+        self._timeouts = 0
+        self._health_failures = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _is_healthy(self, connection):
+        try:
+            return bool(self._health_check(connection))
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def acquire(self, timeout=None):
+        """Emprunter une connexion, en attendant au plus `timeout` secondes"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Pool de connexions fermé")
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        connection = self._idle.pop()
+                        break
+                    if self._created < self.size:
+                        # Réserver la place, la connexion est ouverte hors verrou
+                        self._created += 1
+                        connection = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Aucune connexion disponible après {timeout:.1f}s "
+                            f"({self.size} connexions utilisées)"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_use += 1
+
+        try:
+            if connection is not None and not self._is_healthy(connection):
+                with self._cond:
+                    self._health_failures += 1
+                self._close_quietly(connection)
+                connection = None
+            if connection is None:
+                connection = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+        wait = time.monotonic() - start
+        with self._cond:
+            self._checkouts += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        return connection
+
+    def release(self, connection, discard=False):
+        """Rendre une connexion au pool (ou la fermer si elle est inutilisable)"""
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._created -= 1
+            else:
+                self._idle.append(connection)
+                connection = None
+            self._cond.notify()
+        if connection is not None:
+            self._close_quietly(connection)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Emprunter une connexion pour la durée d'un bloc `with`"""
+        connection = self.acquire(timeout)
+        discard = False
+        try:
+            yield connection
+        except Exception:
+            # Annuler la transaction en cours avant de rendre la connexion
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+            raise
+        else:
+            # Terminer aussi une transaction de lecture : en REPEATABLE READ (MySQL), son
+            # instantané serait sinon réutilisé par le prochain emprunteur de la connexion
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+        finally:
+            self.release(connection, discard=discard)
+
+    def discard_idle(self):
+        """Fermer les connexions inactives sans fermer le pool (avant un fork)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+    def close(self):
+        """Fermer les connexions inactives et refuser les nouveaux emprunts"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+    def metrics(self):
+        """Instantané des métriques du pool"""
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'health_check_failures': self._health_failures,
+                'wait_time_total_ms': round(self._total_wait * 1000, 3),
+                'wait_time_avg_ms': round(self._total_wait * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                'wait_time_max_ms': round(self._max_wait * 1000, 3),
+            }
@@ -0,0 +1,257 @@
+"""
+Cache des résultats d'encodage indexé par l'empreinte des octets de l'image
+
+Un client qui renvoie la même image (nouvelle tentative de connexion) ne paie
+ni le décodage, ni la détection, ni l'encodage. Les verdicts d'échec
+déterministes (aucun visage, plusieurs visages, image illisible) sont
+également mis en cache.
+
+Stockages :
+- memory : LRU propre au processus
+- file : un fichier par entrée dans un répertoire, partagé entre les processus
+  du serveur (workers gunicorn) d'une même machine
+- redis : serveur Redis (ou compatible), paquet `redis` requis
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from encoding_codec import decode_encoding, encode_encoding
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Préfixes des valeurs sérialisées : encodage réussi ou verdict d'échec
+_RESULT = b'R'
+_ERROR = b'X'
+
+
+class MemoryStore:
+    """LRU borné en nombre d'entrées, avec durée de vie"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if self.ttl and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class FileStore:
+    """Une entrée par fichier ; éviction des plus anciennes au-delà de `max_entries`"""
+
+    name = 'file'
+    # Fréquence (en écritures) du contrôle de taille du répertoire
+    prune_every = 64
+
+    def __init__(self, directory, max_entries=1024, ttl=300):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory) if not name.startswith('.'))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.ttl and os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        # Écriture atomique : un autre processus ne lit jamais une entrée partielle
+        tmp_path = os.path.join(self.directory, f".{key}.{os.getpid()}.{threading.get_ident()}")
+        with open(tmp_path, 'wb') as f:
+            f.write(value)
+        os.replace(tmp_path, self._path(key))
+
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        """Supprimer les entrées expirées puis les plus anciennes au-delà de la limite"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        now = time.time()
+        excess = len(entries) - self.max_entries
+        for i, (mtime, path) in enumerate(entries):
+            if i >= excess and not (self.ttl and mtime + self.ttl < now):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class RedisStore:
+    """Entrées stockées dans Redis avec expiration (SETEX), partagées entre machines"""
+
+    name = 'redis'
+
+    def __init__(self, url, ttl=300, prefix='face-encoding:'):
+        if redis is None:
+            raise RuntimeError("Le cache Redis nécessite le paquet redis (pip install redis)")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(self.prefix + key)
+
+    def set(self, key, value):
+        if self.ttl:
+            self._client.setex(self.prefix + key, int(self.ttl), value)
+        else:
+            self._client.set(self.prefix + key, value)
+
+
+def create_store(backend, max_entries=1024, ttl=300, path=None, redis_url=None):
+    """Créer le stockage du cache (memory, file, redis) ; None si désactivé"""
+    backend = (backend or 'none').lower()
+    if backend in ('none', 'off', ''):
+        return None
+    if backend == 'memory':
+        return MemoryStore(max_entries, ttl)
+    if backend == 'file':
+        return FileStore(path or 'encoding_cache', max_entries, ttl)
+    if backend == 'redis':
+        return RedisStore(redis_url or 'redis://localhost:6379/0', ttl)
+    raise ValueError(f"Stockage de cache inconnu: {backend}")
+
+
+class EncodingCache:
+    """Résultats de detect_and_encode indexés par l'empreinte de l'image
+
+    `namespace` distingue les réglages qui changent le résultat (tailles de
+    détection) : deux serveurs configurés différemment ne partagent pas d'entrées.
+    """
+
+    def __init__(self, store, namespace=''):
+        self.store = store
+        self._namespace = namespace.encode('utf-8')
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    def key(self, image_data):
+        """Empreinte rapide des octets de l'image"""
+        digest = hashlib.blake2b(self._namespace, digest_size=16)
+        digest.update(image_data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """(encodage, détails), ValueError du verdict mis en cache, ou None si absent"""
+        try:
+            value = self.store.get(key)
+        except Exception as e:
+            # Un cache indisponible ne doit jamais faire échouer une reconnaissance
+            logger.warning(f"Lecture du cache d'encodage impossible: {e}")
+            value = None
+            with self._lock:
+                self.errors += 1
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            return None
+
+        if value[:1] == _ERROR:
+            return ValueError(value[1:].decode('utf-8'))
+        size = int.from_bytes(value[1:5], 'little')
+        encoding = decode_encoding(value[5:5 + size])
+        return encoding, json.loads(value[5 + size:].decode('utf-8'))
+
+    def put(self, key, result):
+        """Mémoriser un résultat (encodage, détails) ou un verdict ValueError"""
+        if isinstance(result, ValueError):
+            value = _ERROR + str(result).encode('utf-8')
+        elif isinstance(result, Exception):
+            # Délais dépassés et pannes ne sont pas des verdicts sur l'image
+            return
+        else:
+            encoding, details = result
+            blob = encode_encoding(encoding, np.float64)
+            value = _RESULT + len(blob).to_bytes(4, 'little') + blob + json.dumps(details).encode('utf-8')
+
+        try:
+            self.store.set(key, value)
+        except Exception as e:
+            logger.warning(f"Écriture du cache d'encodage impossible: {e}")
+            with self._lock:
+                self.errors += 1
+
+    def stats(self):
+        """Compteurs du cache pour /api/health"""
+        if self.store is None:
+            return {'backend': 'none'}
+        lookups = self.hits + self.misses
+        # Redis : pas de comptage (parcours de toutes les clés)
+        entries = len(self.store) if hasattr(self.store, '__len__') else None
+        return {
+            'backend': self.store.name,
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'errors': self.errors,
+        }
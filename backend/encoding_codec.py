@@ -0,0 +1,65 @@
+"""
+Format binaire compact des encodages faciaux stockés en base
+
+Chaque encodage est un BLOB de taille fixe : un en-tête de 4 octets
+(signature b'FE', version, code du dtype) suivi des 128 composantes
+brutes, soit 516 octets en float32 ou 1028 octets en float64.
+"""
+
+import json
+
+import numpy as np
+
+from face_index import ENCODING_DIM
+
+MAGIC = b'FE'
+FORMAT_VERSION = 1
+HEADER_SIZE = 4
+
+# Codes de dtype stockés dans l'en-tête
+DTYPE_CODES = {
+    1: np.dtype('<f4'),
+    2: np.dtype('<f8'),
+}
+_CODES_BY_DTYPE = {dtype: code for code, dtype in DTYPE_CODES.items()}
+
+
+def encode_encoding(encoding, dtype=np.float32):
+    """Sérialiser un encodage en BLOB binaire versionné"""
+    dtype = np.dtype(dtype).newbyteorder('<')
+    if dtype not in _CODES_BY_DTYPE:
+        raise ValueError(f"Type d'encodage non supporté: {dtype}")
+
+    values = np.asarray(encoding, dtype=dtype).reshape(ENCODING_DIM)
+    header = MAGIC + bytes((FORMAT_VERSION, _CODES_BY_DTYPE[dtype]))
+    return header + values.tobytes()
+
+
+def is_legacy_encoding(stored):
+    """Indiquer si la valeur stockée est l'ancien format texte '[...]'"""
+    if isinstance(stored, str):
+        return True
+    return bytes(stored[:1]) == b'['
+
+
+def decode_encoding(stored):
+    """Désérialiser un encodage stocké (BLOB binaire ou ancien format texte)"""
+    if is_legacy_encoding(stored):
+        if not isinstance(stored, str):
+            stored = bytes(stored).decode('utf-8')
+        return np.array(json.loads(stored), dtype=np.float64)
+
+    if bytes(stored[:2]) != MAGIC:
+        raise ValueError("Signature d'encodage invalide")
+    version, code = stored[2], stored[3]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Version d'encodage non supportée: {version}")
+    if code not in DTYPE_CODES:
+        raise ValueError(f"Code de type d'encodage inconnu: {code}")
+
+    dtype = DTYPE_CODES[code]
+    if len(stored) != HEADER_SIZE + ENCODING_DIM * dtype.itemsize:
+        raise ValueError("Taille d'encodage invalide")
+
+    # Vue sans copie sur le tampon renvoyé par le pilote
+    return np.frombuffer(stored, dtype=dtype, count=ENCODING_DIM, offset=HEADER_SIZE)
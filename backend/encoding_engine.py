@@ -0,0 +1,193 @@
+"""
+Moteur d'encodage facial adossé à un pool de processus pré-chauffés
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import face_encoder
+
+logger = logging.getLogger(__name__)
+
+
+class EngineBusyError(Exception):
+    """File d'attente du moteur pleine : la requête doit être réessayée plus tard"""
+
+    def __init__(self, retry_after):
+        super().__init__("Serveur de reconnaissance saturé, réessayez plus tard")
+        self.retry_after = retry_after
+
+
+class EncodingTimeoutError(Exception):
+    """Le travail d'encodage a dépassé son délai"""
+
+
+def _init_worker():
+    """Initialiser un processus de travail : modèles chargés une seule fois"""
+    face_encoder.warm_up()
+
+
+def _ready():
+    return os.getpid()
+
+
+class EncodingEngine:
+    """Exécute les travaux d'encodage dans des processus, avec file bornée et délai par travail"""
+
+    def __init__(self, workers=None, max_pending=None, job_timeout=30.0,
+                 retry_after=1, start_method=None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending or max(2 * self.workers, 1)
+        self.job_timeout = job_timeout
+        self.retry_after = retry_after
+        self.start_method = start_method
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def inline(self):
+        """Sans processus de travail, les encodages tournent sur le thread de la requête"""
+        return self.workers == 0
+
+    def _create_executor(self):
+        methods = multiprocessing.get_all_start_methods()
+        method = self.start_method or ('fork' if 'fork' in methods else 'spawn')
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(method),
+            initializer=_init_worker
+        )
+
+    def start(self):
+        """Démarrer et pré-chauffer tous les processus de travail"""
+        if self.inline:
+            face_encoder.warm_up()
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            executor = self._executor
+        # Un travail par processus force leur création et leur initialisation
+        for future in [executor.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+        logger.info(f"Moteur d'encodage prêt: {self.workers} processus")
+
+    def _restart(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                logger.error("Pool de processus d'encodage interrompu, redémarrage")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+
+    def _submit(self, fn, args, check_capacity):
+        """Soumettre un travail en réservant une place dans la file"""
+        with self._lock:
+            if check_capacity and self._pending >= self.max_pending:
+                raise EngineBusyError(self.retry_after)
+            self._pending += 1
+            if self._executor is None:
+                self._executor = self._create_executor()
+            executor = self._executor
+
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._release_slot()
+            self._restart(executor)
+            raise
+        except Exception:
+            self._release_slot()
+            raise
+        # La place est libérée à la fin réelle du travail, même après un délai dépassé
+        future.add_done_callback(lambda _: self._release_slot())
+        return executor, future
+
+    def _result(self, executor, future, timeout):
+        try:
+            return future.result(timeout=self.job_timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise EncodingTimeoutError("Délai d'encodage dépassé")
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    def run(self, fn, *args, timeout=None):
+        """Exécuter `fn(*args)` dans un processus de travail et attendre son résultat"""
+        if self.inline:
+            return fn(*args)
+
+        executor, future = self._submit(fn, args, check_capacity=True)
+        return self._result(executor, future, timeout)
+
+    def imap(self, fn, args_list, window=None, check_capacity=False):
+        """Exécuter `fn` sur chaque tuple d'arguments, au plus `window` travaux à la fois
+
+        Renvoie dans l'ordre, pour chaque travail, son résultat ou l'exception levée.
+        Par défaut la moitié de la file reste disponible pour les requêtes interactives.
+        Avec `check_capacity`, EngineBusyError est levée si la file est pleine avant le
+        premier travail, et l'anticipation des suivants s'arrête tant qu'elle l'est.
+        Fermer le générateur annule les travaux pas encore démarrés.
+        """
+        if self.inline:
+            for args in args_list:
+                try:
+                    yield fn(*args)
+                except Exception as e:
+                    yield e
+            return
+
+        window = window or max(1, self.max_pending // 2)
+        in_flight = deque()
+        args_iter = iter(args_list)
+        args = None
+        exhausted = False
+
+        try:
+            while in_flight or not exhausted:
+                while not exhausted and len(in_flight) < window:
+                    if args is None:
+                        try:
+                            args = next(args_iter)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                    try:
+                        in_flight.append(self._submit(fn, args, check_capacity=check_capacity))
+                    except EngineBusyError:
+                        if not in_flight:
+                            raise
+                        break
+                    args = None
+
+                if in_flight:
+                    executor, future = in_flight.popleft()
+                    try:
+                        yield self._result(executor, future, None)
+                    except Exception as e:
+                        yield e
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+    def _release_slot(self):
+        with self._lock:
+            self._pending -= 1
+
+    def pending(self):
+        """Nombre de travaux en cours ou en file"""
+        return self._pending
+
+    def shutdown(self):
+        """Arrêter les processus de travail"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
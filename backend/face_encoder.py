@@ -0,0 +1,125 @@
+"""
+Pipeline d'encodage facial, exécutable dans le serveur ou dans un processus de travail
+"""
+
+import base64
+import logging
+import os
+import time
+
+import cv2
+import numpy as np
+import face_recognition
+
+logger = logging.getLogger(__name__)
+
+# Les images plus grandes sont réduites dès le décodage (0 = pas de limite)
+MAX_IMAGE_DIMENSION = int(os.getenv('MAX_IMAGE_DIMENSION', 1920))
+
+# La détection tourne sur une copie dont le plus grand côté ne dépasse pas cette taille
+DETECTION_MAX_DIMENSION = int(os.getenv('DETECTION_MAX_DIMENSION', 640))
+
+
+def decode_data_url(base64_image):
+    """Extraire les octets d'une image transmise en data URL base64"""
+    try:
+        payload = base64_image.split(',', 1)[1] if ',' in base64_image else base64_image
+        return base64.b64decode(payload)
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("Données d'image base64 invalides")
+
+
+def _resize_to_max(image, max_dimension):
+    """Réduire une image pour que son plus grand côté ne dépasse pas `max_dimension`"""
+    height, width = image.shape[:2]
+    if not max_dimension or max(height, width) <= max_dimension:
+        return image, 1.0
+    scale = max_dimension / max(height, width)
+    resized = cv2.resize(image, (0, 0), None, scale, scale, interpolation=cv2.INTER_AREA)
+    return resized, scale
+
+
+def _scale_locations(face_locations, scale, shape):
+    """Ramener des boîtes (top, right, bottom, left) détectées à l'échelle `scale` en pleine résolution"""
+    height, width = shape[:2]
+    return [
+        (
+            max(0, int(round(top / scale))),
+            min(width, int(round(right / scale))),
+            min(height, int(round(bottom / scale))),
+            max(0, int(round(left / scale))),
+        )
+        for top, right, bottom, left in face_locations
+    ]
+
+
+def detect_and_encode(image_data, detection_max_dimension=None, max_image_dimension=None):
+    """Détecter l'unique visage sur une copie réduite et l'encoder en pleine résolution
+
+    Renvoie l'encodage et les détails du traitement (tailles, échelle de
+    détection et durée de chaque étape en secondes dans `timings`).
+    """
+    detection_max_dimension = DETECTION_MAX_DIMENSION if detection_max_dimension is None else detection_max_dimension
+    max_image_dimension = MAX_IMAGE_DIMENSION if max_image_dimension is None else max_image_dimension
+
+    timings = {}
+    start = time.perf_counter()
+    nparr = np.frombuffer(image_data, np.uint8)
+    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    timings['imdecode'] = time.perf_counter() - start
+    if image is None:
+        raise ValueError("Image illisible")
+    original_size = image.shape[1], image.shape[0]
+
+    # Plafonner les envois surdimensionnés avant tout traitement
+    start = time.perf_counter()
+    image, upload_scale = _resize_to_max(image, max_image_dimension)
+
+    # Convertir BGR vers RGB
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    # Détecter les visages sur une copie réduite
+    small_image, scale = _resize_to_max(rgb_image, detection_max_dimension)
+    timings['resize'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    face_locations = face_recognition.face_locations(small_image)
+    timings['face_locations'] = time.perf_counter() - start
+
+    if not face_locations:
+        raise ValueError("Aucun visage détecté dans l'image")
+
+    if len(face_locations) > 1:
+        raise ValueError("Plusieurs visages détectés. Veuillez ne capturer qu'un seul visage.")
+
+    if scale != 1.0:
+        face_locations = _scale_locations(face_locations, scale, rgb_image.shape)
+
+    # Encoder le visage sur l'image en pleine résolution, limité à la boîte détectée
+    start = time.perf_counter()
+    face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
+    timings['face_encodings'] = time.perf_counter() - start
+
+    if not face_encodings:
+        raise ValueError("Impossible d'encoder le visage détecté")
+
+    details = {
+        'image_size': list(original_size),
+        'processed_size': [rgb_image.shape[1], rgb_image.shape[0]],
+        # Échelle de détection par rapport à l'image envoyée
+        'detection_scale': round(upload_scale * scale, 4),
+        'timings': timings,
+    }
+    return face_encodings[0], details
+
+
+def encode_face_image(image_data):
+    """Détecter l'unique visage d'une image JPEG/PNG et renvoyer son encodage"""
+    return detect_and_encode(image_data)[0]
+
+
+def warm_up():
+    """Exécuter une détection et un encodage factices pour charger les modèles dlib"""
+    blank = np.zeros((150, 150, 3), dtype=np.uint8)
+    face_recognition.face_locations(blank)
+    face_recognition.face_encodings(blank, [(0, 150, 150, 0)])
@@ -0,0 +1,191 @@
+"""
+Galerie d'encodages faciaux résidente en mémoire
+"""
+
+import threading
+
+import numpy as np
+
+from face_index import ExactIndex
+from gallery_file import open_gallery, write_gallery
+
+# Notation d'un utilisateur à plusieurs échantillons : échantillon le plus proche ou centroïde
+MATCH_MODES = ('min', 'centroid')
+
+
+class FaceGallery:
+    """Encodages des utilisateurs indexés par user_id, recherche déléguée à un index (exact par défaut)
+
+    Un utilisateur peut avoir plusieurs échantillons. En mode 'min', l'index
+    contient tous les échantillons et un utilisateur est noté par le plus
+    proche ; en mode 'centroid', il contient un centroïde par utilisateur,
+    recalculé à partir des échantillons en base à chaque synchronisation.
+    """
+
+    def __init__(self, index=None, match_mode='min'):
+        if match_mode not in MATCH_MODES:
+            raise ValueError(f"Mode de correspondance inconnu: {match_mode}")
+        self.index = index if index is not None else ExactIndex()
+        self.dim = self.index.dim
+        self.match_mode = match_mode
+        self._usernames = {}
+        self._counts = {}
+        self._centroids = {}
+        # Empreinte des échantillons de chaque utilisateur (mode 'min') : somme de leurs
+        # projections sur un vecteur fixe, pour reconnaître un simple ajout d'échantillons
+        self._fingerprints = {}
+        self._probe = np.random.default_rng(0).standard_normal(self.dim)
+        # Borne du nombre d'échantillons par utilisateur (profondeur de recherche en mode 'min')
+        self._max_samples = 1
+        self._write_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.index)
+
+    def samples(self, user_id):
+        """Nombre d'échantillons enregistrés pour un utilisateur"""
+        return self._counts.get(user_id, 0)
+
+    def load(self, rows):
+        """Remplacer le contenu de la galerie par des lignes (user_id, username, encodage)"""
+        rows = list(rows)
+        user_ids = np.empty(len(rows), dtype=np.int64)
+        encodings = np.zeros((len(rows), self.dim), dtype=np.float32)
+        usernames = {}
+        for i, (user_id, username, encoding) in enumerate(rows):
+            user_ids[i] = user_id
+            encodings[i] = encoding
+            usernames[user_id] = username
+
+        self.load_arrays(user_ids, encodings, usernames)
+
+    def load_arrays(self, user_ids, encodings, usernames, sample_counts=None):
+        """Remplacer le contenu par des tableaux parallèles (une matrice np.memmap n'est pas copiée)
+
+        Avec `sample_counts`, les lignes sont déjà des centroïdes (fichier de
+        galerie écrit en mode 'centroid').
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64).reshape(-1)
+        if sample_counts is not None:
+            unique, counts = user_ids, np.asarray(sample_counts, dtype=np.int64)
+            centroids = encodings
+        else:
+            unique, inverse, counts = np.unique(user_ids, return_inverse=True, return_counts=True)
+            if self.match_mode == 'centroid':
+                sums = np.zeros((len(unique), self.dim), dtype=np.float64)
+                np.add.at(sums, inverse, np.asarray(encodings, dtype=np.float64))
+                centroids = sums / counts[:, None]
+            else:
+                fingerprints = np.bincount(inverse, weights=encodings @ self._probe, minlength=len(unique))
+
+        with self._write_lock:
+            self._usernames = dict(usernames)
+            self._counts = dict(zip(unique.tolist(), counts.tolist()))
+            self._max_samples = int(counts.max()) if len(counts) else 1
+            if self.match_mode == 'centroid':
+                self._centroids = dict(zip(unique.tolist(), centroids))
+                self._fingerprints = {}
+                self.index.reset(unique, centroids)
+            else:
+                self._centroids = {}
+                self._fingerprints = dict(zip(unique.tolist(), fingerprints.tolist()))
+                self.index.reset(user_ids, encodings)
+
+    def save(self, path, stamp=None):
+        """Écrire le contenu de la galerie dans un fichier de galerie binaire"""
+        user_ids, encodings = self.index.vectors()
+        labels = [self._usernames.get(int(user_id)) for user_id in user_ids]
+        meta = {'stamp': stamp, 'match_mode': self.match_mode}
+        if self.match_mode == 'centroid':
+            meta['sample_counts'] = [self._counts.get(int(user_id), 1) for user_id in user_ids]
+        write_gallery(path, encodings, ids=user_ids, labels=labels, meta=meta)
+
+    def open(self, path):
+        """Charger un fichier de galerie binaire par projection mémoire ; renvoie son empreinte"""
+        gallery = open_gallery(path)
+        match_mode = gallery.meta.get('match_mode', 'min')
+        if match_mode != self.match_mode:
+            raise ValueError(f"Fichier de galerie écrit en mode {match_mode}")
+
+        usernames = {int(user_id): label for user_id, label in zip(gallery.ids, gallery.labels)}
+        self.load_arrays(gallery.ids, gallery.encodings, usernames, gallery.meta.get('sample_counts'))
+        return gallery.meta.get('stamp')
+
+    def _appended(self, user_id, encodings):
+        """Échantillons ajoutés à la suite de ceux déjà indexés, ou None si l'utilisateur a changé autrement"""
+        count = self._counts.get(user_id, 0)
+        if self.match_mode != 'min' or not count or len(encodings) <= count:
+            return None
+        # Tolérance : la galerie a pu être chargée depuis un fichier en float32
+        if not np.isclose((encodings[:count] @ self._probe).sum(), self._fingerprints.get(user_id, np.nan),
+                          rtol=0, atol=1e-4):
+            return None
+        return encodings[count:]
+
+    def sync_users(self, users, removed=()):
+        """Aligner des utilisateurs sur la base : {user_id: (username, [encodages])} et user_id supprimés
+
+        Un utilisateur dont le nombre d'échantillons est déjà à jour n'est pas
+        retouché ; en mode 'min', de nouveaux échantillons qui suivent les
+        anciens sont simplement ajoutés. Renvoie le nombre d'utilisateurs modifiés.
+        """
+        with self._write_lock:
+            stale = {}
+            for user_id, (username, encodings) in users.items():
+                encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, self.dim)
+                if self._counts.get(user_id, 0) != len(encodings):
+                    stale[user_id] = (username, encodings, self._appended(user_id, encodings))
+            removed = [user_id for user_id in removed if user_id in self._counts]
+            # Un seul retrait pour tout le lot : l'index recopie ses tableaux à chaque retrait.
+            # Un utilisateur qui n'a fait que gagner des échantillons reste trouvable pendant l'ajout
+            present = [user_id for user_id, entry in stale.items()
+                       if user_id in self._counts and entry[2] is None] + removed
+            if present:
+                self.index.remove(present)
+            for user_id in removed:
+                self._usernames.pop(user_id, None)
+                self._counts.pop(user_id, None)
+                self._centroids.pop(user_id, None)
+                self._fingerprints.pop(user_id, None)
+
+            ids, vectors = [], []
+            for user_id, (username, encodings, appended) in stale.items():
+                self._usernames[user_id] = username
+                self._counts[user_id] = len(encodings)
+                self._max_samples = max(self._max_samples, len(encodings))
+                if self.match_mode == 'centroid':
+                    self._centroids[user_id] = encodings.mean(axis=0)
+                    ids.append(user_id)
+                    vectors.append(self._centroids[user_id])
+                else:
+                    self._fingerprints[user_id] = float((encodings @ self._probe).sum())
+                    added = encodings if appended is None else appended
+                    ids.extend([user_id] * len(added))
+                    vectors.extend(added)
+            if ids:
+                self.index.add(ids, vectors)
+        return len(stale) + len(removed)
+
+    def search(self, encoding, k=1):
+        """Les k utilisateurs les plus proches : liste de (user_id, distance)"""
+        # En mode 'min', un même utilisateur peut occuper plusieurs des plus proches voisins
+        depth = k if k == 1 or self.match_mode == 'centroid' else k * self._max_samples
+        distances, user_ids = self.index.search(encoding, depth)
+
+        matches = {}
+        for distance, user_id in zip(distances, user_ids):
+            matches.setdefault(int(user_id), float(distance))
+            if len(matches) == k:
+                break
+        return list(matches.items())
+
+    def best_match(self, encoding, tolerance=0.6):
+        """Meilleure correspondance (user_id, username, distance) ou None"""
+        matches = self.search(encoding, k=1)
+        if not matches:
+            return None
+
+        user_id, distance = matches[0]
+        if distance > tolerance:
+            return None
+        return user_id, self._usernames.get(user_id), distance
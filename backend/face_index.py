@@ -0,0 +1,857 @@
+#!/usr/bin/env python3
+"""
+Index de recherche des plus proches voisins pour les encodages faciaux
+
+Implémentations interchangeables :
+- ExactIndex : recherche exhaustive vectorisée (résultat exact)
+- IVFIndex : index approximatif à listes inversées (k-means grossier), dont le
+  paramètre n_probe règle le compromis rappel / latence
+- SQ8Index, PQIndex : encodages compressés (1 octet par composante, ou 1 octet
+  par sous-vecteur) et re-classement exact des candidats en float32
+"""
+
+import argparse
+import mmap
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Dimension des encodages produits par face_recognition
+ENCODING_DIM = 128
+
+
+def _top_k(distances, ids, k):
+    """Les k plus petites distances, triées, avec leurs identifiants"""
+    if len(distances) > k:
+        part = np.argpartition(distances, k - 1)[:k]
+        distances, ids = distances[part], ids[part]
+    order = np.argsort(distances, kind='stable')
+    return distances[order], ids[order]
+
+
+def _squared_distances(vectors, sq_norms, query, query_sq_norm):
+    """||v - q||² = ||v||² - 2 v·q + ||q||², en un seul produit matrice-vecteur"""
+    sq_dist = sq_norms - 2.0 * (vectors @ query) + query_sq_norm
+    np.maximum(sq_dist, 0.0, out=sq_dist)
+    return sq_dist
+
+
+def _as_matrix(vectors, dim):
+    return np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(-1, dim))
+
+
+def _is_mapped(array):
+    """Le tableau (ou celui dont il est une vue) est-il projeté depuis un fichier ?"""
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+class ExactIndex:
+    """Matrice contiguë float32 (N×dim) et tableau parallèle des identifiants, recherche exhaustive"""
+
+    kind = 'exact'
+
+    def __init__(self, dim=ENCODING_DIM, initial_capacity=1024):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self._sq_norms = np.zeros(initial_capacity, dtype=np.float32)
+        self._ids = np.zeros(initial_capacity, dtype=np.int64)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def memory_bytes(self):
+        """Mémoire occupée par les vecteurs, normes et identifiants indexés"""
+        return self._size * (self.dim * 4 + 4 + 8)
+
+    def _grow(self, min_capacity):
+        """Agrandir les tableaux (doublement de capacité)"""
+        capacity = max(min_capacity, 2 * len(self._ids), 16)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        ids = np.zeros(capacity, dtype=np.int64)
+        vectors[:self._size] = self._vectors[:self._size]
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        ids[:self._size] = self._ids[:self._size]
+        self._vectors, self._sq_norms, self._ids = vectors, sq_norms, ids
+
+    def reset(self, ids, vectors):
+        """Remplacer tout le contenu de l'index"""
+        vectors = _as_matrix(vectors, self.dim)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+        with self._lock:
+            self._vectors, self._sq_norms, self._ids = vectors, sq_norms, ids.copy()
+            self._size = len(ids)
+
+    def add(self, ids, vectors):
+        """Ajouter des vecteurs (un même identifiant peut apparaître plusieurs fois)"""
+        vectors = _as_matrix(vectors, self.dim)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        count = len(ids)
+        with self._lock:
+            if self._size + count > len(self._ids):
+                self._grow(self._size + count)
+            end = self._size + count
+            self._vectors[self._size:end] = vectors
+            self._sq_norms[self._size:end] = np.einsum('ij,ij->i', vectors, vectors)
+            self._ids[self._size:end] = ids
+            # Publier les lignes seulement une fois entièrement écrites
+            self._size = end
+
+    def remove(self, ids):
+        """Retirer tous les vecteurs portant ces identifiants"""
+        with self._lock:
+            keep = ~np.isin(self._ids[:self._size], np.asarray(ids, dtype=np.int64))
+            # Copie complète : les recherches en cours gardent leur instantané intact
+            self._vectors = np.ascontiguousarray(self._vectors[:self._size][keep])
+            self._sq_norms = self._sq_norms[:self._size][keep].copy()
+            self._ids = self._ids[:self._size][keep].copy()
+            self._size = len(self._ids)
+
+    def _snapshot(self):
+        """Vue cohérente des tableaux pour une recherche sans verrou"""
+        with self._lock:
+            n = self._size
+            return self._vectors[:n], self._sq_norms[:n], self._ids[:n]
+
+    def vectors(self):
+        """Copie des identifiants et vecteurs indexés"""
+        vectors, _, ids = self._snapshot()
+        return ids.copy(), vectors.copy()
+
+    def search(self, query, k=1):
+        """Les k plus proches voisins : (distances, identifiants) triés par distance croissante"""
+        vectors, sq_norms, ids = self._snapshot()
+        if not len(ids):
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        sq_dist = _squared_distances(vectors, sq_norms, query, np.dot(query, query))
+        distances, ids = _top_k(sq_dist, ids, k)
+        return np.sqrt(distances), ids
+
+    def save(self, path):
+        """Enregistrer l'index au format .npz (sans pickle)"""
+        ids, vectors = self.vectors()
+        np.savez(path, kind=self.kind, dim=self.dim, ids=ids, vectors=vectors)
+
+    @classmethod
+    def _from_arrays(cls, data):
+        index = cls(dim=int(data['dim']))
+        index.reset(data['ids'], data['vectors'])
+        return index
+
+
+def _nearest_centroids(vectors, centroids, chunk_size=8192):
+    """Indice du centroïde le plus proche de chaque vecteur, par blocs"""
+    centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        block = vectors[start:start + chunk_size]
+        scores = centroid_sq_norms[None, :] - 2.0 * (block @ centroids.T)
+        assignments[start:start + chunk_size] = np.argmin(scores, axis=1)
+    return assignments
+
+
+def kmeans(vectors, n_clusters, n_iter=20, max_samples=None, seed=0):
+    """k-means de Lloyd sur un échantillon des vecteurs ; renvoie les centroïdes"""
+    rng = np.random.default_rng(seed)
+    vectors = _as_matrix(vectors, vectors.shape[1])
+    max_samples = max_samples or 64 * n_clusters
+    if len(vectors) > max_samples:
+        vectors = vectors[rng.choice(len(vectors), max_samples, replace=False)]
+    if len(vectors) < n_clusters:
+        raise ValueError(f"{len(vectors)} vecteurs pour {n_clusters} listes : entraînement impossible")
+
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = _nearest_centroids(vectors, centroids)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Les listes vides sont réinitialisées sur des points tirés au hasard
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """Index à listes inversées : seules les n_probe listes les plus proches de la requête sont parcourues"""
+
+    kind = 'ivf'
+
+    def __init__(self, dim=ENCODING_DIM, n_lists=None, n_probe=8):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self._lock = threading.Lock()
+        self._centroids = None
+        # Chaque liste : (identifiants, vecteurs, normes²), remplacée en bloc à chaque écriture
+        self._lists = ((np.empty(0, np.int64), np.empty((0, dim), np.float32), np.empty(0, np.float32)),)
+
+    def __len__(self):
+        return sum(len(ids) for ids, _, _ in self._lists)
+
+    @property
+    def is_trained(self):
+        return self._centroids is not None
+
+    def memory_bytes(self):
+        """Mémoire occupée par les listes et les centroïdes"""
+        centroids = 0 if self._centroids is None else self._centroids.nbytes
+        return len(self) * (self.dim * 4 + 4 + 8) + centroids
+
+    def vectors(self):
+        """Copie des identifiants et vecteurs indexés"""
+        lists = self._lists
+        ids = np.concatenate([list_ids for list_ids, _, _ in lists])
+        vectors = np.concatenate([list_vectors for _, list_vectors, _ in lists])
+        return ids, vectors
+
+    def _build_lists(self, ids, vectors, centroids):
+        """Répartir des vecteurs dans les listes de `centroids`"""
+        if centroids is None:
+            assignments = np.zeros(len(ids), dtype=np.int64)
+            n_lists = 1
+        else:
+            assignments = _nearest_centroids(vectors, centroids)
+            n_lists = len(centroids)
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+        lists = []
+        for l in range(n_lists):
+            rows = order[bounds[l]:bounds[l + 1]]
+            list_vectors = np.ascontiguousarray(vectors[rows])
+            lists.append((ids[rows], list_vectors, np.einsum('ij,ij->i', list_vectors, list_vectors)))
+        return tuple(lists)
+
+    def train(self, vectors=None, n_iter=20, seed=0):
+        """Apprendre les centroïdes (sur `vectors` ou le contenu de l'index) puis réaffecter les listes"""
+        with self._lock:
+            ids, current = self.vectors()
+            training = current if vectors is None else _as_matrix(vectors, self.dim)
+            n_lists = self.n_lists or max(1, int(4 * np.sqrt(len(training))))
+            n_lists = min(n_lists, len(training))
+            centroids = kmeans(training, n_lists, n_iter=n_iter, seed=seed)
+            self._lists = self._build_lists(ids, current, centroids)
+            self._centroids = centroids
+            self.n_lists = n_lists
+
+    def reset(self, ids, vectors):
+        """Remplacer tout le contenu (les centroïdes déjà appris sont conservés)"""
+        vectors = _as_matrix(vectors, self.dim)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        with self._lock:
+            self._lists = self._build_lists(ids, vectors, self._centroids)
+
+    def add(self, ids, vectors):
+        """Ajouter des vecteurs dans la liste de leur centroïde le plus proche"""
+        vectors = _as_matrix(vectors, self.dim)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        with self._lock:
+            lists = list(self._lists)
+            if self._centroids is None:
+                assignments = np.zeros(len(ids), dtype=np.int64)
+            else:
+                assignments = _nearest_centroids(vectors, self._centroids)
+            for l in np.unique(assignments):
+                rows = assignments == l
+                list_ids, list_vectors, list_norms = lists[l]
+                new_vectors = vectors[rows]
+                lists[l] = (
+                    np.concatenate([list_ids, ids[rows]]),
+                    np.concatenate([list_vectors, new_vectors]),
+                    np.concatenate([list_norms, np.einsum('ij,ij->i', new_vectors, new_vectors)]),
+                )
+            self._lists = tuple(lists)
+
+    def remove(self, ids):
+        """Retirer tous les vecteurs portant ces identifiants"""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            lists = []
+            for list_ids, list_vectors, list_norms in self._lists:
+                keep = ~np.isin(list_ids, ids)
+                if keep.all():
+                    lists.append((list_ids, list_vectors, list_norms))
+                else:
+                    lists.append((list_ids[keep], np.ascontiguousarray(list_vectors[keep]), list_norms[keep]))
+            self._lists = tuple(lists)
+
+    def search(self, query, k=1, n_probe=None):
+        """Les k plus proches voisins approximatifs parmi les n_probe listes les plus proches"""
+        centroids, lists = self._centroids, self._lists
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        query_sq_norm = np.dot(query, query)
+
+        if centroids is None:
+            probes = [0]
+        else:
+            n_probe = min(n_probe or self.n_probe, len(centroids))
+            centroid_dist = _squared_distances(
+                centroids, np.einsum('ij,ij->i', centroids, centroids), query, query_sq_norm
+            )
+            probes = np.argpartition(centroid_dist, n_probe - 1)[:n_probe]
+
+        all_dist, all_ids = [], []
+        for l in probes:
+            list_ids, list_vectors, list_norms = lists[l]
+            if len(list_ids):
+                all_dist.append(_squared_distances(list_vectors, list_norms, query, query_sq_norm))
+                all_ids.append(list_ids)
+        if not all_ids:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        distances, ids = _top_k(np.concatenate(all_dist), np.concatenate(all_ids), k)
+        return np.sqrt(distances), ids
+
+    def save(self, path):
+        """Enregistrer l'index (centroïdes et listes) au format .npz (sans pickle)"""
+        lists = self._lists
+        np.savez(
+            path, kind=self.kind, dim=self.dim, n_probe=self.n_probe,
+            centroids=self._centroids if self._centroids is not None else np.empty((0, self.dim), np.float32),
+            list_sizes=np.array([len(list_ids) for list_ids, _, _ in lists], dtype=np.int64),
+            ids=np.concatenate([list_ids for list_ids, _, _ in lists]),
+            vectors=np.concatenate([list_vectors for _, list_vectors, _ in lists]),
+        )
+
+    @classmethod
+    def _from_arrays(cls, data):
+        centroids = data['centroids']
+        index = cls(dim=int(data['dim']), n_lists=len(centroids) or None, n_probe=int(data['n_probe']))
+        if len(centroids):
+            index._centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        bounds = np.concatenate([[0], np.cumsum(data['list_sizes'])])
+        ids, vectors = data['ids'], data['vectors']
+        index._lists = tuple(
+            (ids[start:end].copy(), np.ascontiguousarray(vectors[start:end]),
+             np.einsum('ij,ij->i', vectors[start:end], vectors[start:end]))
+            for start, end in zip(bounds[:-1], bounds[1:])
+        )
+        return index
+
+
+class _QuantizedIndex:
+    """Base des index compressés : codes compacts en mémoire, re-classement exact en float32
+
+    Chaque vecteur est stocké sous forme de code avec l'erreur de sa
+    reconstruction r = ||x - x̂||. Par l'inégalité triangulaire, la distance
+    exacte vérifie d(q, x) ≥ d(q, x̂) - r : les candidats sont re-classés sur
+    leurs vecteurs float32 par borne inférieure croissante, jusqu'à ce qu'aucun
+    vecteur non examiné ne puisse battre les k retenus ou passer sous `radius`.
+    Toute distance inférieure à `radius` est donc celle de la recherche exacte,
+    quelle que soit la qualité de la quantification (qui ne règle que le nombre
+    de vecteurs re-classés).
+
+    Les vecteurs float32 ne sont lus que pour les candidats : projetés depuis le
+    fichier de galerie (np.memmap), ils restent sur disque hors de ces lectures.
+
+    Une quantification apprise sur peu de vecteurs (galerie vide au démarrage)
+    est réapprise à chaque doublement de l'index par ajouts, jusqu'à
+    `refit_limit` vecteurs : le coût du recodage reste amorti.
+    """
+
+    kind = None
+    # Marge absorbant les arrondis float32 du calcul des bornes
+    _EPSILON = 1e-4
+    chunk_size = 65536
+    # Au-delà, plus de réapprentissage automatique (et échantillon d'apprentissage de cette taille)
+    refit_limit = 65536
+
+    def __init__(self, dim=ENCODING_DIM, rerank=32, radius=0.6):
+        self.dim = dim
+        self.rerank = rerank
+        self.radius = np.inf if radius is None else radius
+        self._lock = threading.Lock()
+        self._size = 0
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._codes = np.zeros((0, self.code_size), dtype=np.uint8)
+        # ||x̂||² et ||x - x̂|| de chaque vecteur
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._errors = np.zeros(0, dtype=np.float32)
+        # Ligne du vecteur float32 : dans `_base` (jamais modifiée, éventuellement projetée), sinon dans `_extra`
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._base = np.zeros((0, dim), dtype=np.float32)
+        self._extra = np.zeros((0, dim), dtype=np.float32)
+        self._extra_size = 0
+        # Nombre de vecteurs indexés lors du dernier apprentissage
+        self._fitted_size = 0
+
+    def __len__(self):
+        return self._size
+
+    def memory_bytes(self):
+        """Mémoire occupée : codes, normes, erreurs, lignes, identifiants et vecteurs float32,
+        sauf ceux de la base s'ils sont projetés depuis un fichier (np.memmap)"""
+        base = 0 if _is_mapped(self._base) else self._base.nbytes
+        return (self._size * (self.code_size + 4 + 4 + 8 + 8) + base + self._extra.nbytes
+                + self._parameters_bytes())
+
+    def _parameters_bytes(self):
+        return sum(value.nbytes for value in self._parameters().values() if isinstance(value, np.ndarray))
+
+    def _compress(self, vectors):
+        """Codes, normes² des reconstructions et erreurs de reconstruction, par blocs"""
+        codes = np.empty((len(vectors), self.code_size), dtype=np.uint8)
+        sq_norms = np.empty(len(vectors), dtype=np.float32)
+        errors = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), self.chunk_size):
+            block = np.asarray(vectors[start:start + self.chunk_size], dtype=np.float32)
+            block_codes = self._encode(block)
+            reconstructed = self._decode(block_codes)
+            codes[start:start + len(block)] = block_codes
+            sq_norms[start:start + len(block)] = np.einsum('ij,ij->i', reconstructed, reconstructed)
+            errors[start:start + len(block)] = np.linalg.norm(block - reconstructed, axis=1)
+        return codes, sq_norms, errors
+
+    def _fetch(self, rows, base, extra):
+        """Vecteurs float32 de lignes (seules ces lignes de la base sont lues)"""
+        vectors = np.empty((len(rows), self.dim), dtype=np.float32)
+        in_base = rows < len(base)
+        if in_base.any():
+            vectors[in_base] = base[rows[in_base]]
+        if not in_base.all():
+            vectors[~in_base] = extra[rows[~in_base] - len(base)]
+        return vectors
+
+    def _compress_rows(self, rows, base, extra):
+        """Comme _compress, pour des vecteurs lus par blocs de lignes (une base projetée n'est pas chargée)"""
+        codes = np.empty((len(rows), self.code_size), dtype=np.uint8)
+        sq_norms = np.empty(len(rows), dtype=np.float32)
+        errors = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), self.chunk_size):
+            stop = start + self.chunk_size
+            codes[start:stop], sq_norms[start:stop], errors[start:stop] = self._compress(
+                self._fetch(rows[start:stop], base, extra)
+            )
+        return codes, sq_norms, errors
+
+    def _refit(self, vectors=None):
+        """Réapprendre la quantification (sur `vectors` ou un échantillon du contenu) et recoder (sous verrou)"""
+        n = self._size
+        base, extra = self._base, self._extra[:self._extra_size]
+        if vectors is None:
+            rows = self._rows[:n]
+            if n > self.refit_limit:
+                rows = np.sort(np.random.default_rng(0).choice(rows, self.refit_limit, replace=False))
+            vectors = self._fetch(rows, base, extra)
+        if not len(vectors):
+            return
+        self._fit(vectors)
+        self._fitted_size = max(n, 1)
+        codes, sq_norms, errors = self._compress_rows(self._rows[:n], base, extra)
+        # Nouveaux tableaux (même capacité) : les recherches en cours gardent leur instantané
+        for name, values in (('_codes', codes), ('_sq_norms', sq_norms), ('_errors', errors)):
+            replaced = getattr(self, name).copy()
+            replaced[:n] = values
+            setattr(self, name, replaced)
+
+    def _grow(self, min_capacity):
+        """Agrandir les tableaux des codes (doublement de capacité)"""
+        capacity = max(min_capacity, 2 * len(self._ids), 16)
+        n = self._size
+        for name in ('_ids', '_codes', '_sq_norms', '_errors', '_rows'):
+            current = getattr(self, name)
+            grown = np.zeros((capacity,) + current.shape[1:], dtype=current.dtype)
+            grown[:n] = current[:n]
+            setattr(self, name, grown)
+
+    def _grow_extra(self, min_capacity):
+        capacity = max(min_capacity, 2 * len(self._extra), 16)
+        extra = np.zeros((capacity, self.dim), dtype=np.float32)
+        extra[:self._extra_size] = self._extra[:self._extra_size]
+        self._extra = extra
+
+    def reset(self, ids, vectors):
+        """Remplacer tout le contenu ; une matrice np.memmap float32 n'est pas copiée"""
+        vectors = _as_matrix(vectors, self.dim)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        with self._lock:
+            if len(vectors) and self._needs_fit():
+                self._fit(vectors)
+                self._fitted_size = len(vectors)
+            codes, sq_norms, errors = self._compress(vectors)
+            self._ids, self._codes, self._sq_norms, self._errors = ids.copy(), codes, sq_norms, errors
+            self._rows = np.arange(len(ids), dtype=np.int64)
+            self._base = vectors
+            self._extra = np.zeros((0, self.dim), dtype=np.float32)
+            self._extra_size = 0
+            self._size = len(ids)
+
+    def add(self, ids, vectors):
+        """Ajouter des vecteurs (un même identifiant peut apparaître plusieurs fois)"""
+        vectors = _as_matrix(vectors, self.dim)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        count = len(ids)
+        with self._lock:
+            if not self.is_fitted:
+                self._fit(vectors)
+                self._fitted_size = count
+            codes, sq_norms, errors = self._compress(vectors)
+            if self._extra_size + count > len(self._extra):
+                self._grow_extra(self._extra_size + count)
+            first_row = len(self._base) + self._extra_size
+            self._extra[self._extra_size:self._extra_size + count] = vectors
+            self._extra_size += count
+
+            if self._size + count > len(self._ids):
+                self._grow(self._size + count)
+            end = self._size + count
+            self._ids[self._size:end] = ids
+            self._codes[self._size:end] = codes
+            self._sq_norms[self._size:end] = sq_norms
+            self._errors[self._size:end] = errors
+            self._rows[self._size:end] = np.arange(first_row, first_row + count)
+            # Publier les lignes seulement une fois entièrement écrites
+            self._size = end
+            if self._fitted_size < self.refit_limit and end >= 2 * self._fitted_size:
+                self._refit()
+
+    def remove(self, ids):
+        """Retirer tous les vecteurs portant ces identifiants (les vecteurs float32 restent en place)"""
+        with self._lock:
+            n = self._size
+            keep = ~np.isin(self._ids[:n], np.asarray(ids, dtype=np.int64))
+            # Copies : les recherches en cours gardent leur instantané intact
+            self._ids = self._ids[:n][keep].copy()
+            self._codes = np.ascontiguousarray(self._codes[:n][keep])
+            self._sq_norms = self._sq_norms[:n][keep].copy()
+            self._errors = self._errors[:n][keep].copy()
+            self._rows = self._rows[:n][keep].copy()
+            self._size = len(self._ids)
+
+    def _snapshot(self):
+        """Vue cohérente des tableaux et de la quantification pour une recherche sans verrou"""
+        with self._lock:
+            n = self._size
+            return (self._ids[:n], self._codes[:n], self._sq_norms[:n], self._errors[:n], self._rows[:n],
+                    self._base, self._extra[:self._extra_size], self._quantizer())
+
+    def vectors(self):
+        """Copie des identifiants et vecteurs float32 indexés"""
+        ids, _, _, _, rows, base, extra, _ = self._snapshot()
+        return ids.copy(), self._fetch(rows, base, extra)
+
+    def train(self, vectors=None):
+        """Ré-apprendre la quantification (sur `vectors` ou un échantillon du contenu) puis recoder"""
+        with self._lock:
+            self._refit(None if vectors is None else _as_matrix(vectors, self.dim))
+
+    def search(self, query, k=1):
+        """Les k plus proches voisins : (distances, identifiants) triés par distance croissante"""
+        ids, codes, sq_norms, errors, rows, base, extra, quantizer = self._snapshot()
+        n = len(ids)
+        if not n:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+
+        # Borne inférieure de chaque distance exacte, calculée sur les codes
+        tables = self._query_tables(query, quantizer)
+        lower = np.empty(n, dtype=np.float32)
+        for start in range(0, n, self.chunk_size):
+            stop = start + self.chunk_size
+            approx = self._approx_sq_distances(tables, codes[start:stop], sq_norms[start:stop])
+            np.maximum(approx, 0.0, out=approx)
+            lower[start:stop] = np.sqrt(approx) - errors[start:stop] - self._EPSILON
+
+        k = min(k, n)
+        batch = min(max(self.rerank, k), n)
+
+        def exact(positions):
+            vectors = self._fetch(rows[positions], base, extra)
+            return np.linalg.norm(vectors - query, axis=1)
+
+        # Premier lot : les plus petites bornes, toujours re-classé
+        first = np.argpartition(lower, batch - 1)[:batch] if n > batch else np.arange(n)
+        distances, positions = _top_k(exact(first), first, k)
+
+        # Seuls les vecteurs dont la borne passe sous le k-ième retenu (ou sous `radius`) peuvent compter
+        threshold = min(distances[-1] if len(distances) == k else np.inf, self.radius)
+        candidates = np.flatnonzero(lower < threshold)
+        candidates = candidates[~np.isin(candidates, first)]
+        candidates = candidates[np.argsort(lower[candidates], kind='stable')]
+        for start in range(0, len(candidates), batch):
+            part = candidates[start:start + batch]
+            if lower[part[0]] >= threshold:
+                break
+            distances, positions = _top_k(
+                np.concatenate([distances, exact(part)]), np.concatenate([positions, part]), k
+            )
+            threshold = min(distances[-1], self.radius)
+        return distances.astype(np.float32), ids[positions]
+
+    def save(self, path):
+        """Enregistrer l'index (paramètres de quantification et vecteurs) au format .npz (sans pickle)"""
+        ids, vectors = self.vectors()
+        np.savez(path, kind=self.kind, dim=self.dim, rerank=self.rerank, radius=self.radius,
+                 ids=ids, vectors=vectors, **self._parameters())
+
+    @classmethod
+    def _from_arrays(cls, data):
+        index = cls(dim=int(data['dim']), rerank=int(data['rerank']), radius=float(data['radius']),
+                    **cls._options(data))
+        index._load_parameters(data)
+        index.reset(data['ids'], data['vectors'])
+        return index
+
+
+class SQ8Index(_QuantizedIndex):
+    """Quantification scalaire : chaque composante codée sur un octet (128 octets par visage)
+
+    Les bornes par composante sont réapprises à chaque rechargement complet et
+    à chaque doublement par ajouts ; une valeur hors bornes ajoutée entre-temps
+    est écrêtée, son erreur le reflète.
+    """
+
+    kind = 'sq8'
+    # Blocs convertis en float32 avant le produit : assez petits pour rester en cache
+    chunk_size = 4096
+
+    def __init__(self, dim=ENCODING_DIM, rerank=32, radius=0.6):
+        self._low = None
+        self._scale = None
+        super().__init__(dim=dim, rerank=rerank, radius=radius)
+
+    @property
+    def code_size(self):
+        return self.dim
+
+    @property
+    def is_fitted(self):
+        return self._low is not None
+
+    is_trained = is_fitted
+
+    def _needs_fit(self):
+        return True
+
+    def _fit(self, vectors):
+        low = vectors.min(axis=0)
+        scale = (vectors.max(axis=0) - low) / 255.0
+        scale[scale == 0] = 1.0
+        self._low, self._scale = low.astype(np.float32), scale.astype(np.float32)
+
+    def _encode(self, vectors):
+        return np.clip(np.rint((vectors - self._low) / self._scale), 0, 255).astype(np.uint8)
+
+    def _decode(self, codes):
+        return codes.astype(np.float32) * self._scale + self._low
+
+    def _quantizer(self):
+        return self._low, self._scale
+
+    def _query_tables(self, query, quantizer):
+        low, scale = quantizer
+        return query * scale, float(np.dot(query, low)), float(np.dot(query, query))
+
+    def _approx_sq_distances(self, tables, codes, sq_norms):
+        # ||x̂ - q||² avec x̂ = low + scale·c : un produit matrice-vecteur sur les codes
+        weights, query_low, query_sq_norm = tables
+        # Les codes sont convertis en float32 : un produit uint8 @ float32 passerait en float64
+        return sq_norms - 2.0 * (codes.astype(np.float32) @ weights + query_low) + query_sq_norm
+
+    def _parameters(self):
+        if not self.is_fitted:
+            return {}
+        return {'low': self._low, 'scale': self._scale, 'fitted_size': self._fitted_size}
+
+    @staticmethod
+    def _options(data):
+        return {}
+
+    def _load_parameters(self, data):
+        if 'low' in data:
+            self._low, self._scale = data['low'], data['scale']
+            self._fitted_size = int(data['fitted_size']) if 'fitted_size' in data else self.refit_limit
+
+
+class PQIndex(_QuantizedIndex):
+    """Quantification par produit : m sous-vecteurs, chacun codé sur un octet (256 centroïdes)
+
+    La distance d'une requête aux codes se calcule par tables précalculées
+    (distance de chaque sous-vecteur de la requête aux 256 centroïdes de son
+    sous-espace) : m lectures et additions par visage. Les dictionnaires sont
+    appris par k-means et conservés d'un rechargement à l'autre ; appris sur
+    moins de 256 vecteurs, ils sont réappris quand l'index double.
+    """
+
+    kind = 'pq'
+    n_centroids = 256
+
+    def __init__(self, dim=ENCODING_DIM, m=16, rerank=32, radius=0.6, n_iter=15):
+        if dim % m:
+            raise ValueError(f"La dimension {dim} n'est pas divisible en {m} sous-vecteurs")
+        self.m = m
+        self.sub_dim = dim // m
+        self.n_iter = n_iter
+        # Dictionnaires (m × centroïdes × sub_dim)
+        self._codebooks = None
+        super().__init__(dim=dim, rerank=rerank, radius=radius)
+
+    @property
+    def code_size(self):
+        return self.m
+
+    @property
+    def is_fitted(self):
+        return self._codebooks is not None
+
+    @property
+    def is_trained(self):
+        """Dictionnaires complets (appris sur au moins 256 vecteurs)"""
+        return self.is_fitted and self._codebooks.shape[1] == self.n_centroids
+
+    def _needs_fit(self):
+        return not self.is_trained
+
+    def _fit(self, vectors):
+        n_centroids = min(self.n_centroids, len(vectors))
+        self._codebooks = np.stack([
+            kmeans(vectors[:, s * self.sub_dim:(s + 1) * self.sub_dim], n_centroids, n_iter=self.n_iter, seed=s)
+            for s in range(self.m)
+        ])
+
+    def _encode(self, vectors):
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for s in range(self.m):
+            sub = np.ascontiguousarray(vectors[:, s * self.sub_dim:(s + 1) * self.sub_dim])
+            codes[:, s] = _nearest_centroids(sub, self._codebooks[s])
+        return codes
+
+    def _decode(self, codes):
+        return np.concatenate([self._codebooks[s][codes[:, s]] for s in range(self.m)], axis=1)
+
+    def _quantizer(self):
+        return self._codebooks
+
+    def _query_tables(self, query, codebooks):
+        sub_queries = query.reshape(self.m, 1, self.sub_dim)
+        tables = np.sum((codebooks - sub_queries) ** 2, axis=2)
+        return tables.astype(np.float32)
+
+    def _approx_sq_distances(self, tables, codes, sq_norms):
+        # Une lecture de table par sous-vecteur, accumulée colonne par colonne
+        approx = np.take(tables[0], codes[:, 0])
+        for s in range(1, self.m):
+            approx += np.take(tables[s], codes[:, s])
+        return approx
+
+    def _parameters(self):
+        if not self.is_fitted:
+            return {'m': self.m}
+        return {'m': self.m, 'codebooks': self._codebooks, 'fitted_size': self._fitted_size}
+
+    @staticmethod
+    def _options(data):
+        return {'m': int(data['m'])}
+
+    def _load_parameters(self, data):
+        if 'codebooks' in data:
+            self._codebooks = np.ascontiguousarray(data['codebooks'], dtype=np.float32)
+            # Dictionnaires enregistrés sans leur taille d'apprentissage : pas de réapprentissage automatique
+            self._fitted_size = int(data['fitted_size']) if 'fitted_size' in data else self.refit_limit
+
+
+INDEX_TYPES = {index_type.kind: index_type for index_type in (ExactIndex, IVFIndex, SQ8Index, PQIndex)}
+
+
+def create_index(kind='exact', dim=ENCODING_DIM, **options):
+    """Créer un index vide du type demandé ('exact', 'ivf', 'sq8' ou 'pq')"""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Type d'index inconnu: {kind}")
+    if kind == 'exact':
+        return ExactIndex(dim=dim)
+    return INDEX_TYPES[kind](dim=dim, **options)
+
+
+def load_index(path):
+    """Charger un index enregistré avec save()"""
+    with np.load(path, allow_pickle=False) as data:
+        kind = str(data['kind'])
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"Type d'index inconnu: {kind}")
+        return INDEX_TYPES[kind]._from_arrays(data)
+
+
+def evaluate_recall(index, reference, queries, k=1, **search_options):
+    """Rappel@k de `index` par rapport à la recherche exacte `reference`, et latences moyennes (ms)"""
+    hits = 0
+    index_time = reference_time = 0.0
+    for query in queries:
+        start = time.perf_counter()
+        _, expected = reference.search(query, k)
+        reference_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, found = index.search(query, k, **search_options)
+        index_time += time.perf_counter() - start
+
+        hits += len(np.intersect1d(expected, found))
+    return {
+        'recall': hits / (k * len(queries)),
+        'latency_ms': 1000 * index_time / len(queries),
+        'exact_latency_ms': 1000 * reference_time / len(queries),
+    }
+
+
+def synthetic_gallery(size, dim=ENCODING_DIM, n_queries=200, noise=0.025, seed=0):
+    """Galerie synthétique : une identité par vecteur, requêtes = identité + bruit"""
+    rng = np.random.default_rng(seed)
+    gallery = rng.normal(0.0, 0.09, (size, dim)).astype(np.float32)
+    targets = rng.choice(size, n_queries, replace=False)
+    queries = gallery[targets] + rng.normal(0.0, noise, (n_queries, dim)).astype(np.float32)
+    return gallery, queries
+
+
+def main():
+    """Mesurer le rappel et la latence de l'index IVF selon n_probe ; code 1 si le rappel vérifié est insuffisant"""
+    parser = argparse.ArgumentParser(description="Rappel / latence de l'index IVF par rapport à la recherche exacte")
+    parser.add_argument('--size', type=int, default=100000, help="Nombre d'encodages de la galerie")
+    parser.add_argument('--lists', type=int, default=None, help="Nombre de listes (défaut 4·√N)")
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=1)
+    parser.add_argument('--check-nprobe', type=int, default=8, help="n_probe dont le rappel est vérifié (défaut de FACE_INDEX_NPROBE)")
+    parser.add_argument('--min-recall', type=float, default=0.95, help="Rappel minimal exigé à --check-nprobe")
+    args = parser.parse_args()
+
+    gallery, queries = synthetic_gallery(args.size, n_queries=args.queries)
+    ids = np.arange(len(gallery))
+
+    exact = ExactIndex()
+    exact.reset(ids, gallery)
+    ivf = IVFIndex(n_lists=args.lists)
+    ivf.reset(ids, gallery)
+    start = time.perf_counter()
+    ivf.train()
+    print(f"Entraînement de {ivf.n_lists} listes sur {args.size} encodages: {time.perf_counter() - start:.1f}s")
+
+    print(f"{'n_probe':>8} {'rappel@' + str(args.k):>10} {'ivf (ms)':>10} {'exact (ms)':>11}")
+    recalls = {}
+    for n_probe in sorted(set(args.nprobe) | {args.check_nprobe}):
+        result = evaluate_recall(ivf, exact, queries, k=args.k, n_probe=n_probe)
+        recalls[n_probe] = result['recall']
+        print(f"{n_probe:>8} {result['recall']:>10.3f} {result['latency_ms']:>10.3f} {result['exact_latency_ms']:>11.3f}")
+
+    # Galerie synthétique à graine fixe : le rappel est reproductible d'un commit à l'autre
+    recall = recalls[args.check_nprobe]
+    if recall < args.min_recall:
+        print(f"ÉCHEC : rappel@{args.k} {recall:.3f} < {args.min_recall} à n_probe={args.check_nprobe}")
+        return 1
+    print(f"OK : rappel@{args.k} {recall:.3f} >= {args.min_recall} à n_probe={args.check_nprobe}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
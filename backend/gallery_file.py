@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Fichier de galerie binaire versionné, ouvert par projection mémoire (np.memmap)
+
+Disposition (petit-boutiste) :
+- en-tête de 64 octets : signature b'FGAL', version, dimension, nombre
+  d'encodages, position et taille de la table des libellés
+- matrice contiguë float32 N×dim (alignée sur 64 octets)
+- identifiants int64 (N)
+- table des libellés : JSON UTF-8 {"labels": [...], "meta": {...}}
+
+Le fichier est ouvert en lecture seule : le chargement est quasi instantané et
+les processus qui ouvrent le même fichier partagent les mêmes pages mémoire.
+Contrairement à pickle, son ouverture n'exécute aucun code.
+"""
+
+import argparse
+import json
+import os
+import pickle
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from face_index import ENCODING_DIM
+
+MAGIC = b'FGAL'
+FORMAT_VERSION = 1
+HEADER_SIZE = 64
+_HEADER = struct.Struct('<4sHHQQQ')
+
+GalleryData = namedtuple('GalleryData', ['encodings', 'ids', 'labels', 'meta'])
+
+
+def write_gallery(path, encodings, ids=None, labels=None, meta=None):
+    """Écrire une galerie ; le fichier est remplacé atomiquement
+
+    Les processus qui ont déjà projeté l'ancien fichier continuent de lire
+    l'ancienne version jusqu'à leur prochaine ouverture.
+    """
+    encodings = np.asarray(encodings, dtype='<f4')
+    dim = encodings.shape[1] if encodings.ndim == 2 and encodings.size else ENCODING_DIM
+    encodings = np.ascontiguousarray(encodings.reshape(-1, dim))
+    count = len(encodings)
+    ids = np.arange(count, dtype='<i8') if ids is None else np.asarray(ids, dtype='<i8').reshape(-1)
+    labels = [] if labels is None else list(labels)
+    if len(ids) != count or (labels and len(labels) != count):
+        raise ValueError("Les encodages, identifiants et libellés doivent avoir la même longueur")
+
+    table = json.dumps({'labels': labels, 'meta': meta or {}}, ensure_ascii=False).encode('utf-8')
+    table_offset = HEADER_SIZE + encodings.nbytes + ids.nbytes
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, dim, count, table_offset, len(table))
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+        f.write(encodings.tobytes())
+        f.write(ids.tobytes())
+        f.write(table)
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    """Lire et valider l'en-tête : (dimension, nombre, position et taille des libellés)"""
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE or raw[:4] != MAGIC:
+        raise ValueError(f"Fichier de galerie invalide: {path}")
+    _, version, dim, count, table_offset, table_size = _HEADER.unpack_from(raw)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Version de galerie non supportée: {version}")
+    if table_offset != HEADER_SIZE + count * dim * 4 + count * 8:
+        raise ValueError(f"Fichier de galerie corrompu: {path}")
+    if os.path.getsize(path) != table_offset + table_size:
+        raise ValueError(f"Fichier de galerie tronqué: {path}")
+    return dim, count, table_offset, table_size
+
+
+def open_gallery(path):
+    """Ouvrir une galerie : encodages et identifiants sont des vues np.memmap en lecture seule"""
+    dim, count, table_offset, table_size = read_header(path)
+    if count:
+        encodings = np.memmap(path, dtype='<f4', mode='r', offset=HEADER_SIZE, shape=(count, dim))
+        ids = np.memmap(path, dtype='<i8', mode='r', offset=HEADER_SIZE + count * dim * 4, shape=(count,))
+    else:
+        encodings = np.empty((0, dim), dtype=np.float32)
+        ids = np.empty(0, dtype=np.int64)
+
+    with open(path, 'rb') as f:
+        f.seek(table_offset)
+        table = json.loads(f.read(table_size).decode('utf-8'))
+    return GalleryData(encodings, ids, table.get('labels', []), table.get('meta', {}))
+
+
+def convert_pickle(pickle_path, gallery_path):
+    """Convertir un ancien EncodeFile.p ([encodages, identifiants]) au format galerie
+
+    Le pickle n'est désérialisé qu'une fois, lors de la conversion : ne
+    convertir que des fichiers de confiance.
+    """
+    with open(pickle_path, 'rb') as f:
+        encodings, labels = pickle.load(f)
+    labels = [str(label) for label in labels]
+    write_gallery(gallery_path, np.asarray(encodings).reshape(-1, ENCODING_DIM), labels=labels)
+    return len(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outils du fichier de galerie binaire")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert = commands.add_parser('convert', help="Convertir un fichier pickle EncodeFile.p")
+    convert.add_argument('pickle_path')
+    convert.add_argument('gallery_path')
+
+    info = commands.add_parser('info', help="Afficher le contenu d'un fichier de galerie")
+    info.add_argument('gallery_path')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        count = convert_pickle(args.pickle_path, args.gallery_path)
+        print(f"{count} encodages écrits dans {args.gallery_path}")
+    else:
+        gallery = open_gallery(args.gallery_path)
+        print(f"{len(gallery.ids)} encodages de dimension {gallery.encodings.shape[1]}")
+        if gallery.meta:
+            print(f"méta: {json.dumps(gallery.meta, ensure_ascii=False)}")
+        for label in gallery.labels[:10]:
+            print(f"  {label}")
+
+
+if __name__ == '__main__':
+    main()
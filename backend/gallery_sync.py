@@ -0,0 +1,194 @@
+"""
+Synchronisation de la galerie en mémoire entre les processus du serveur
+
+Chaque worker gunicorn tient sa propre copie de la galerie. Toute écriture
+d'encodage ajoute, dans la même transaction, une ligne au journal
+face_encoding_changes (identifiant croissant, utilisateur concerné). Chaque
+worker interroge ce journal et ne recharge que les utilisateurs modifiés
+depuis la dernière version vue : un utilisateur inscrit par un worker peut
+se connecter par n'importe quel autre après au plus un intervalle.
+
+Les identifiants auto-incrémentés ne sont pas visibles dans l'ordre : une
+transaction longue peut valider l'identifiant 10 après le 11. Un identifiant
+manquant reste donc attendu pendant `gap_timeout` secondes (une transaction
+annulée laisse un trou définitif) avant que la version ne le dépasse.
+"""
+
+import logging
+import threading
+import time
+
+from encoding_codec import decode_encoding
+
+logger = logging.getLogger(__name__)
+
+
+def record_changes(cursor, user_ids):
+    """Inscrire au journal des utilisateurs dont les encodages ont changé (dans la transaction de l'écriture)"""
+    rows = [(user_id,) for user_id in user_ids]
+    if rows:
+        cursor.executemany("INSERT INTO face_encoding_changes (user_id) VALUES (%s)", rows)
+
+
+class GallerySync:
+    """Application périodique du journal des changements à une galerie"""
+
+    def __init__(self, db_manager, gallery, interval=1.0, gap_timeout=60.0, batch_size=1000, max_pages=100):
+        self.db_manager = db_manager
+        self.gallery = gallery
+        self.interval = interval
+        self.gap_timeout = gap_timeout
+        self.batch_size = batch_size
+        # Nombre maximal de pages lues par poll(drain=True)
+        self.max_pages = max_pages
+        # Tous les changements jusqu'à `version` incluse sont appliqués
+        self.version = 0
+        self._applied = set()
+        self._gaps = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.polls = 0
+        self.users_synced = 0
+        self.errors = 0
+        self.last_poll = None
+
+    def latest_version(self):
+        """Dernier identifiant du journal en base"""
+        with self.db_manager.cursor(commit=True) as cursor:
+            cursor.execute("SELECT MAX(id) FROM face_encoding_changes")
+            return int(cursor.fetchone()[0] or 0)
+
+    def reset(self, version):
+        """Repartir d'une version (galerie rechargée entièrement juste après l'avoir lue)"""
+        with self._lock:
+            self.version = version
+            self._applied.clear()
+            self._gaps.clear()
+
+    def _fetch(self):
+        """Changements non encore appliqués, puis encodages des utilisateurs concernés"""
+        # La page suivante part du dernier changement appliqué, pas de la version : derrière
+        # un trou, les changements déjà appliqués ne doivent pas remplir chaque page
+        frontier = max(self._applied, default=self.version)
+        gaps = sorted(self._gaps)[:self.batch_size]
+        # commit=True termine la transaction de lecture : en REPEATABLE READ (MySQL),
+        # un instantané conservé par la connexion du pool masquerait les nouvelles lignes
+        with self.db_manager.cursor(commit=True) as cursor:
+            cursor.execute(
+                "SELECT id, user_id FROM face_encoding_changes WHERE id > %s ORDER BY id LIMIT %s",
+                (frontier, self.batch_size)
+            )
+            changes = list(cursor.fetchall())
+            full = len(changes) >= self.batch_size
+            if gaps:
+                # Identifiants manquants : leur transaction a peut-être été validée depuis
+                cursor.execute(
+                    f"SELECT id, user_id FROM face_encoding_changes WHERE id IN ({', '.join(['%s'] * len(gaps))})",
+                    gaps
+                )
+                changes += cursor.fetchall()
+            user_ids = sorted({user_id for _, user_id in changes})
+            rows = []
+            if user_ids:
+                cursor.execute(f"""
+                    SELECT u.id, u.username, fe.face_encoding
+                    FROM users u
+                    JOIN face_encodings fe ON u.id = fe.user_id
+                    WHERE u.id IN ({', '.join(['%s'] * len(user_ids))})
+                    ORDER BY fe.id
+                """, user_ids)
+                rows = cursor.fetchall()
+        return changes, user_ids, rows, full
+
+    def _advance(self, change_ids):
+        """Avancer la version sur les changements contigus appliqués ou les trous expirés"""
+        now = time.monotonic()
+        self._applied.update(change_ids)
+        for change_id in change_ids:
+            self._gaps.pop(change_id, None)
+        if not self._applied:
+            return
+        for missing in range(self.version + 1, max(self._applied)):
+            if missing not in self._applied:
+                self._gaps.setdefault(missing, now)
+        while True:
+            following = self.version + 1
+            if following in self._applied:
+                self._applied.discard(following)
+            elif following in self._gaps and now - self._gaps[following] >= self.gap_timeout:
+                logger.warning(f"Changement {following} de la galerie jamais validé, ignoré")
+            else:
+                break
+            self._gaps.pop(following, None)
+            self.version = following
+
+    def _poll_page(self):
+        """Appliquer une page de changements ; renvoie (utilisateurs modifiés, page pleine)"""
+        with self._lock:
+            changes, user_ids, rows, full = self._fetch()
+            users = {}
+            for user_id, username, stored_encoding in rows:
+                users.setdefault(user_id, (username, []))[1].append(decode_encoding(stored_encoding))
+            removed = [user_id for user_id in user_ids if user_id not in users]
+            synced = self.gallery.sync_users(users, removed) if user_ids else 0
+
+            self._advance([change_id for change_id, _ in changes])
+            self.polls += 1
+            self.users_synced += synced
+            self.last_poll = time.monotonic()
+        return synced, full
+
+    def poll(self, drain=False):
+        """Appliquer les changements en attente ; renvoie le nombre d'utilisateurs modifiés
+
+        Par défaut une seule page de `batch_size` changements est lue. Avec
+        drain=True (après une écriture locale, qui peut en produire davantage),
+        les pages suivantes sont lues tant qu'elles sont pleines, dans la limite
+        de `max_pages`.
+        """
+        synced = 0
+        for _ in range(self.max_pages if drain else 1):
+            page_synced, full = self._poll_page()
+            synced += page_synced
+            if not full:
+                break
+        if synced:
+            logger.info(f"Galerie synchronisée: {synced} utilisateur(s), version {self.version}")
+        return synced
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll(drain=True)
+            except Exception as e:
+                # Base momentanément indisponible : nouvelle tentative à l'intervalle suivant
+                self.errors += 1
+                logger.warning(f"Synchronisation de la galerie impossible: {e}")
+
+    def start(self):
+        """Démarrer l'interrogation périodique du journal (intervalle 0 = désactivée)"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='gallery-sync', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def status(self):
+        """État pour /api/health"""
+        return {
+            'enabled': self._thread is not None,
+            'interval_s': self.interval,
+            'version': self.version,
+            'pending_gaps': len(self._gaps),
+            'polls': self.polls,
+            'users_synced': self.users_synced,
+            'errors': self.errors,
+            'last_poll_age_s': None if self.last_poll is None else round(time.monotonic() - self.last_poll, 3),
+        }
@@ -0,0 +1,56 @@
+"""
+Configuration gunicorn du serveur de production (python3 start_server.py --production)
+
+L'application est préchargée dans le processus maître : modèles dlib et
+galerie sont chargés une fois puis partagés par copie sur écriture avec les
+workers. Chaque worker démarre ensuite son propre moteur d'encodage.
+
+Rechargement sans coupure : kill -HUP <pid maître> (relit la configuration et
+remplace les workers un à un). Le code étant préchargé, une nouvelle version
+se déploie avec kill -USR2 puis kill -QUIT sur l'ancien maître.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_cpu_count = os.cpu_count() or 1
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('SERVER_WORKERS', 2))
+threads = int(os.getenv('SERVER_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+
+# Recyclage des workers : borne la croissance mémoire de dlib
+max_requests = int(os.getenv('SERVER_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('SERVER_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.getenv('SERVER_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('SERVER_KEEPALIVE', 5))
+pidfile = os.getenv('SERVER_PIDFILE', 'gunicorn.pid')
+accesslog = os.getenv('SERVER_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.getenv('SERVER_LOG_LEVEL', 'info')
+
+# Le moteur d'encodage est démarré après le fork, et les cœurs sont répartis entre workers
+os.environ['ENCODING_ENGINE_AUTOSTART'] = 'false'
+# (valeur vide dans .env = répartition automatique, comme une variable absente)
+if not os.getenv('ENCODING_WORKERS'):
+    os.environ['ENCODING_WORKERS'] = str(max(1, _cpu_count // workers))
+
+
+def when_ready(server):
+    """Maître prêt, avant le fork des workers"""
+    from app import prepare_fork
+    prepare_fork()
+    server.log.info(f"Application préchargée, {workers} workers × {threads} threads")
+
+
+def post_fork(server, worker):
+    """Dans chaque worker : démarrer son moteur d'encodage"""
+    from app import init_worker_process
+    init_worker_process()
@@ -0,0 +1,157 @@
+"""
+Métriques du serveur au format texte Prometheus (histogrammes, compteurs, jauges)
+
+Les valeurs sont propres à chaque processus : avec plusieurs workers, chaque
+scrape de /api/metrics ne voit que le worker qui a répondu.
+"""
+
+import math
+import threading
+
+# Bornes (s) adaptées aux étapes de la reconnaissance : de la sous-milliseconde à la seconde
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Histogramme cumulatif, une série par combinaison d'étiquettes"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            series = {key: ([*counts], total, count) for key, (counts, total, count) in self._series.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Counter:
+    """Compteur monotone, une série par combinaison d'étiquettes"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(list(zip(self.labelnames, key)))} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge:
+    """Valeur lue au moment du scrape (taille de galerie, file d'encodage...)"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self._read = read
+
+    def render(self):
+        value = self._read()
+        return [] if value is None else [f"{self.name} {_format_value(value)}"]
+
+
+class CounterFunction(Gauge):
+    """Total monotone tenu par un autre composant (cache...), lu au moment du scrape"""
+
+    kind = 'counter'
+
+
+class MetricsRegistry:
+    """Ensemble des métriques exposées par /api/metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, read):
+        return self.register(Gauge(name, documentation, read))
+
+    def counter_function(self, name, documentation, read):
+        return self.register(CounterFunction(name, documentation, read))
+
+    def render(self):
+        """Exposition au format texte Prometheus 0.0.4"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def server_timing(timings):
+    """Valeur de l'en-tête Server-Timing : étapes (nom, secondes), cumulées par nom"""
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ', '.join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Migration des encodages faciaux du format texte LONGTEXT vers le format binaire
+"""
+
+import os
+import argparse
+
+import mysql.connector
+from dotenv import load_dotenv
+
+from encoding_codec import encode_encoding, decode_encoding, is_legacy_encoding
+
+def get_connection():
+    """Ouvrir une connexion dédiée à la migration"""
+    load_dotenv()
+
+    config = {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'user': os.getenv('DB_USER', 'root'),
+        'password': os.getenv('DB_PASSWORD', ''),
+        'database': os.getenv('DB_NAME', 'face_recognition_db'),
+        'charset': 'utf8mb4'
+    }
+    return mysql.connector.connect(**config)
+
+def convert_column_to_blob(connection):
+    """Passer la colonne face_encoding en BLOB (les octets du texte sont conservés)"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT DATA_TYPE FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND TABLE_NAME = 'face_encodings'
+              AND COLUMN_NAME = 'face_encoding'
+        """)
+        column = cursor.fetchone()
+        if column is None:
+            raise RuntimeError("Table face_encodings introuvable")
+
+        if column[0].lower().endswith('text'):
+            print(f"🔧 Conversion de la colonne face_encoding ({column[0]} -> LONGBLOB)...")
+            cursor.execute("ALTER TABLE face_encodings MODIFY face_encoding LONGBLOB NOT NULL")
+            connection.commit()
+    finally:
+        cursor.close()
+
+def migrate_rows(connection, dtype, batch_size):
+    """Réécrire les lignes au format texte par lots, un commit par lot"""
+    read_cursor = connection.cursor()
+    write_cursor = connection.cursor()
+    converted = 0
+    failed = 0
+    last_id = 0
+
+    try:
+        while True:
+            read_cursor.execute("""
+                SELECT id, face_encoding FROM face_encodings
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = read_cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            updates = []
+            for row_id, stored in rows:
+                if not is_legacy_encoding(stored):
+                    continue
+                try:
+                    updates.append((encode_encoding(decode_encoding(stored), dtype), row_id))
+                except ValueError as e:
+                    failed += 1
+                    print(f"⚠️ Ligne {row_id} ignorée: {e}")
+
+            if updates:
+                write_cursor.executemany(
+                    "UPDATE face_encodings SET face_encoding = %s WHERE id = %s",
+                    updates
+                )
+                connection.commit()
+                converted += len(updates)
+                print(f"   {converted} encodages convertis...")
+    finally:
+        read_cursor.close()
+        write_cursor.close()
+
+    return converted, failed
+
+def shrink_column(connection):
+    """Réduire la colonne à BLOB une fois toutes les lignes binaires"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("ALTER TABLE face_encodings MODIFY face_encoding BLOB NOT NULL")
+        connection.commit()
+    finally:
+        cursor.close()
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dtype', choices=['float32', 'float64'],
+                        default=os.getenv('ENCODING_STORAGE_DTYPE', 'float32'),
+                        help="Type des composantes stockées")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="Nombre de lignes converties par transaction")
+    args = parser.parse_args()
+
+    print("🔄 Migration des encodages faciaux vers le format binaire")
+    print("=" * 50)
+
+    try:
+        connection = get_connection()
+    except Exception as e:
+        print(f"❌ Erreur de connexion à MySQL: {e}")
+        return 1
+
+    try:
+        convert_column_to_blob(connection)
+        converted, failed = migrate_rows(connection, args.dtype, args.batch_size)
+        if not failed:
+            shrink_column(connection)
+    except Exception as e:
+        print(f"❌ Erreur lors de la migration: {e}")
+        return 1
+    finally:
+        connection.close()
+
+    print(f"\n✅ {converted} encodages convertis en {args.dtype}")
+    if failed:
+        print(f"⚠️ {failed} lignes non converties, colonne laissée en LONGBLOB")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
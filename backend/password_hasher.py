@@ -0,0 +1,83 @@
+"""
+Hachage bcrypt hors du thread de la requête
+
+bcrypt libère le GIL pendant le calcul : un pool de threads suffit pour que
+le hachage d'un mot de passe s'exécute pendant l'encodage du visage de la
+même requête. La file est bornée comme celle du moteur d'encodage.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from encoding_engine import EngineBusyError
+
+logger = logging.getLogger(__name__)
+
+
+def hash_cost(password_hash):
+    """Facteur de coût d'un hachage bcrypt ($2b$12$...), None s'il est illisible"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Hachage et vérification bcrypt dans un pool de threads borné"""
+
+    def __init__(self, rounds=12, workers=2, max_pending=None, retry_after=1):
+        self.rounds = rounds
+        self.workers = max(1, workers)
+        self.max_pending = max_pending or 4 * self.workers
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def pending(self):
+        """Hachages en cours ou en file"""
+        return self._pending
+
+    def hash(self, password):
+        """Hacher un mot de passe au coût configuré (sur le thread courant)"""
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def verify(self, password, password_hash):
+        """Vérifier un mot de passe (sur le thread courant)"""
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        """Le hachage a été calculé avec un autre coût que celui configuré"""
+        return hash_cost(password_hash) != self.rounds
+
+    def _release_slot(self):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args):
+        """Exécuter `fn(*args)` dans le pool ; EngineBusyError si la file est pleine"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise EngineBusyError(self.retry_after)
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._release_slot()
+            raise
+        future.add_done_callback(lambda _: self._release_slot())
+        return future
+
+    def hash_async(self, password):
+        """Future du hachage d'un mot de passe"""
+        return self.submit(self.hash, password)
+
+    def verify_async(self, password, password_hash):
+        """Future de la vérification d'un mot de passe"""
+        return self.submit(self.verify, password, password_hash)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,376 @@
+"""
+Index de la galerie réparti entre des processus locaux (recherche scatter-gather)
+
+La galerie est découpée en `shards` partitions, chacune tenue par un
+processus qui la recherche exhaustivement (ExactIndex). Une requête est
+envoyée à tous les processus, qui calculent leurs k plus proches voisins en
+parallèle ; le coordinateur fusionne ces résultats.
+
+Les vecteurs ne transitent pas par les tubes : le contenu complet est écrit
+dans un segment au format fichier de galerie, que chaque processus projette
+en mémoire (np.memmap) pour n'en lire que ses lignes. Les pages du segment
+sont partagées par tous les processus via le cache du système. Les ajouts et
+retraits suivants sont envoyés aux processus et conservés dans un journal :
+un processus relancé (après un fork ou une interruption) rejoue segment et
+journal.
+
+Les nouveaux encodages vont au processus le moins chargé ; quand les
+retraits déséquilibrent les partitions ou que le journal devient long, un
+nouveau segment est écrit et réparti à parts égales.
+"""
+
+import atexit
+import itertools
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from face_index import ENCODING_DIM, ExactIndex, _as_matrix, _top_k
+from gallery_file import HEADER_SIZE, open_gallery, read_header, write_gallery
+
+logger = logging.getLogger(__name__)
+
+
+class ShardError(Exception):
+    """Un processus de partition a échoué ou ne répond plus"""
+
+
+def _shard_main(conn, dim, parent_pid):
+    """Boucle d'un processus de partition : opérations reçues dans l'ordre, une réponse chacune"""
+    index = ExactIndex(dim=dim)
+    while True:
+        try:
+            # Un processus créé par fork hérite des tubes de ses voisins : la fin du
+            # parent ne ferme donc pas toujours le tube, elle est détectée ici
+            if not conn.poll(1.0):
+                if os.getppid() != parent_pid:
+                    break
+                continue
+            request_id, op, args = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            if op == 'load':
+                path, start, stop = args
+                if path is None:
+                    index.reset(np.empty(0, dtype=np.int64), np.empty((0, dim), dtype=np.float32))
+                else:
+                    gallery = open_gallery(path)
+                    index.reset(gallery.ids[start:stop], gallery.encodings[start:stop])
+                result = len(index)
+            elif op == 'add':
+                index.add(*args)
+                result = len(index)
+            elif op == 'remove':
+                index.remove(args)
+                result = len(index)
+            elif op == 'search':
+                result = index.search(*args)
+            elif op == 'stop':
+                conn.send((request_id, True, None))
+                break
+            else:
+                raise ValueError(f"Opération inconnue: {op}")
+        except Exception as e:
+            conn.send((request_id, False, f"{type(e).__name__}: {e}"))
+        else:
+            conn.send((request_id, True, result))
+    conn.close()
+
+
+class _Shard:
+    """Processus de partition, son tube et les réponses attendues"""
+
+    def __init__(self, context, dim):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_shard_main, args=(child_conn, dim, os.getpid()), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.broken = False
+        self._waiting = {}
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, name='gallery-shard-reader', daemon=True)
+        self._reader.start()
+
+    def send(self, request_id, op, args):
+        """Envoyer une opération ; à appeler sous le verrou d'envoi du coordinateur"""
+        future = Future()
+        with self._lock:
+            if self.broken:
+                raise ShardError(f"Processus de partition {self.process.pid} interrompu")
+            self._waiting[request_id] = future
+        self.conn.send((request_id, op, args))
+        return future
+
+    def _read(self):
+        while True:
+            try:
+                request_id, ok, result = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._waiting.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(ShardError(result))
+        # Processus terminé : les opérations en attente ne recevront pas de réponse
+        with self._lock:
+            self.broken = True
+            waiting, self._waiting = self._waiting, {}
+        for future in waiting.values():
+            future.set_exception(ShardError(f"Processus de partition {self.process.pid} interrompu"))
+
+    def close(self, timeout=5.0):
+        try:
+            self.conn.send((-1, 'stop', None))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class ShardedIndex:
+    """Index réparti : même interface qu'ExactIndex, recherche parallèle dans `shards` processus"""
+
+    kind = 'sharded'
+    # Rééquilibrage : écart entre partitions (part de la taille moyenne et nombre de lignes)
+    max_imbalance = 0.2
+    min_rebalance_rows = 256
+    # Lignes ajoutées au journal avant réécriture du segment
+    max_log_rows = 65536
+
+    def __init__(self, dim=ENCODING_DIM, shards=None, directory=None, timeout=10.0, start_method=None):
+        self.dim = dim
+        self.shards = max(1, shards or os.cpu_count() or 1)
+        self.directory = directory or tempfile.gettempdir()
+        self.timeout = timeout
+        self.rebalances = 0
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context(start_method or ('fork' if 'fork' in methods else 'spawn'))
+        # Écritures (y compris un rééquilibrage) sérialisées entre elles
+        self._write_lock = threading.RLock()
+        # Une opération est envoyée à toutes ses partitions sous ce verrou : chaque
+        # processus reçoit ajouts, retraits et recherches dans le même ordre
+        self._send_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._pid = None
+        self._workers = []
+        self._segment = None
+        self._segment_path = None
+        # (pid, chemin) du dernier segment écrit : seul le processus qui l'a écrit le supprime
+        self._owned_segment = None
+        self._generation = 0
+        self._bounds = [(0, 0)] * self.shards
+        self._log = []
+        self._log_rows = 0
+        self._sizes = [0] * self.shards
+        self.reset(np.empty(0, dtype=np.int64), np.empty((0, dim), dtype=np.float32))
+        atexit.register(self.stop)
+
+    def __len__(self):
+        return sum(self._sizes)
+
+    # --- Segment et journal (état du coordinateur) ---
+
+    def _write_segment(self, ids, vectors):
+        """Écrire le segment de `vectors` ; None pour un contenu vide
+
+        Un fichier de galerie projeté en entier (GALLERY_FILE) est repris par un
+        lien physique : pas de copie, et le segment survit au remplacement du fichier.
+        """
+        if not len(ids):
+            return None
+        self._generation += 1
+        path = os.path.join(self.directory, f"face-shards-{os.getpid()}-{id(self)}-{self._generation}.fgal")
+        filename = getattr(vectors, 'filename', None)
+        if filename and getattr(vectors, 'offset', None) == HEADER_SIZE and read_header(filename)[1] == len(vectors):
+            try:
+                if np.array_equal(open_gallery(filename).ids, ids):
+                    os.link(filename, path)
+                    return path
+            except OSError:
+                pass
+        write_gallery(path, vectors, ids=ids)
+        return path
+
+    def _remove_owned_segment(self):
+        if self._owned_segment and self._owned_segment[0] == os.getpid():
+            try:
+                # Les processus qui l'ont projeté gardent leur vue jusqu'au prochain chargement
+                os.remove(self._owned_segment[1])
+            except OSError:
+                pass
+        self._owned_segment = None
+
+    def reset(self, ids, vectors):
+        """Remplacer tout le contenu : nouveau segment réparti à parts égales entre les processus"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if not isinstance(vectors, np.memmap):
+            vectors = _as_matrix(vectors, self.dim)
+        with self._write_lock:
+            path = self._write_segment(ids, vectors)
+            self._remove_owned_segment()
+            edges = np.linspace(0, len(ids), self.shards + 1).astype(np.int64)
+            self._segment = open_gallery(path) if path else None
+            self._segment_path = path
+            self._owned_segment = (os.getpid(), path) if path else None
+            self._bounds = list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+            self._sizes = [stop - start for start, stop in self._bounds]
+            self._log = []
+            self._log_rows = 0
+            if self._workers and self._pid == os.getpid():
+                self._broadcast([('load', (path, start, stop)) for start, stop in self._bounds])
+
+    def vectors(self):
+        """Copie des identifiants et vecteurs indexés (segment et journal, sans interroger les processus)"""
+        with self._write_lock:
+            if self._segment is None:
+                ids, vectors = np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32)
+            else:
+                ids = np.array(self._segment.ids, dtype=np.int64)
+                vectors = np.array(self._segment.encodings, dtype=np.float32)
+            for op, shard, args in self._log:
+                if op == 'add':
+                    ids = np.concatenate([ids, args[0]])
+                    vectors = np.concatenate([vectors, args[1]])
+                else:
+                    keep = ~np.isin(ids, args)
+                    ids, vectors = ids[keep], vectors[keep]
+        return ids, vectors
+
+    # --- Processus de partition ---
+
+    def start(self):
+        """Démarrer les processus de partition de ce processus (relancés après un fork)"""
+        with self._write_lock:
+            if self._workers and self._pid == os.getpid() and not any(worker.broken for worker in self._workers):
+                return
+            if self._pid == os.getpid():
+                for worker in self._workers:
+                    worker.close()
+            # Après un fork, les processus hérités appartiennent au parent : ils ne sont pas arrêtés ici
+            self._workers = [_Shard(self._context, self.dim) for _ in range(self.shards)]
+            self._pid = os.getpid()
+            self._broadcast([('load', (self._segment_path, start, stop)) for start, stop in self._bounds])
+            for op, shard, args in self._log:
+                if op == 'add':
+                    self._sizes[shard] = self._call(shard, 'add', args)
+                else:
+                    self._broadcast([('remove', args)] * self.shards)
+            logger.info(f"Galerie répartie en {self.shards} processus: {self._sizes}")
+
+    def stop(self):
+        """Arrêter les processus de partition et supprimer le segment écrit par ce processus"""
+        with self._write_lock:
+            if self._pid == os.getpid():
+                for worker in self._workers:
+                    worker.close()
+                self._remove_owned_segment()
+            self._workers = []
+            self._pid = None
+
+    def _ensure_started(self):
+        if not self._workers or self._pid != os.getpid() or any(worker.broken for worker in self._workers):
+            self.start()
+
+    def _send(self, messages):
+        """Envoyer des opérations (partition, op, args) sous un même verrou ; renvoie leurs futures"""
+        with self._send_lock:
+            request_id = next(self._request_ids)
+            return [self._workers[shard].send(request_id, op, args) for shard, op, args in messages]
+
+    def _wait(self, futures):
+        try:
+            return [future.result(timeout=self.timeout) for future in futures]
+        except FutureTimeoutError:
+            raise ShardError("Délai de réponse d'un processus de partition dépassé")
+
+    def _broadcast(self, operations):
+        """Une opération par partition ; met à jour la taille de chacune"""
+        results = self._wait(self._send([(shard, op, args) for shard, (op, args) in enumerate(operations)]))
+        self._sizes = list(results)
+
+    def _call(self, shard, op, args):
+        return self._wait(self._send([(shard, op, args)]))[0]
+
+    # --- Interface d'index ---
+
+    def add(self, ids, vectors):
+        """Ajouter des vecteurs au processus le moins chargé"""
+        vectors = _as_matrix(vectors, self.dim)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        with self._write_lock:
+            self._ensure_started()
+            shard = int(np.argmin(self._sizes))
+            self._sizes[shard] = self._call(shard, 'add', (ids, vectors))
+            self._log.append(('add', shard, (ids, vectors)))
+            self._log_rows += len(ids)
+            self._maybe_rebalance()
+
+    def remove(self, ids):
+        """Retirer tous les vecteurs portant ces identifiants (dans toutes les partitions)"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        with self._write_lock:
+            self._ensure_started()
+            self._broadcast([('remove', ids)] * self.shards)
+            self._log.append(('remove', None, ids))
+            self._maybe_rebalance()
+
+    def _maybe_rebalance(self):
+        spread = max(self._sizes) - min(self._sizes)
+        mean = len(self) / self.shards
+        if self._log_rows > self.max_log_rows or (
+                spread > self.min_rebalance_rows and spread > self.max_imbalance * mean):
+            self.rebalance()
+
+    def rebalance(self):
+        """Réécrire le segment avec le contenu courant et le répartir à parts égales"""
+        with self._write_lock:
+            before = list(self._sizes)
+            self.reset(*self.vectors())
+            self.rebalances += 1
+            logger.info(f"Galerie rééquilibrée: {before} -> {self._sizes}")
+
+    def search(self, query, k=1):
+        """Les k plus proches voisins : requête envoyée à toutes les partitions, résultats fusionnés"""
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        if self._pid != os.getpid() or not self._workers:
+            self._ensure_started()
+        try:
+            results = self._wait(self._send([(shard, 'search', (query, k)) for shard in range(self.shards)]))
+        except ShardError:
+            # Processus interrompu : partitions relancées depuis le segment et le journal, une seule reprise
+            logger.warning("Recherche répartie en échec, redémarrage des processus de partition")
+            self.start()
+            results = self._wait(self._send([(shard, 'search', (query, k)) for shard in range(self.shards)]))
+
+        distances = np.concatenate([distances for distances, _ in results])
+        ids = np.concatenate([ids for _, ids in results])
+        if not len(ids):
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        return _top_k(distances, ids, k)
+
+    def memory_bytes(self):
+        """Mémoire propre au coordinateur (journal) ; les partitions projettent le segment"""
+        return sum(args[1].nbytes + args[0].nbytes for op, _, args in self._log if op == 'add')
+
+    def status(self):
+        """État pour /api/health"""
+        return {
+            'shards': self.shards,
+            'sizes': list(self._sizes),
+            'running': sum(1 for worker in self._workers if not worker.broken) if self._pid == os.getpid() else 0,
+            'log_rows': self._log_rows,
+            'rebalances': self.rebalances,
+        }
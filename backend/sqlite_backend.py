@@ -0,0 +1,121 @@
+"""
+Backend SQLite compatible avec l'interface mysql.connector utilisée par l'application
+
+Permet de faire tourner le serveur, le pool de connexions et les benchmarks
+sans serveur MySQL.
+"""
+
+import sqlite3
+import uuid
+
+Error = sqlite3.Error
+IntegrityError = sqlite3.IntegrityError
+
+
+def _translate(sql):
+    """Convertir les paramètres de style MySQL (%s) en style SQLite (?)"""
+    return sql.replace('%s', '?')
+
+
+class SQLiteCursor:
+    """Curseur exposant `dictionary=True` et `lastrowid` comme mysql.connector"""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(_translate(sql), params)
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(_translate(sql), seq_of_params)
+
+    def _convert(self, row):
+        if row is None or not self._dictionary:
+            return row
+        columns = [column[0] for column in self._cursor.description]
+        return dict(zip(columns, row))
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """Connexion SQLite avec l'API minimale de mysql.connector"""
+
+    def __init__(self, path):
+        uri = path.startswith('file:')
+        self._connection = sqlite3.connect(path, uri=uri, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        if not uri:
+            self._connection.execute("PRAGMA journal_mode = WAL")
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self._connection.cursor(), dictionary)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def is_connected(self):
+        try:
+            self._connection.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self._connection.close()
+
+
+def sqlite_connector(path):
+    """Fabrique de connexions pour le pool ; ':memory:' donne une base partagée entre connexions"""
+    if path == ':memory:':
+        path = f"file:face_db_{uuid.uuid4().hex}?mode=memory&cache=shared"
+    return lambda: SQLiteConnection(path)
+
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username VARCHAR(50) UNIQUE NOT NULL,
+        email VARCHAR(100) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS face_encodings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        face_encoding BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS face_encoding_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
@@ -3,12 +3,16 @@
 Script de démarrage du serveur Flask
 """
 
+import argparse
 import os
+import signal
 import sys
 import subprocess
 import time
 from pathlib import Path
 
+BACKEND_DIR = Path(__file__).resolve().parent
+
 def check_dependencies():
     """Vérifier que toutes les dépendances sont installées"""
     required_packages = [
@@ -20,7 +24,9 @@ def check_dependencies():
         'numpy',
         'Pillow',
         'bcrypt',
-        'python-dotenv'
+        'python-dotenv',
+        'gunicorn',
+        'uvicorn'
     ]
     
     missing_packages = []
@@ -103,8 +109,64 @@ def create_database():
         print(f"❌ Erreur lors de la création de la base de données: {e}")
         return False
 
+def run_production():
+    """Remplacer ce processus par gunicorn (configuration dans gunicorn.conf.py)"""
+    print("🏭 Démarrage du serveur de production (gunicorn)...")
+    print("=" * 50)
+    os.chdir(BACKEND_DIR)
+    os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'])
+
+def run_async():
+    """Remplacer ce processus par uvicorn (application ASGI, voir asgi.py)"""
+    print("⚡ Démarrage du serveur asynchrone (uvicorn)...")
+    print("=" * 50)
+    workers = int(os.getenv('SERVER_WORKERS', 2))
+    # Comme sous gunicorn : les cœurs sont répartis entre les moteurs d'encodage des workers
+    if not os.getenv('ENCODING_WORKERS'):
+        os.environ['ENCODING_WORKERS'] = str(max(1, (os.cpu_count() or 1) // workers))
+    command = [
+        sys.executable, '-m', 'uvicorn', 'asgi:application',
+        '--host', os.getenv('HOST', '0.0.0.0'),
+        '--port', os.getenv('PORT', '5000'),
+        '--workers', str(workers),
+        '--timeout-keep-alive', os.getenv('SERVER_KEEPALIVE', '5'),
+        '--log-level', os.getenv('SERVER_LOG_LEVEL', 'info'),
+    ]
+    if os.getenv('ASYNC_MAX_CONNECTIONS'):
+        # Au-delà, uvicorn répond 503 sans lire la requête
+        command += ['--limit-concurrency', os.getenv('ASYNC_MAX_CONNECTIONS')]
+    os.chdir(BACKEND_DIR)
+    os.execvp(sys.executable, command)
+
+def reload_production():
+    """Recharger sans coupure le serveur gunicorn en cours (SIGHUP au processus maître)"""
+    from dotenv import load_dotenv
+    
+    load_dotenv(BACKEND_DIR / '.env')
+    pidfile = BACKEND_DIR / os.getenv('SERVER_PIDFILE', 'gunicorn.pid')
+    try:
+        pid = int(pidfile.read_text().strip())
+        os.kill(pid, signal.SIGHUP)
+    except (OSError, ValueError) as e:
+        print(f"❌ Impossible de recharger le serveur ({pidfile}): {e}")
+        return False
+    print(f"🔄 Rechargement demandé au processus maître {pid}")
+    return True
+
 def main():
     """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Démarrage du serveur de reconnaissance faciale")
+    parser.add_argument('--production', action='store_true',
+                        help="Serveur gunicorn (workers préchargés) au lieu du serveur de développement")
+    parser.add_argument('--async', dest='async_mode', action='store_true',
+                        help="Serveur asynchrone uvicorn (nombreux clients lents) au lieu du serveur de développement")
+    parser.add_argument('--reload', action='store_true',
+                        help="Recharger sans coupure le serveur gunicorn en cours")
+    args = parser.parse_args()
+    
+    if args.reload:
+        sys.exit(0 if reload_production() else 1)
+    
     print("🚀 Démarrage du serveur de reconnaissance faciale")
     print("=" * 50)
     
@@ -112,15 +174,27 @@ def main():
     if not check_dependencies():
         return
     
-    # Créer la base de données
-    if not create_database():
-        return
+    from dotenv import load_dotenv
+    load_dotenv()
     
-    # Vérifier la connexion MySQL
-    if not check_mysql_connection():
-        return
+    # Base MySQL : création et vérification (inutile avec DB_BACKEND=sqlite)
+    if os.getenv('DB_BACKEND', 'mysql').lower() == 'mysql':
+        if not create_database():
+            return
+        
+        if not check_mysql_connection():
+            return
     
     print("\n✅ Toutes les vérifications sont passées")
+    
+    server_mode = os.getenv('SERVER_MODE', '').lower()
+    if args.async_mode or server_mode == 'async':
+        run_async()
+        return
+    if args.production or server_mode == 'production':
+        run_production()
+        return
+    
     print("🌐 Démarrage du serveur Flask...")
     print("=" * 50)
     
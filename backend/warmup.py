@@ -0,0 +1,91 @@
+"""
+Préchauffage du serveur : étapes chronométrées et état de disponibilité
+
+Le processus répond (vivant) dès son démarrage, mais n'est prêt qu'une fois
+la base initialisée, la galerie chargée et les modèles dlib chargés dans le
+processus et dans chaque processus d'encodage. Un répartiteur de charge
+interroge /api/health/ready pour ne pas envoyer de trafic à un worker froid.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """Étapes de préchauffage (nom, durée) et passage à l'état prêt"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.ready_at = None
+        self.error = None
+        self._steps = []
+        self._ready = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @contextmanager
+    def step(self, name):
+        """Chronométrer une étape du préchauffage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._steps.append((name, time.perf_counter() - start))
+
+    def run(self, steps):
+        """Exécuter les étapes (nom, fonction) dans l'ordre puis marquer le serveur prêt"""
+        try:
+            for name, fn in steps:
+                with self.step(name):
+                    fn()
+        except Exception as e:
+            # Le serveur reste vivant mais jamais prêt : le répartiteur ne l'utilise pas
+            self.error = str(e)
+            logger.exception(f"Échec du préchauffage: {e}")
+            self._done.set()
+            return False
+        self.ready_at = time.monotonic()
+        self._ready.set()
+        self._done.set()
+        logger.info(f"Serveur prêt en {self.duration():.2f}s ("
+                    + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.steps()) + ")")
+        return True
+
+    def start(self, steps):
+        """Exécuter le préchauffage dans un thread : le serveur répond pendant ce temps"""
+        self._thread = threading.Thread(target=self.run, args=(steps,), name='warm-up', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def wait(self, timeout=None):
+        """Attendre la fin du préchauffage (réussi ou non) ; True si le serveur est prêt"""
+        self._done.wait(timeout)
+        return self.ready
+
+    def steps(self):
+        with self._lock:
+            return list(self._steps)
+
+    def duration(self):
+        """Durée du préchauffage (s), ou temps écoulé s'il n'est pas terminé"""
+        end = self.ready_at if self.ready_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def status(self):
+        """État pour /api/health"""
+        return {
+            'ready': self.ready,
+            'duration_s': round(self.duration(), 3),
+            'steps_ms': {name: round(seconds * 1000, 1) for name, seconds in self.steps()},
+            'error': self.error,
+        }
@@ -3,6 +3,9 @@ let loginStream = null;
 let registerStream = null;
 let capturedFaceData = null;
 const API_BASE_URL = 'http://localhost:5000/api';
+// Rafale de connexion : nombre d'images et intervalle entre deux captures (ms)
+const LOGIN_BURST_FRAMES = 3;
+const LOGIN_BURST_INTERVAL = 150;
 
 // Éléments DOM
 const elements = {
@@ -86,14 +89,34 @@ function stopAllCameras() {
     registerStream = null;
 }
 
-// Capture d'image depuis la vidéo
-function captureImage(videoElement, canvasElement) {
+// Capture d'image en Blob JPEG (envoyé en binaire, sans encodage base64)
+function captureImageBlob(videoElement, canvasElement) {
     const context = canvasElement.getContext('2d');
     canvasElement.width = videoElement.videoWidth;
     canvasElement.height = videoElement.videoHeight;
     context.drawImage(videoElement, 0, 0);
     
-    return canvasElement.toDataURL('image/jpeg', 0.8);
+    return new Promise((resolve, reject) => {
+        canvasElement.toBlob(blob => {
+            if (blob) {
+                resolve(blob);
+            } else {
+                reject(new Error('Impossible de capturer l\'image'));
+            }
+        }, 'image/jpeg', 0.8);
+    });
+}
+
+// Capture d'une rafale de Blobs JPEG à intervalle régulier
+async function captureBurst(videoElement, canvasElement, count, interval) {
+    const frames = [];
+    for (let i = 0; i < count; i++) {
+        if (i > 0) {
+            await new Promise(resolve => setTimeout(resolve, interval));
+        }
+        frames.push(await captureImageBlob(videoElement, canvasElement));
+    }
+    return frames;
 }
 
 // Affichage des messages de statut
@@ -139,12 +162,16 @@ function validateForm() {
 // API calls
 async function registerUser(userData) {
     try {
+        // multipart/form-data : le visage est transmis en fichier JPEG
+        const formData = new FormData();
+        formData.append('username', userData.username);
+        formData.append('email', userData.email);
+        formData.append('password', userData.password);
+        formData.append('face_data', userData.face_data, 'face.jpg');
+        
         const response = await fetch(`${API_BASE_URL}/register`, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify(userData)
+            body: formData
         });
         
         const data = await response.json();
@@ -160,14 +187,15 @@ async function registerUser(userData) {
     }
 }
 
-async function loginWithFace(faceData) {
+async function loginWithFaces(faceBlobs) {
     try {
+        // Rafale en multipart : le serveur s'arrête à la première image reconnue avec certitude
+        const formData = new FormData();
+        faceBlobs.forEach((blob, i) => formData.append('face_data', blob, `face${i}.jpg`));
+        
         const response = await fetch(`${API_BASE_URL}/login`, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ face_data: faceData })
+            body: formData
         });
         
         const data = await response.json();
@@ -203,8 +231,10 @@ document.addEventListener('DOMContentLoaded', function() {
         showLoadingStatus(elements.loginStatus, 'Reconnaissance en cours...');
         
         try {
-            const faceData = captureImage(elements.loginVideo, elements.loginCanvas);
-            const result = await loginWithFace(faceData);
+            const faceBlobs = await captureBurst(
+                elements.loginVideo, elements.loginCanvas, LOGIN_BURST_FRAMES, LOGIN_BURST_INTERVAL
+            );
+            const result = await loginWithFaces(faceBlobs);
             
             showStatus(elements.loginStatus, 'success', `Connexion réussie ! Bienvenue ${result.username}`);
             
@@ -232,10 +262,10 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
-    elements.captureFace.addEventListener('click', () => {
+    elements.captureFace.addEventListener('click', async () => {
         if (!registerStream) return;
         
-        capturedFaceData = captureImage(elements.registerVideo, elements.registerCanvas);
+        capturedFaceData = await captureImageBlob(elements.registerVideo, elements.registerCanvas);
         elements.registerBtn.disabled = false;
         
         showStatus(elements.registerStatus, 'success', 'Visage capturé avec succès ! Vous pouvez maintenant vous inscrire.');
@@ -53,12 +53,15 @@ python3 start_server.py &
 BACKEND_PID=$!
 cd ..
 
-# Attendre que le backend soit prêt
+# Attendre que le backend soit prêt (préchauffage des modèles terminé)
 echo "⏳ Attente du démarrage du backend..."
-sleep 5
+for i in $(seq 1 60); do
+    curl -sf http://localhost:5000/api/health/ready > /dev/null && break
+    sleep 1
+done
 
-# Vérifier si le backend est en cours d'exécution
-if ! curl -s http://localhost:5000/api/health > /dev/null; then
+# Vérifier si le backend est prêt
+if ! curl -sf http://localhost:5000/api/health/ready > /dev/null; then
     echo "❌ Le backend n'a pas démarré correctement"
     kill $BACKEND_PID 2>/dev/null
     exit 1
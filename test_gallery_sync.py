@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Test de convergence des galeries entre workers (journal face_encoding_changes)
+
+Plusieurs processus partagent une base SQLite, chacun avec sa galerie en
+mémoire et son GallerySync. Les inscriptions et ajouts d'échantillons faits
+par un worker doivent être trouvés par poll() sur tous les autres en moins de
+CONVERGENCE_TIMEOUT secondes. Code de sortie non nul en cas d'échec.
+
+    python3 test_gallery_sync.py
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+
+WORKERS = 3
+USERS = 12
+CONVERGENCE_TIMEOUT = 2.0
+
+
+def _worker(conn, db_path):
+    """Worker : exécute les écritures et recherches demandées par le processus principal"""
+    sys.path.insert(0, BACKEND_DIR)
+    from database import DatabaseManager
+    from encoding_codec import encode_encoding
+    from face_gallery import FaceGallery
+    from gallery_sync import GallerySync, record_changes
+
+    db_manager = DatabaseManager(backend='sqlite', sqlite_path=db_path)
+    gallery = FaceGallery()
+    # Pas de thread : poll() est appelé explicitement, comme après une écriture locale
+    gallery_sync = GallerySync(db_manager, gallery, interval=0)
+    conn.send('ready')
+
+    while True:
+        command = conn.recv()
+        if command is None:
+            break
+        action, args = command
+        if action == 'register':
+            username, encoding = args
+            with db_manager.cursor(commit=True) as cursor:
+                cursor.execute("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+                               (username, f'{username}@example.com', 'x'))
+                user_id = cursor.lastrowid
+                cursor.execute("INSERT INTO face_encodings (user_id, face_encoding) VALUES (%s, %s)",
+                               (user_id, encode_encoding(encoding)))
+                record_changes(cursor, [user_id])
+            gallery_sync.poll()
+            conn.send(user_id)
+        elif action == 'enroll':
+            user_id, encoding = args
+            with db_manager.cursor(commit=True) as cursor:
+                cursor.execute("INSERT INTO face_encodings (user_id, face_encoding) VALUES (%s, %s)",
+                               (user_id, encode_encoding(encoding)))
+                record_changes(cursor, [user_id])
+            gallery_sync.poll()
+            conn.send(gallery.samples(user_id))
+        elif action == 'find':
+            gallery_sync.poll()
+            match = gallery.best_match(args, tolerance=1e-3)
+            conn.send(None if match is None else (match[0], gallery.samples(match[0])))
+
+
+def wait_for(pipe, encoding, user_id, samples):
+    """Délai (s) avant que poll() sur ce worker trouve l'utilisateur avec ses échantillons, ou None"""
+    start = time.perf_counter()
+    while True:
+        pipe.send(('find', encoding))
+        if pipe.recv() == (user_id, samples):
+            return time.perf_counter() - start
+        if time.perf_counter() - start > CONVERGENCE_TIMEOUT:
+            return None
+        time.sleep(0.01)
+
+
+def check_convergence():
+    """Inscriptions et ajouts d'échantillons répartis entre les workers, vérifiés sur chacun des autres"""
+    import numpy as np
+
+    print(f"🔄 {WORKERS} workers, {USERS} utilisateurs, délai maximal {CONVERGENCE_TIMEOUT:.1f}s")
+    context = multiprocessing.get_context('spawn')
+    db_path = os.path.join(tempfile.mkdtemp(prefix='face-sync-test-'), 'sync.db')
+    pipes, processes = [], []
+    for _ in range(WORKERS):
+        parent, child = context.Pipe()
+        process = context.Process(target=_worker, args=(child, db_path), daemon=True)
+        process.start()
+        pipes.append(parent)
+        processes.append(process)
+
+    rng = np.random.default_rng(0)
+    failures = 0
+    delays = []
+    try:
+        for pipe in pipes:
+            pipe.recv()
+        for i in range(USERS):
+            writer = i % WORKERS
+            first, second = rng.normal(0, 0.1, (2, 128))
+            pipes[writer].send(('register', (f'sync{i}', first)))
+            user_id = pipes[writer].recv()
+            # Échantillon supplémentaire ajouté par un autre worker
+            enroller = (writer + 1) % WORKERS
+            pipes[enroller].send(('enroll', (user_id, second)))
+            if pipes[enroller].recv() != 2:
+                print(f"❌ sync{i}: échantillon non appliqué par le worker {enroller}")
+                failures += 1
+            for reader, pipe in enumerate(pipes):
+                for encoding in (first, second):
+                    delay = wait_for(pipe, encoding, user_id, 2)
+                    if delay is None:
+                        print(f"❌ sync{i} introuvable sur le worker {reader} après {CONVERGENCE_TIMEOUT:.1f}s")
+                        failures += 1
+                    else:
+                        delays.append(delay)
+            if failures:
+                break
+    finally:
+        for pipe in pipes:
+            pipe.send(None)
+        for process in processes:
+            process.join(timeout=10)
+
+    if failures:
+        print(f"❌ {failures} échec(s) de convergence")
+        return False
+    print(f"✅ Galeries convergées ({len(delays)} vérifications, délai max {max(delays) * 1000:.1f} ms)")
+    return True
+
+
+def main():
+    return check_convergence()
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -1,31 +1,119 @@
+import argparse
+import hashlib
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
 import face_recognition
 import cv2
-import pickle
+import numpy as np
+
+# Format de galerie partagé avec le backend
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from gallery_file import write_gallery
 
 #importation des images du superadmin
 folderPath='Images'
-pathList=os.listdir(folderPath)
-imgList = []
-superAdminIds=[]
-for path in pathList:
-    imgList.append(cv2.imread(os.path.join(folderPath, path)))
-    superAdminIds.append(os.path.splitext(path)[0])
-
-def findEncodings(imgList):
-    encodeList = []
-    for img in imgList:
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        encode=face_recognition.face_encodings(img)[0]
-        encodeList.append(encode)
-    return encodeList
-
-print("encode start....")
-encodeListKnown = findEncodings(imgList)
-encodeListKnownWithIds=[encodeListKnown,superAdminIds]
-print("encode end....")
-
-file=open("EncodeFile.p",'wb')
-pickle.dump(encodeListKnownWithIds,file)
-file.close()
-print("file saved")
\ No newline at end of file
+encodeFilePath='EncodeFile.fgal'
+# Cache des encodages indexé par empreinte du contenu des images
+cacheFilePath='EncodeCache.npz'
+imageExtensions=('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+
+def fileHash(path):
+    """Empreinte du contenu d'une image (un fichier renommé garde son encodage)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def loadCache(path):
+    """Encodages et images ignorées déjà calculés : {empreinte: encodage ou raison}"""
+    if not os.path.exists(path):
+        return {}, {}
+    with np.load(path, allow_pickle=False) as data:
+        encodings = dict(zip(data['hashes'].tolist(), data['encodings']))
+        skipped = dict(zip(data['skippedHashes'].tolist(), data['skippedReasons'].tolist()))
+    return encodings, skipped
+
+
+def saveCache(path, encodings, skipped):
+    hashes = sorted(encodings)
+    skippedHashes = sorted(skipped)
+    np.savez(
+        path,
+        hashes=np.array(hashes, dtype='U32'),
+        encodings=np.array([encodings[h] for h in hashes], dtype=np.float64).reshape(-1, 128),
+        skippedHashes=np.array(skippedHashes, dtype='U32'),
+        skippedReasons=np.array([skipped[h] for h in skippedHashes], dtype=str),
+    )
+
+
+def encodeImage(path):
+    """Encoder le visage d'une image ; renvoie (encodage, None) ou (None, raison)"""
+    img = cv2.imread(path)
+    if img is None:
+        return None, "image illisible"
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    encodes = face_recognition.face_encodings(img)
+    if not encodes:
+        return None, "aucun visage détecté"
+    return encodes[0], None
+
+
+def findEncodings(paths, workers):
+    """Encoder les images en parallèle dans un pool de processus"""
+    if not paths:
+        return []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(encodeImage, paths, chunksize=4))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génération incrémentale du fichier d'encodages")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--full', action='store_true', help="Ignorer le cache et tout ré-encoder")
+    args = parser.parse_args()
+
+    pathList = sorted(path for path in os.listdir(folderPath) if path.lower().endswith(imageExtensions))
+    hashes = {path: fileHash(os.path.join(folderPath, path)) for path in pathList}
+
+    cachedEncodings, cachedSkipped = ({}, {}) if args.full else loadCache(cacheFilePath)
+    toEncode = sorted({h for h in hashes.values() if h not in cachedEncodings and h not in cachedSkipped})
+    # Une image par empreinte suffit (les doublons partagent l'encodage)
+    pathByHash = {h: path for path, h in reversed(list(hashes.items()))}
+
+    print("encode start....")
+    print(f"{len(pathList)} images, {len(pathList) - len(toEncode)} en cache, {len(toEncode)} à encoder")
+    results = findEncodings([os.path.join(folderPath, pathByHash[h]) for h in toEncode], args.workers)
+
+    # Les entrées des images supprimées disparaissent du cache
+    current = set(hashes.values())
+    encodings = {h: e for h, e in cachedEncodings.items() if h in current}
+    skipped = {h: r for h, r in cachedSkipped.items() if h in current}
+    for h, (encode, reason) in zip(toEncode, results):
+        if encode is None:
+            skipped[h] = reason
+        else:
+            encodings[h] = encode
+
+    encodeListKnown = []
+    superAdminIds = []
+    for path in pathList:
+        h = hashes[path]
+        if h in skipped:
+            print(f"image ignorée: {path} ({skipped[h]})")
+            continue
+        encodeListKnown.append(encodings[h])
+        superAdminIds.append(os.path.splitext(path)[0])
+    print(f"encode end.... {len(encodeListKnown)} encodages, {len(pathList) - len(encodeListKnown)} images ignorées")
+
+    write_gallery(encodeFilePath, np.array(encodeListKnown).reshape(-1, 128), labels=superAdminIds)
+    saveCache(cacheFilePath, encodings, skipped)
+    print("file saved")
+
+
+if __name__ == '__main__':
+    main()
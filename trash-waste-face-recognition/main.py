@@ -1,16 +1,41 @@
+import argparse
+import itertools
 import os
-import pickle
+import sys
+import time
 
 import cv2
 import cvzone
 import face_recognition
 import numpy as np
 
-cap=cv2.VideoCapture(0)
-cap.set(3,620)
-cap.set(4,493)
-
-imgBackground = cv2.imread('Resources/Background2.png')
+from motion import MotionDetector, DetectionScheduler
+from pipeline import FrameGrabber, RecognitionWorker, FpsCounter
+from tracker import FaceTracker
+
+# Index de recherche partagé avec le backend
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from face_index import create_index
+from gallery_file import open_gallery
+
+# Distance maximale pour reconnaître un visage (défaut de face_recognition.compare_faces)
+tolerance = 0.6
+
+parser = argparse.ArgumentParser(description="Borne de reconnaissance faciale")
+parser.add_argument('--source', default='0', help="Index de la caméra ou chemin d'une vidéo/image")
+parser.add_argument('--loop', action='store_true', help="Relire la vidéo en boucle")
+parser.add_argument('--headless', action='store_true', help="Sans fenêtre d'affichage")
+parser.add_argument('--duration', type=float, default=0, help="Arrêt après N secondes (0 = illimité)")
+parser.add_argument('--reencode-every', type=int, default=30, help="Ré-encoder un visage reconnu toutes les N images traitées")
+parser.add_argument('--stats-interval', type=float, default=5, help="Affichage des FPS par étape (s)")
+parser.add_argument('--timings', action='store_true', help="Afficher la durée de chaque étape pour chaque image traitée")
+parser.add_argument('--no-motion-gating', action='store_true', help="Détecter les visages sur chaque image, même si la scène est immobile")
+parser.add_argument('--motion-threshold', type=float, default=0.005, help="Part minimale de pixels modifiés pour considérer qu'il y a du mouvement")
+parser.add_argument('--idle-interval', type=float, default=2.0, help="Détection de contrôle d'une scène immobile et sans visage toutes les N secondes")
+args = parser.parse_args()
+source = int(args.source) if args.source.isdigit() else args.source
+
+imgBackground = cv2.imread('Resources/background2.png')
 
 #importation des images modes dans une liste
 folderModePath='Resources/Modes'
@@ -23,46 +48,149 @@ for path in modelPathList:
 
 #lancer le fichier encoder
 print("chargement du fichier encoder...")
-file=open("EncodeFile.p",'rb')
-encodeListKnownWithIds=pickle.load(file)
-file.close()
-encodeListKnown,superAdminIds=encodeListKnownWithIds
+# Projection mémoire : pas de désérialisation, pages partagées entre processus
+if not os.path.exists('EncodeFile.fgal'):
+    sys.exit("EncodeFile.fgal introuvable : lancez EncodeGeneretor.py ou convertissez EncodeFile.p "
+             "avec ../backend/gallery_file.py convert EncodeFile.p EncodeFile.fgal")
+knownGallery=open_gallery('EncodeFile.fgal')
+encodeListKnown,superAdminIds=knownGallery.encodings,knownGallery.labels
 print("fichier encoder charger")
 
+# Index des encodages connus : exact par défaut, IVF approximatif pour les grandes galeries
+indexKind = os.getenv('FACE_INDEX', 'exact')
+knownIndex = create_index(indexKind)
+knownIndex.reset(np.arange(len(encodeListKnown)), encodeListKnown)
+if indexKind == 'ivf' and len(encodeListKnown) >= 1000:
+    knownIndex.train()
 
-while True:
-    success, img = cap.read()
-    imgS=cv2.resize(img,(0,0),None,0.25,0.25)
-    imgS=cv2.cvtColor(imgS, cv2.COLOR_BGR2RGB)
+# Suivi des visages : l'identité d'une piste est conservée entre deux encodages
+faceTracker = FaceTracker(reencode_every=args.reencode_every)
 
-    imgS = cv2.resize(img, (0, 0), None, 0.25, 0.25)
-    imgS = cv2.cvtColor(imgS, cv2.COLOR_BGR2RGB)
+# Détection de visages seulement si la scène a changé, à une cadence qui dépend de la présence de visages
+motionDetector = MotionDetector(area_threshold=args.motion_threshold)
+detectionScheduler = DetectionScheduler(idle_interval=args.idle_interval)
 
-    faceCurFrame=face_recognition.face_locations(imgS)
-    encodeCurFrame=face_recognition.face_encodings(imgS,faceCurFrame)
 
-    imgBackground[178:178 + 493, 62:62 + 620] = cv2.resize(img, (620, 493))
+# Numéro des images traitées (affichage --timings)
+timedFrames = itertools.count(1)
+
 
-    # Testez différentes positions
-    mode_img = cv2.resize(imgModeList[1], (451, 512))  # Redimensionner aux dimensions exactes
-    imgBackground[158:158 + 512, 781:781 + 451] = mode_img
+def stage(timings, name, start):
+    """Noter la durée d'une étape (ms) et renvoyer l'instant de fin"""
+    now = time.perf_counter()
+    timings.append((name, (now - start) * 1000))
+    return now
 
 
-    for encodeFace,faceLoc in zip(encodeCurFrame,faceCurFrame):
-        matches=face_recognition.compare_faces(encodeListKnown,encodeFace)
-        faceDis=face_recognition.face_distance(encodeListKnown,encodeFace)
-        print("matches:",matches)
-        print("faceDis:",faceDis)
+def recognize(img):
+    """Détecter, encoder et identifier les visages d'une image (thread de reconnaissance)"""
+    timings = []
+    start = time.perf_counter()
+    imgS = cv2.resize(img, (0, 0), None, 0.25, 0.25)
+    start = stage(timings, 'resize', start)
 
-        matchIndex=np.argmin(faceDis)
+    # Image ignorée (None) si rien n'a bougé : les résultats précédents restent affichés
+    gray = motionDetector.prepare(imgS)
+    motion = motionDetector.changed(gray)
+    start = stage(timings, 'motion', start)
+    if not detectionScheduler.should_detect(motion) and not args.no_motion_gating:
+        return None
+    detectStart = start
 
-        if matches[matchIndex]:
-            y1, x2, y2, x1 = faceLoc
+    imgS = cv2.cvtColor(imgS, cv2.COLOR_BGR2RGB)
+    faceCurFrame=face_recognition.face_locations(imgS)
+    start = stage(timings, 'face_locations', start)
+    motionDetector.set_reference(gray)
+    detectionScheduler.record(len(faceCurFrame), start - detectStart)
+    tracks=faceTracker.update(faceCurFrame)
+    start = stage(timings, 'tracker', start)
+
+    # Encoder uniquement les pistes nouvelles, peu sûres ou à rafraîchir
+    toEncode=[track for track in tracks if faceTracker.needs_encoding(track)]
+    if toEncode:
+        encodeCurFrame=face_recognition.face_encodings(imgS,[track.box for track in toEncode])
+        start = stage(timings, 'face_encodings', start)
+        for track,encodeFace in zip(toEncode,encodeCurFrame):
+            faceDis,matchIndexes=knownIndex.search(encodeFace,k=1)
+            if len(faceDis) and faceDis[0]<=tolerance:
+                faceTracker.assign(track, superAdminIds[matchIndexes[0]], float(faceDis[0]))
+            else:
+                faceTracker.assign(track, None, float(faceDis[0]) if len(faceDis) else None)
+        stage(timings, 'search', start)
+
+    if args.timings:
+        print(f"image {next(timedFrames)}: " + " | ".join(f"{name} {ms:.1f} ms" for name, ms in timings)
+              + f" | {len(tracks)} visage(s), {len(toEncode)} encodé(s), mouvement {motionDetector.last_change:.1%}")
+
+    results = []
+    for track in tracks:
+        if track.identity is not None:
+            y1, x2, y2, x1 = track.box
             y1, x2, y2, x1 = y1 * 4, x2 * 4, y2 * 4, x1 * 4
-            bbox = 65 + x1, 180 + y1, x2 - x1, y2 - y1  # Changé de 62,178 à 65,180
-            imgBackground = cvzone.cornerRect(imgBackground, bbox, rt=0)
+            results.append(((y1, x2, y2, x1), track.identity, track.distance, track.id))
+    return results
+
 
+grabber = FrameGrabber(source, loop=args.loop)
+worker = RecognitionWorker(grabber, recognize)
+grabber.start()
+worker.start()
 
-    cv2.imshow("webcam", img)
-    cv2.imshow("imgBackground", imgBackground)
-    cv2.waitKey(1)
\ No newline at end of file
+renderFps = FpsCounter()
+startTime = time.monotonic()
+lastStats = startTime
+lastFrameId = 0
+lastResultsId = 0
+
+# Mode affiché avec l'image
+mode_img = cv2.resize(imgModeList[1], (451, 512))  # Redimensionner aux dimensions exactes
+
+while True:
+    frameId, img = grabber.wait_for_frame(lastFrameId, timeout=0.1)
+    if frameId == lastFrameId:
+        if grabber.finished:
+            break
+        continue
+    lastFrameId = frameId
+
+    # Rendu à la cadence de la caméra avec les derniers résultats disponibles
+    imgFrame = imgBackground.copy()
+    imgFrame[178:178 + 493, 62:62 + 620] = cv2.resize(img, (620, 493))
+    imgFrame[158:158 + 512, 781:781 + 451] = mode_img
+
+    # Les boîtes sont exprimées dans la résolution de la caméra
+    scaleX, scaleY = 620 / img.shape[1], 493 / img.shape[0]
+    resultsId, results = worker.latest_results()
+    for (y1, x2, y2, x1), superAdminId, distance, trackId in results:
+        if resultsId != lastResultsId:
+            print("piste:", trackId, "superAdminId:", superAdminId, "faceDis:", round(distance, 3))
+        bbox = 65 + int(x1 * scaleX), 180 + int(y1 * scaleY), int((x2 - x1) * scaleX), int((y2 - y1) * scaleY)  # Changé de 62,178 à 65,180
+        imgFrame = cvzone.cornerRect(imgFrame, bbox, rt=0)
+        cvzone.putTextRect(imgFrame, f"{superAdminId} #{trackId}", (bbox[0], max(35, bbox[1] - 10)), scale=1, thickness=1)
+    lastResultsId = resultsId
+    renderFps.tick()
+
+    if not args.headless:
+        cv2.imshow("webcam", img)
+        cv2.imshow("imgBackground", imgFrame)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    now = time.monotonic()
+    if now - lastStats >= args.stats_interval:
+        lastStats = now
+        print(f"capture: {grabber.fps.fps:.1f} fps | reconnaissance: {worker.fps.fps:.1f} fps "
+              f"({worker.last_duration * 1000:.0f} ms) | rendu: {renderFps.fps:.1f} fps | "
+              f"visages encodés: {faceTracker.encode_ratio:.0%} | images sans détection: {detectionScheduler.skip_ratio:.0%}")
+    if args.duration and now - startTime >= args.duration:
+        break
+
+grabber.stop()
+worker.stop()
+elapsed = time.monotonic() - startTime
+print(f"images capturées: {grabber.fps.count} | reconnues: {worker.fps.count} | rendues: {renderFps.count} en {elapsed:.1f}s")
+print(f"images sans détection: {detectionScheduler.frames - detectionScheduler.detections}/{detectionScheduler.frames} "
+      f"({detectionScheduler.skip_ratio:.0%}) | calcul évité: ~{detectionScheduler.saved_time:.1f}s | "
+      f"CPU du processus: {time.process_time() / elapsed:.0%} d'un cœur")
+if not args.headless:
+    cv2.destroyAllWindows()
@@ -0,0 +1,95 @@
+"""
+Détection de mouvement et cadence adaptative de la détection de visages
+"""
+
+import time
+
+import cv2
+
+
+class MotionDetector:
+    """Différence entre l'image courante et l'image de la dernière détection (niveaux de gris réduits)"""
+
+    def __init__(self, width=160, pixel_threshold=25, area_threshold=0.005):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.last_change = 0.0
+        self._reference = None
+
+    def prepare(self, img):
+        """Image réduite, en niveaux de gris et lissée (bruit du capteur atténué)"""
+        scale = self.width / img.shape[1]
+        small = cv2.resize(img, (0, 0), None, scale, scale, interpolation=cv2.INTER_AREA) if scale < 1 else img
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed(self, gray):
+        """La scène a-t-elle changé depuis la référence ? (toujours vrai sans référence)"""
+        if self._reference is None or self._reference.shape != gray.shape:
+            self.last_change = 1.0
+            return True
+        diff = cv2.absdiff(gray, self._reference)
+        self.last_change = cv2.countNonZero(cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1]) / diff.size
+        return self.last_change >= self.area_threshold
+
+    def set_reference(self, gray):
+        """Image à laquelle comparer les suivantes (celle de la dernière détection)"""
+        self._reference = gray
+
+
+class DetectionScheduler:
+    """Décide pour chaque image si la détection de visages doit tourner
+
+    Visages présents : détection à chaque mouvement, et au moins toutes les
+    `face_interval` secondes. Aucun visage : l'intervalle entre deux détections
+    sur mouvement double de `min_interval` jusqu'à `max_interval`, et une scène
+    immobile n'est revérifiée que toutes les `idle_interval` secondes.
+    """
+
+    def __init__(self, face_interval=0.5, min_interval=0.05, max_interval=0.5, idle_interval=2.0):
+        self.face_interval = face_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_interval = idle_interval
+        self.interval = min_interval
+        self.faces = 0
+        self._last_detection = None
+        # Statistiques : images examinées, détections lancées et leur durée cumulée
+        self.frames = 0
+        self.detections = 0
+        self.detection_time = 0.0
+
+    def should_detect(self, motion, now=None):
+        """Lancer la détection sur cette image ?"""
+        now = time.monotonic() if now is None else now
+        self.frames += 1
+        if self._last_detection is None:
+            return True
+        elapsed = now - self._last_detection
+        if self.faces:
+            return motion or elapsed >= self.face_interval
+        if motion:
+            return elapsed >= self.interval
+        return elapsed >= self.idle_interval
+
+    def record(self, faces, duration, now=None):
+        """Enregistrer le résultat d'une détection (nombre de visages, durée en s)"""
+        self._last_detection = time.monotonic() if now is None else now
+        self.detections += 1
+        self.detection_time += duration
+        self.faces = faces
+        # Le rythme remonte dès qu'un visage apparaît et ralentit tant que la scène reste vide
+        self.interval = self.min_interval if faces else min(self.interval * 2, self.max_interval)
+
+    @property
+    def skip_ratio(self):
+        """Part des images examinées sans détection"""
+        return 1 - self.detections / self.frames if self.frames else 0.0
+
+    @property
+    def saved_time(self):
+        """Temps de calcul évité (s), estimé à partir de la durée moyenne d'une détection"""
+        if not self.detections:
+            return 0.0
+        return (self.frames - self.detections) * self.detection_time / self.detections
@@ -0,0 +1,150 @@
+"""
+Pipeline de la borne : capture, reconnaissance et rendu sur des threads séparés
+"""
+
+import threading
+import time
+
+import cv2
+
+
+class FpsCounter:
+    """Cadence mesurée sur une fenêtre glissante"""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self._ticks = []
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def tick(self):
+        now = time.monotonic()
+        with self._lock:
+            self.count += 1
+            self._ticks.append(now)
+            while self._ticks and now - self._ticks[0] > self.window:
+                self._ticks.pop(0)
+
+    @property
+    def fps(self):
+        with self._lock:
+            if len(self._ticks) < 2:
+                return 0.0
+            elapsed = self._ticks[-1] - self._ticks[0]
+            return (len(self._ticks) - 1) / elapsed if elapsed > 0 else 0.0
+
+
+class FrameGrabber(threading.Thread):
+    """Lit la caméra (ou un fichier) en continu et ne garde que la dernière image"""
+
+    def __init__(self, source=0, width=620, height=493, loop=False, realtime=True):
+        super().__init__(daemon=True)
+        self.source = source
+        self.is_file = isinstance(source, str)
+        self.loop = loop
+        self.realtime = realtime
+        self.fps = FpsCounter()
+        self.finished = False
+        self._cap = cv2.VideoCapture(source)
+        if not self._cap.isOpened():
+            raise RuntimeError(f"Impossible d'ouvrir la source vidéo: {source}")
+        if not self.is_file:
+            self._cap.set(3, width)
+            self._cap.set(4, height)
+        self._frame = None
+        self._frame_id = 0
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+
+    def run(self):
+        # Un fichier est relu à sa cadence d'origine pour simuler une caméra
+        file_fps = self._cap.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+        frame_interval = 1.0 / file_fps if self.realtime and 0 < file_fps < 240 else 0.0
+        next_frame = time.monotonic()
+
+        while not self._stopped.is_set():
+            success, frame = self._cap.read()
+            if not success:
+                if self.is_file and self.loop:
+                    self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                break
+
+            with self._cond:
+                self._frame = frame
+                self._frame_id += 1
+                self._cond.notify_all()
+            self.fps.tick()
+
+            if frame_interval:
+                next_frame += frame_interval
+                delay = next_frame - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame = time.monotonic()
+
+        self._cap.release()
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+
+    def latest(self):
+        """Dernière image capturée : (numéro, image)"""
+        with self._cond:
+            return self._frame_id, self._frame
+
+    def wait_for_frame(self, after_id, timeout=0.5):
+        """Attendre une image plus récente que `after_id`"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._frame_id > after_id or self.finished, timeout)
+            return self._frame_id, self._frame
+
+    def stop(self):
+        self._stopped.set()
+
+
+class RecognitionWorker(threading.Thread):
+    """Traite toujours l'image la plus récente ; les images intermédiaires sont ignorées
+
+    `recognize` renvoie None pour une image qu'il a choisi de ne pas traiter
+    (scène inchangée) : les résultats précédents sont conservés.
+    """
+
+    def __init__(self, grabber, recognize):
+        super().__init__(daemon=True)
+        self.grabber = grabber
+        self.recognize = recognize
+        self.fps = FpsCounter()
+        self.last_duration = 0.0
+        self._results = (0, [])
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def run(self):
+        last_id = 0
+        while not self._stopped.is_set():
+            frame_id, frame = self.grabber.wait_for_frame(last_id)
+            if frame_id == last_id:
+                if self.grabber.finished:
+                    break
+                continue
+
+            start = time.monotonic()
+            results = self.recognize(frame)
+            last_id = frame_id
+            if results is None:
+                continue
+            self.last_duration = time.monotonic() - start
+
+            with self._lock:
+                self._results = (frame_id, results)
+            self.fps.tick()
+
+    def latest_results(self):
+        """Résultats de la dernière image traitée : (numéro d'image, résultats)"""
+        with self._lock:
+            return self._results
+
+    def stop(self):
+        self._stopped.set()
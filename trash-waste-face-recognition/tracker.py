@@ -0,0 +1,109 @@
+"""
+Suivi des visages d'une image à l'autre pour ne ré-encoder que lorsque c'est nécessaire
+"""
+
+import itertools
+
+
+def iou(boxA, boxB):
+    """Intersection sur union de deux boîtes (top, right, bottom, left)"""
+    topA, rightA, bottomA, leftA = boxA
+    topB, rightB, bottomB, leftB = boxB
+    interW = min(rightA, rightB) - max(leftA, leftB)
+    interH = min(bottomA, bottomB) - max(topA, topB)
+    if interW <= 0 or interH <= 0:
+        return 0.0
+    inter = interW * interH
+    areaA = (rightA - leftA) * (bottomA - topA)
+    areaB = (rightB - leftB) * (bottomB - topB)
+    return inter / float(areaA + areaB - inter)
+
+
+class Track:
+    """Un visage suivi : boîte courante et identité reconnue"""
+
+    __slots__ = ('id', 'box', 'identity', 'distance', 'frames_since_encode', 'missed')
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.identity = None
+        self.distance = None
+        self.frames_since_encode = None
+        self.missed = 0
+
+
+class FaceTracker:
+    """Association des boîtes détectées aux pistes existantes par IoU (appariement glouton)"""
+
+    def __init__(self, iou_threshold=0.3, max_missed=5, reencode_every=30, retry_every=5,
+                 confident_distance=0.5):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reencode_every = reencode_every
+        self.retry_every = retry_every
+        self.confident_distance = confident_distance
+        self.tracks = []
+        self._ids = itertools.count(1)
+        # Statistiques : visages vus et visages effectivement encodés
+        self.faces_seen = 0
+        self.faces_encoded = 0
+
+    def update(self, boxes):
+        """Mettre à jour les pistes avec les boîtes de l'image ; renvoie les pistes visibles, dans l'ordre des boîtes"""
+        pairs = sorted(
+            ((iou(track.box, box), t, b) for t, track in enumerate(self.tracks) for b, box in enumerate(boxes)),
+            reverse=True
+        )
+        matchedTracks, matchedBoxes = {}, {}
+        for overlap, t, b in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if t in matchedTracks or b in matchedBoxes:
+                continue
+            matchedTracks[t] = b
+            matchedBoxes[b] = t
+
+        visible = []
+        for b, box in enumerate(boxes):
+            if b in matchedBoxes:
+                track = self.tracks[matchedBoxes[b]]
+                track.box = box
+                track.missed = 0
+                if track.frames_since_encode is not None:
+                    track.frames_since_encode += 1
+            else:
+                track = Track(next(self._ids), box)
+            visible.append(track)
+
+        # Les pistes non revues sont conservées quelques images (occultation brève)
+        lost = []
+        for t, track in enumerate(self.tracks):
+            if t not in matchedTracks:
+                track.missed += 1
+                if track.missed <= self.max_missed:
+                    lost.append(track)
+        self.tracks = visible + lost
+        self.faces_seen += len(boxes)
+        return visible
+
+    def needs_encoding(self, track):
+        """Encoder une piste nouvelle, puis toutes les `retry_every` images si elle est peu sûre
+        ou inconnue, et toutes les `reencode_every` images si elle est reconnue avec confiance"""
+        if track.frames_since_encode is None:
+            return True
+        if track.identity is not None and track.distance <= self.confident_distance:
+            return track.frames_since_encode >= self.reencode_every
+        return track.frames_since_encode >= self.retry_every
+
+    def assign(self, track, identity, distance):
+        """Enregistrer le résultat de reconnaissance d'une piste"""
+        track.identity = identity
+        track.distance = distance
+        track.frames_since_encode = 0
+        self.faces_encoded += 1
+
+    @property
+    def encode_ratio(self):
+        """Part des visages vus qui ont nécessité un encodage"""
+        return self.faces_encoded / self.faces_seen if self.faces_seen else 0.0